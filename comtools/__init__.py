@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File  : __init__.py
+@Author: Chen Yanzhen
+@Date  : 2020/8/8 11:02
+@Desc  : modules imported on first use, so headless users of comtools do not pay
+    for OpenGL, glfw and PIL
+
+    gl = lazy_import('OpenGL.GL')
+    ...
+    gl.glClear(gl.GL_COLOR_BUFFER_BIT)    # OpenGL.GL is imported here
+"""
+
+import importlib
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    """
+    stands for a module until one of its attributes is needed
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            module = self.__dict__['_module'] = importlib.import_module(self.__name__)
+        return module
+
+    def __getattr__(self, item):
+        value = getattr(self._load(), item)
+        # later lookups of it skip __getattr__
+        self.__dict__[item] = value
+        return value
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        loaded = self.__dict__['_module'] is not None
+        return f'<lazy module {self.__name__!r}{"" if loaded else " (not loaded)"}>'
+
+
+_lazy_modules = {}
+
+
+def lazy_import(name):
+    """
+    :return: the module when it was imported already, else a LazyModule importing
+        it on first use, one per name
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    lazy = _lazy_modules.get(name)
+    if lazy is None:
+        lazy = _lazy_modules[name] = LazyModule(name)
+    return lazy
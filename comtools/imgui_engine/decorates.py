@@ -1,22 +1,171 @@
 from __future__ import absolute_import
-import sys
-import OpenGL.GL as gl
 import imgui
-from PIL import Image, ImageFile
-import numpy as np
-from contextlib import contextmanager
 from comtools.imgui_engine.gui_tools import *
-from functools import wraps
-from multiprocessing import Process
+from comtools.imgui_engine.glfw_init import keep_awake, wake_loops
+from concurrent.futures import BrokenExecutor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from collections import deque
+import itertools
+import logging
+import time
+
+
+def _timed_call(func, args, kwargs):
+    started = time.time()
+    result = func(*args, **kwargs)
+    return started, time.time(), result
+
+
+class Job:
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, jid, name, future):
+        self.id = jid
+        self.name = name
+        self.future = future
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.exception = None
+        future.add_done_callback(self._collect)
+
+    def _collect(self, future):
+        if future.cancelled():
+            self.finished = time.time()
+            return
+        e = future.exception()
+        if e is not None:
+            self.exception = e
+            self.finished = time.time()
+        else:
+            self.started, self.finished, self.result = future.result()
+
+    @property
+    def status(self):
+        f = self.future
+        if f.cancelled():
+            return self.CANCELLED
+        if f.done():
+            return self.FAILED if f.exception() is not None else self.DONE
+        if f.running():
+            if self.started is None:
+                self.started = time.time()
+            return self.RUNNING
+        return self.QUEUED
+
+    @property
+    def runtime(self):
+        if self.started is None:
+            return 0.
+        return (self.finished or time.time()) - self.started
+
+    def cancel(self) -> bool:
+        """
+        only queued jobs can be cancelled, a running worker is not interrupted
+        """
+        return self.future.cancel()
+
+
+class WorkerPool:
+    """
+    a fixed number of worker processes (or threads) shared by every FuncUI, so
+    process start up is paid once per worker and clicks only queue jobs. finished
+    jobs wake idle FrameLoops and running ones keep them drawing their runtime.
+    """
+
+    def __init__(self, workers=None, processes=True, history=100):
+        self.workers = workers
+        self.processes = processes
+        self.executor = self._make_executor()
+        self.rebuilds = 0
+        self.jobs = deque(maxlen=history)
+        self._ids = itertools.count(1)
+        self._broken = False
+        keep_awake(self.active)
+
+    def _make_executor(self):
+        if self.processes:
+            return ProcessPoolExecutor(self.workers)
+        return ThreadPoolExecutor(self.workers, thread_name_prefix='func-ui')
+
+    def _rebuild(self):
+        # a worker process died (segfault, os._exit), the executor refuses all work after that
+        logging.warning('worker pool is broken, starting new workers')
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = self._make_executor()
+        self.rebuilds += 1
+        self._broken = False
+
+    def _done(self, future):
+        if not future.cancelled() and isinstance(future.exception(), BrokenExecutor):
+            self._broken = True
+        wake_loops()
+
+    def submit(self, func, args=(), kwargs=None, name=None) -> Job:
+        """
+        never raises, a job that could not be queued is failed
+        """
+        if self._broken:
+            self._rebuild()
+        try:
+            try:
+                future = self.executor.submit(_timed_call, func, tuple(args), dict(kwargs or {}))
+            except BrokenExecutor:
+                self._rebuild()
+                future = self.executor.submit(_timed_call, func, tuple(args), dict(kwargs or {}))
+        except Exception as e:
+            future = Future()
+            future.set_exception(e)
+        future.add_done_callback(self._done)
+        job = Job(next(self._ids), name or getattr(func, '__name__', repr(func)), future)
+        self.jobs.append(job)
+        return job
+
+    def active(self) -> int:
+        return sum(1 for j in self.jobs if not j.future.done())
+
+    def shutdown(self, wait=False):
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_pool = None
+
+
+def worker_pool() -> WorkerPool:
+    global _pool
+    if _pool is None:
+        _pool = WorkerPool()
+    return _pool
+
+
+def set_worker_pool(pool: WorkerPool):
+    global _pool
+    if _pool is not None and _pool is not pool:
+        _pool.shutdown()
+    _pool = pool
+    return pool
 
 
 class FuncUI:
 
-    def __init__(self, window='functions', args=[], kwargs={}):
+    def __init__(self, window='functions', args=[], kwargs={}, pool: WorkerPool = None, history=5):
+        """
+        :param window: name of the window the button goes to
+        :param args: arguments the function is called with
+        :param kwargs:
+        :param pool: default the shared worker_pool()
+        :param history: jobs shown under the button
+        """
         self.window = window
         self.args = args
         self.kwargs = kwargs
-        self.processes = []
+        self.pool = pool
+        self.jobs = deque(maxlen=history)
         _fuis.append(self)
 
     def __call__(self, func):
@@ -27,9 +176,25 @@ class FuncUI:
         with MenuWindow(self.window) as succ:
             if succ:
                 if imgui.button(self.func.__name__):
-                    p = Process(target=self.func, args=self.args, kwargs=self.kwargs)
-                    self.processes.append(p)
-                    p.start()
+                    pool = self.pool or worker_pool()
+                    self.jobs.append(pool.submit(self.func, self.args, self.kwargs))
+                for job in reversed(self.jobs):
+                    self._render_job(job)
+
+    def _render_job(self, job: Job):
+        with id_scope(str(job.id)):
+            status = job.status
+            imgui.bullet_text(f'#{job.id} {status} {job.runtime:.2f}s')
+            if status == Job.QUEUED:
+                imgui.same_line()
+                if imgui.small_button('cancel'):
+                    job.cancel()
+            elif status == Job.DONE and job.result is not None:
+                imgui.same_line()
+                imgui.text(repr(job.result)[:80])
+            elif status == Job.FAILED:
+                imgui.same_line()
+                imgui.text_colored(repr(job.exception)[:80], 1, 0.3, 0.3)
 
 _fuis = []
 
@@ -1,9 +1,13 @@
-import glfw
-import OpenGL.GL as gl
-
+from comtools import lazy_import
 import imgui
-from imgui.integrations.glfw import GlfwRenderer
 from contextlib import contextmanager
+import threading
+import weakref
+import time
+
+# loaded when a window is opened, importing glfw needs its shared library
+glfw = lazy_import('glfw')
+gl = lazy_import('OpenGL.GL')
 
 
 def impl_glfw_init(width, height):
@@ -35,19 +39,153 @@ def impl_glfw_init(width, height):
 
 
 def glfw_imgui_init(width, height):
+    from imgui.integrations.glfw import GlfwRenderer
     imgui.create_context()
     window = impl_glfw_init(width, height)
     return GlfwRenderer(window), window
 
 
+_loops = weakref.WeakSet()
+_busy = []
+_loops_lock = threading.Lock()
+
+
+def wake_loops():
+    """
+    thread safe, request_redraw on every FrameLoop, for background work that does
+    not know the window showing its results
+    """
+    with _loops_lock:
+        loops = list(_loops)
+    for loop in loops:
+        loop.request_redraw()
+
+
+def keep_awake(busy):
+    """
+    while busy() is true, idle waits of every FrameLoop last at most its busy_timeout,
+    so progress of background work keeps being drawn. busy is held weakly when it
+    is a bound method.
+    """
+    ref = weakref.WeakMethod(busy) if hasattr(busy, '__self__') else lambda: busy
+    with _loops_lock:
+        _busy.append(ref)
+
+
+def _any_busy() -> bool:
+    with _loops_lock:
+        refs = list(_busy)
+    for ref in refs:
+        busy = ref()
+        if busy is None:
+            with _loops_lock:
+                _busy.remove(ref)
+        elif busy():
+            return True
+    return False
+
+
+class FrameLoop:
+    """
+    decides how each frame waits for events. when idle is on and nothing happened
+    for settle_frames frames (no input, no active item, no redraw request), the
+    loop blocks in glfw.wait_events_timeout until input arrives, request_redraw()
+    or wake_loops() is called or idle_timeout passes, busy_timeout while keep_awake
+    work is running. max_fps caps the frame rate, 0 for no cap.
+    """
+
+    def __init__(self, max_fps=60, idle=True, idle_timeout=1.0, settle_frames=3, busy_timeout=0.1):
+        self.max_fps = max_fps
+        self.idle = idle
+        self.idle_timeout = idle_timeout
+        self.busy_timeout = busy_timeout
+        self.settle_frames = settle_frames
+        # glfw is initialised and the loop is drawing, empty events can be posted
+        self.live = False
+        self.frames = 0
+        self.idle_waits = 0
+        self._quiet = 0
+        self._redraw = False
+        self._last_frame = 0.
+        self._last_input = None
+        self._cpu_start = time.process_time()
+        self._wall_start = time.perf_counter()
+        self._lock = threading.Lock()
+        with _loops_lock:
+            _loops.add(self)
+
+    def request_redraw(self):
+        """
+        thread safe, also wakes a loop that is waiting for events. does nothing to
+        glfw before the first frame or after close()
+        """
+        self._redraw = True
+        with self._lock:
+            if self.live:
+                glfw.post_empty_event()
+
+    def close(self):
+        """
+        call before glfw.terminate, later request_redraw calls do not post events
+        """
+        with self._lock:
+            self.live = False
+
+    def wait(self):
+        self.live = True
+        if self.max_fps:
+            remaining = self._last_frame + 1. / self.max_fps - time.perf_counter()
+            if remaining > 0:
+                time.sleep(remaining)
+        redraw, self._redraw = self._redraw, False
+        if redraw:
+            self._quiet = 0
+        if self.idle and self._quiet >= self.settle_frames:
+            self.idle_waits += 1
+            glfw.wait_events_timeout(self.busy_timeout if _any_busy() else self.idle_timeout)
+        else:
+            glfw.poll_events()
+        self._last_frame = time.perf_counter()
+        self.frames += 1
+
+    def observe(self, window):
+        """
+        after imgui.new_frame, counts the frame as active when the input changed or
+        an item is being used
+        """
+        io = imgui.get_io()
+        state = (glfw.get_cursor_pos(window), glfw.get_window_size(window),
+                 tuple(io.mouse_down), io.mouse_wheel, io.mouse_wheel_horizontal, tuple(io.keys_down))
+        if state != self._last_input or imgui.is_any_item_active() or io.want_text_input:
+            self._quiet = 0
+        else:
+            self._quiet += 1
+        self._last_input = state
+
+    def stats(self) -> dict:
+        wall = time.perf_counter() - self._wall_start
+        return {
+            'frames': self.frames,
+            'idle_waits': self.idle_waits,
+            'wall_time': wall,
+            'cpu_time': time.process_time() - self._cpu_start,
+            'fps': self.frames / wall if wall > 0 else 0.,
+        }
+
+
 @contextmanager
-def glfw_frame(impl, window, clear=[1, 1, 1, 1], auto_flip=True):
+def glfw_frame(impl, window, clear=[1, 1, 1, 1], auto_flip=True, loop: FrameLoop = None):
     try:
         try:
-            glfw.poll_events()
+            if loop is None:
+                glfw.poll_events()
+            else:
+                loop.wait()
             impl.process_inputs()
 
             imgui.new_frame()
+            if loop is not None:
+                loop.observe(window)
             yield None
         except Exception as e:
             raise e
@@ -1,21 +1,83 @@
 from __future__ import absolute_import
-import sys
-import OpenGL.GL as gl
+from comtools import lazy_import
 import imgui
-from PIL import Image, ImageFile
-import numpy as np
-from contextlib import contextmanager
+from comtools.imgui_engine.glfw_init import wake_loops
+from collections import deque
+from itertools import islice
+import threading
+import logging
+import time
+
+
+# loaded on first use, only textures need them
+gl = lazy_import('OpenGL.GL')
+Image = lazy_import('PIL.Image')
+# not used here, handlers star-importing this module (or jsonui) still find them
+ImageFile = lazy_import('PIL.ImageFile')
+np = lazy_import('numpy')
+
+_GL_MODES = ('RGB', 'RGBA', 'L', 'LA')
+_GL_FORMATS = {}
+
+
+def _gl_format(mode):
+    """
+    :return: (internal format, pixel format, swizzle) of a PIL mode, grey images are
+        sampled as grey, not red
+    """
+    if not _GL_FORMATS:
+        _GL_FORMATS.update({
+            'RGB': (gl.GL_RGB8, gl.GL_RGB, None),
+            'RGBA': (gl.GL_RGBA8, gl.GL_RGBA, None),
+            'L': (gl.GL_R8, gl.GL_RED, (gl.GL_RED, gl.GL_RED, gl.GL_RED, gl.GL_ONE)),
+            'LA': (gl.GL_RG8, gl.GL_RG, (gl.GL_RED, gl.GL_RED, gl.GL_RED, gl.GL_GREEN)),
+        })
+    return _GL_FORMATS[mode]
+
+
+def decode_image(filename, size=None):
+    """
+    decode an image into bytes ready for glTexImage2D, without a python object per pixel.
+    RGB, RGBA, L and LA are kept as they are, palette images become RGB or RGBA
+    depending on their transparency, anything else is converted.
+
+    :param filename:
+    :param size: (width, height) to resize to, only resized when different
+    :return: (mode, width, height, bytes), mode is one of _GL_MODES
+    """
+    img = Image.open(filename)
+    if img.mode == 'P':
+        img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+    elif img.mode == 'PA':
+        img = img.convert('RGBA')
+    elif img.mode in ('1', 'I', 'I;16', 'F'):
+        img = img.convert('L')
+    elif img.mode not in _GL_MODES:
+        img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+    if size is not None and img.size != tuple(size):
+        img = img.resize(tuple(size))
+    return img.mode, img.size[0], img.size[1], img.tobytes()
 
 
 class Texture:
 
-    def __init__(self, width, height=None):
+    _placeholder = None
+
+    def __init__(self, width, height=None, loader=None):
+        """
+        :param width:
+        :param height: default same as width
+        :param loader: a TextureLoader to decode in the background, else images
+            are loaded on the first access of id
+        """
         self._id = gl.glGenTextures(1)
         if height is None:
             height = width
         self.size = width, height
         self.filename = None
         self.loaded = False
+        self.loader = loader
+        self._requested = None
 
     def load(self, filename):
         if self.filename == filename:
@@ -26,24 +88,53 @@ class Texture:
 
     @property
     def id(self):
+        """
+        with a loader, the placeholder texture is returned until the image is uploaded
+        """
         if self.filename and not self.loaded:
-            self._load(self.filename)
-            self.loaded = True
+            if self.loader is None:
+                self._load(self.filename)
+                self.loaded = True
+            else:
+                if self._requested != self.filename:
+                    self._requested = self.filename
+                    self.loader.request(self, self.filename)
+                return self.placeholder()
         return self._id
 
+    @classmethod
+    def placeholder(cls):
+        """
+        1x1 grey texture shown while images load
+        """
+        if cls._placeholder is None:
+            cls._placeholder = gl.glGenTextures(1)
+            gl.glBindTexture(gl.GL_TEXTURE_2D, cls._placeholder)
+            gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_NEAREST)
+            gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_NEAREST)
+            gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 1)
+            gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA8, 1, 1, 0,
+                            gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, bytes((128, 128, 128, 255)))
+        return cls._placeholder
+
     def _load(self, filename):
+        self._upload(*decode_image(filename, self.size))
+        return self
+
+    def _upload(self, mode, width, height, data):
+        internal_format, pixel_format, swizzle = _gl_format(mode)
         gl.glBindTexture(gl.GL_TEXTURE_2D, self._id)
         gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S, gl.GL_REPEAT)
         gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_T, gl.GL_REPEAT)
         gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR)
         gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_LINEAR)
+        if swizzle is not None:
+            gl.glTexParameteriv(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_SWIZZLE_RGBA, swizzle)
 
-        img = Image.open(filename).resize(self.size)
-
-        width, height = img.size
-        data = np.array(list(img.getdata()), dtype=np.uint8)
-
-        gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGB, width, height, 0, gl.GL_RGB, gl.GL_UNSIGNED_BYTE, data)
+        # rows of RGB and single channel images are not 4 byte aligned
+        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 1)
+        gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, internal_format, width, height, 0,
+                        pixel_format, gl.GL_UNSIGNED_BYTE, data)
         gl.glGenerateMipmap(gl.GL_TEXTURE_2D)
         return self
 
@@ -55,6 +146,86 @@ class Texture:
         gl.glDeleteTextures(gl.GLuint(self._id))
 
 
+class TextureLoader:
+    """
+    decodes and resizes the images of textures on a pool of worker threads. the
+    gl upload has to happen on the render thread, call upload() once per frame,
+    it stops after frame_time seconds or frame_bytes bytes, whichever comes first.
+    decodes and leftover uploads wake idle FrameLoops, on_ready is also called from
+    a worker thread after each decode.
+    """
+
+    def __init__(self, workers=4, frame_time=0.004, frame_bytes=None, on_ready=None):
+        self.frame_time = frame_time
+        self.frame_bytes = frame_bytes
+        self.on_ready = on_ready
+        self.uploaded = 0
+        self.failed = 0
+        from concurrent.futures import ThreadPoolExecutor
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix='texture-decode')
+        self._ready = deque()
+        self._decoding = 0
+        self._lock = threading.Lock()
+
+    def request(self, texture: Texture, filename):
+        with self._lock:
+            self._decoding += 1
+        future = self._pool.submit(decode_image, filename, texture.size)
+        future.add_done_callback(lambda f: self._decoded(texture, filename, f))
+
+    def _decoded(self, texture, filename, future):
+        with self._lock:
+            self._decoding -= 1
+            try:
+                self._ready.append((texture, filename, future.result()))
+            except Exception as e:
+                self.failed += 1
+                logging.warning(f'loading {filename} failed: {e!r}')
+                return
+        wake_loops()
+        if self.on_ready is not None:
+            self.on_ready()
+
+    def upload(self) -> int:
+        """
+        render thread only
+
+        :return: number of textures uploaded
+        """
+        start = time.perf_counter()
+        sent = 0
+        count = 0
+        while True:
+            with self._lock:
+                if not self._ready:
+                    break
+                texture, filename, decoded = self._ready.popleft()
+            if texture.filename != filename:
+                continue
+            texture._upload(*decoded)
+            texture.loaded = True
+            count += 1
+            sent += len(decoded[3])
+            if time.perf_counter() - start >= self.frame_time or \
+                    (self.frame_bytes is not None and sent >= self.frame_bytes):
+                break
+        self.uploaded += count
+        if self._ready:
+            # over the budget, the rest goes up in the next frames
+            wake_loops()
+        return count
+
+    def pending(self) -> int:
+        """
+        images being decoded or waiting for upload
+        """
+        with self._lock:
+            return self._decoding + len(self._ready)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
 class MenuWindow:
 
     def __init__(self, name, controller=None, denote_item=0, position=None, size=None, collapsed=False):
@@ -90,11 +261,147 @@ class MenuWindow:
             self.open = False
 
 
-@contextmanager
-def id_scope(nid):
-    imgui.push_id(nid)
-    yield None
-    imgui.pop_id()
+class ListClipper:
+    """
+    iterate only the row indices of a list that intersect the current window, like
+    ImGui's ListClipper. skipped rows are replaced by empty space, using row_height
+    when given, or else the average height of the rows drawn, cached under key.
+    """
+
+    _row_heights = {}
+    _max_cached = 4096
+
+    def __init__(self, count, row_height=None, key=None):
+        self.count = count
+        self.row_height = row_height
+        self.key = key
+        self.start = 0
+        self.end = count
+
+    def _skip(self, rows, height):
+        spacing = imgui.get_style().item_spacing[1]
+        if rows > 0 and rows * height > spacing:
+            imgui.dummy(0, rows * height - spacing)
+
+    def __iter__(self):
+        count = self.count
+        if count <= 0:
+            return
+        height = self.row_height or self._row_heights.get(self.key) or imgui.get_frame_height_with_spacing()
+        top = imgui.get_cursor_pos_y()
+        scroll = imgui.get_scroll_y()
+        self.start = min(count, max(0, int((scroll - top) / height)))
+        self.end = min(count, max(self.start, int((scroll + imgui.get_window_height() - top) / height) + 1))
+
+        self._skip(self.start, height)
+        rows_top = imgui.get_cursor_pos_y()
+        for i in range(self.start, self.end):
+            yield i
+        drawn = self.end - self.start
+        if drawn and not self.row_height:
+            if len(self._row_heights) > self._max_cached:
+                self._row_heights.clear()
+            height = self._row_heights[self.key] = max(1., (imgui.get_cursor_pos_y() - rows_top) / drawn)
+        self._skip(count - self.end, height)
+
+
+def clipped_items(ref, row_height=None, threshold=64):
+    """
+    (key, value) pairs of a dict, or (index, value) of a list, restricted to the
+    visible rows once there are more than threshold of them
+
+    :param ref: dict or list being drawn, one row per child
+    :param row_height: fixed row height, measured when None
+    :param threshold: below this many children every row is yielded
+    :return:
+    """
+    if len(ref) <= threshold:
+        yield from ref.items() if isinstance(ref, dict) else enumerate(ref)
+        return
+    clipper = ListClipper(len(ref), row_height, id(ref))
+    if not isinstance(ref, dict):
+        for i in clipper:
+            yield i, ref[i]
+        return
+    keys = None
+    for i in clipper:
+        if keys is None:
+            # only the visible keys, taken as the dict is now. skipping to them
+            # costs less than a cached key list that has to be checked every frame
+            keys = list(islice(ref, clipper.start, clipper.end))
+        k = keys[i - clipper.start]
+        if k in ref:
+            yield k, ref[k]
+
+
+_index_ids = []
+
+
+def index_id(i) -> str:
+    """
+    str(i), cached for indices below 65536 so row ids are not rebuilt every frame
+    """
+    if 0 <= i < len(_index_ids):
+        return _index_ids[i]
+    if 0 <= i < 65536:
+        _index_ids.extend(str(n) for n in range(len(_index_ids), i + 1))
+        return _index_ids[i]
+    return str(i)
+
+
+def _as_id(nid) -> str:
+    if isinstance(nid, str):
+        return nid
+    if isinstance(nid, int):
+        return index_id(nid)
+    return str(nid)
+
+
+class IdScope:
+    """
+    with id_scope(nid): ..., one shared instance so entering a scope allocates nothing
+    """
+
+    def __call__(self, nid):
+        imgui.push_id(_as_id(nid))
+        return self
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        imgui.pop_id()
+
+
+id_scope = IdScope()
+
+
+class LabelWrap:
+    """
+    with label_wrap(label): ..., the label goes to a left column taking
+    label_width_percent of the window, widgets of the block to the right one
+    """
+
+    def __call__(self, label, label_width_percent=0.4):
+        label = _as_id(label)
+        imgui.push_id(label)
+        imgui.columns(2, None, False)
+        w = imgui.get_window_content_region_width() * label_width_percent - imgui.get_cursor_pos()[0]
+        imgui.set_column_width(0, w)
+        imgui.text(label)
+        imgui.same_line()
+        imgui.next_column()
+        return self
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        imgui.pop_id()
+        imgui.columns(1, None, False)
+
+
+label_wrap = LabelWrap()
 
 
 def gl_white_clear():
@@ -1,13 +1,44 @@
 import json
 import os
 import shutil
+import threading
+import atexit
+import weakref
+import queue
+import time
+import zlib
+import lzma
+import bisect
+import re
 from os import path
+from collections import OrderedDict
+from contextlib import contextmanager
 import logging
 
 
+def _json_default(obj):
+    # numpy arrays and scalars that handlers keep in a tree
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    raise TypeError(f'Object of type {obj.__class__.__name__} is not JSON serializable')
+
+
 def save_json(obj, file):
-    with open(file, 'w') as fp:
-        json.dump(obj, fp)
+    """
+    written to a temporary file first and moved over the target, so readers see
+    either the old or the new content, never a truncated file
+    """
+    tmp = f'{file}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp, 'w') as fp:
+            json.dump(obj, fp, default=_json_default)
+        os.replace(tmp, file)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
 
 
 def load_json(file):
@@ -15,6 +46,18 @@ def load_json(file):
         return json.load(fp)
 
 
+def json_copy(obj):
+    """
+    copy of a json tree, dicts and lists are copied, everything else is shared.
+    a lot cheaper than copy.deepcopy.
+    """
+    if isinstance(obj, dict):
+        return {k: json_copy(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [json_copy(v) for v in obj]
+    return obj
+
+
 def is_child_of(obj, cls):
     try:
         for i in obj.__bases__:
@@ -28,6 +71,338 @@ def is_child_of(obj, cls):
     return False
 
 
+class MemoryCache:
+    """
+    parsed json kept in process, keyed by file path. an entry is valid as long as
+    os.stat of its file reports the same mtime_ns and size, the least recently used
+    entries are evicted beyond max_entries or max_bytes (measured by file size).
+
+    values are shared with the callers, mutate them only through a write.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, file, loader):
+        """
+        :param file:
+        :param loader: called with file when the entry is missing or stale
+        :return: the parsed value
+        """
+        try:
+            st = os.stat(file)
+        except FileNotFoundError:
+            self.discard(file)
+            raise
+        with self._lock:
+            entry = self._entries.get(file)
+            if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+                self._entries.move_to_end(file)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+        value = loader(file)
+        self.put(file, value, st)
+        return value
+
+    def put(self, file, value, st=None):
+        if st is None:
+            st = os.stat(file)
+        with self._lock:
+            self.discard(file)
+            self._entries[file] = st.st_mtime_ns, st.st_size, value
+            self.bytes += st.st_size
+            while self._entries and (
+                    (self.max_entries is not None and len(self._entries) > self.max_entries) or
+                    (self.max_bytes is not None and self.bytes > self.max_bytes)):
+                _, (_, size, _) = self._entries.popitem(last=False)
+                self.bytes -= size
+                self.evictions += 1
+
+    def discard(self, file):
+        with self._lock:
+            entry = self._entries.pop(file, None)
+            if entry is not None:
+                self.bytes -= entry[1]
+
+    def clear(self, folder=None):
+        """
+        :param folder: only drop the entries under this folder, default all
+        """
+        with self._lock:
+            if folder is None:
+                self._entries.clear()
+                self.bytes = 0
+                return
+            prefix = path.join(folder, '')
+            for file in [f for f in self._entries if f.startswith(prefix)]:
+                self.discard(file)
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+        }
+
+
+class WriteBehind:
+    """
+    holds the latest value per file and writes them from a background thread every
+    interval seconds, or on flush(). repeated writes to a file within one interval
+    cost a single save. values are serialized when flushed, not when put.
+    """
+
+    def __init__(self, interval=1.0, writer=save_json):
+        self.interval = interval
+        self.writer = writer
+        self.writes = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.failures = 0
+        self._pending = {}
+        self._writing = {}
+        self._callbacks = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        _write_behinds.add(self)
+
+    def put(self, file, value, on_written=None, writer=None):
+        """
+        :param on_written: called as on_written(file, value) after the value reached the disk
+        :param writer: writes this value instead of the default writer
+        """
+        with self._lock:
+            if file in self._pending:
+                self.coalesced += 1
+            self._pending[file] = value
+            self._callbacks[file] = on_written, writer
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='json-write-behind', daemon=True)
+                self._thread.start()
+
+    def get(self, file):
+        """
+        :return: (True, value) when a write to file has not reached the disk yet, else (False, None)
+        """
+        with self._lock:
+            if file in self._pending:
+                return True, self._pending[file]
+            if file in self._writing:
+                return True, self._writing[file]
+        return False, None
+
+    def discard(self, folder):
+        """
+        drop the pending writes of every file under folder
+        """
+        prefix = path.join(folder, '')
+        with self._lock:
+            for file in [f for f in self._pending if f.startswith(prefix)]:
+                del self._pending[file]
+                del self._callbacks[file]
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def files(self, folder) -> list:
+        """
+        :return: the files under folder with a write not on the disk yet
+        """
+        prefix = path.join(folder, '')
+        with self._lock:
+            return [f for f in list(self._pending) + list(self._writing) if f.startswith(prefix)]
+
+    def flush(self):
+        """
+        write everything pending now, the first error is raised after all files were tried
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                callbacks, self._callbacks = self._callbacks, {}
+                self._writing = batch
+            error = None
+            try:
+                for file, value in batch.items():
+                    on_written, writer = callbacks.get(file, (None, None))
+                    try:
+                        (writer or self.writer)(value, file)
+                    except Exception as e:
+                        self.failures += 1
+                        logging.warning(f'write behind failed for {file}: {e!r}')
+                        error = error or e
+                        continue
+                    self.writes += 1
+                    if on_written is not None:
+                        on_written(file, value)
+            finally:
+                with self._lock:
+                    self._writing = {}
+                self.flushes += 1
+        if error is not None:
+            raise error
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+    def stats(self) -> dict:
+        return {
+            'pending': self.pending(),
+            'writes': self.writes,
+            'coalesced': self.coalesced,
+            'flushes': self.flushes,
+            'failures': self.failures,
+        }
+
+
+class StateSaver:
+    """
+    saves a json tree that is edited on the render thread, from a background thread.
+
+    call changed() after every edit and poll() once per frame, a snapshot is taken
+    once the edits stopped for delay seconds, or at the latest max_delay seconds
+    after the first of them. snapshots that pile up are coalesced, only the newest
+    is written. close() saves what is left and waits for the writer.
+    """
+
+    def __init__(self, file, delay=0.3, max_delay=2.0, snapshot=json_copy, writer=save_json):
+        self.file = file
+        self.delay = delay
+        self.max_delay = max_delay
+        self.snapshot = snapshot
+        self.writer = writer
+        self.saves = 0
+        self.skipped = 0
+        self.last_latency = 0.
+        self.max_latency = 0.
+        self.total_latency = 0.
+        self.last_error = None
+        self._obj = None
+        self._first_change = None
+        self._last_change = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='state-saver', daemon=True)
+        self._thread.start()
+
+    def changed(self, obj):
+        now = time.perf_counter()
+        self._obj = obj
+        if self._first_change is None:
+            self._first_change = now
+        self._last_change = now
+
+    def poll(self):
+        """
+        :return: True when a snapshot was queued
+        """
+        if self._first_change is None:
+            return False
+        now = time.perf_counter()
+        if now - self._last_change >= self.delay or now - self._first_change >= self.max_delay:
+            self.save_now()
+            return True
+        return False
+
+    def save_now(self, obj=None):
+        if obj is None:
+            obj = self._obj
+        first = self._first_change or time.perf_counter()
+        self._obj = self._first_change = self._last_change = None
+        if obj is not None:
+            self._queue.put((first, self.snapshot(obj)))
+
+    @property
+    def waiting(self) -> bool:
+        """
+        edits were made that are not queued yet
+        """
+        return self._first_change is not None
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def _run(self):
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            if item is None:
+                return
+            while True:
+                try:
+                    newer = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if newer is None:
+                    stop = True
+                    break
+                self.skipped += 1
+                item = newer
+            first, snapshot = item
+            try:
+                self.writer(snapshot, self.file)
+            except Exception as e:
+                self.last_error = e
+                logging.warning(f'saving {self.file} failed: {e!r}')
+                continue
+            self.saves += 1
+            self.last_latency = time.perf_counter() - first
+            self.max_latency = max(self.max_latency, self.last_latency)
+            self.total_latency += self.last_latency
+
+    def close(self):
+        self.save_now()
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self) -> dict:
+        """
+        latencies in seconds, from the first edit of a save to its file being written
+        """
+        return {
+            'saves': self.saves,
+            'skipped': self.skipped,
+            'queue_depth': self.queue_depth(),
+            'last_latency': self.last_latency,
+            'max_latency': self.max_latency,
+            'mean_latency': self.total_latency / self.saves if self.saves else 0.,
+        }
+
+
+_write_behinds = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_write_behinds():
+    for wb in list(_write_behinds):
+        wb.close()
+
+
+# what follows the file name of a value in the names of its own files: nothing,
+# the lock of FileLocks or an array of ArraySidecars (<name>.<hex>.<i>.npy)
+_COMPANION = re.compile(r'(\.lock|\.[0-9a-f]+\.[0-9]+\.npy)?')
+
+
 class JsonCache:
 
     WARN = False
@@ -44,6 +419,13 @@ class JsonCache:
         self._tag = tag
         self._folder = '.'
         self._expansion = '.txt'
+        self._memory = None
+        self._write_behind = None
+        self._arrays = None
+        self._locks = None
+        self._shards = None
+        self._codec = None
+        self._made_dirs = set()
         self._make_dir()
 
     def set_expansion(self, new_expansion:str):
@@ -52,6 +434,311 @@ class JsonCache:
         self._expansion = new_expansion
         return self
 
+    def set_codec(self, backend=None, compression=None, level=None, enabled=True):
+        """
+        how values are encoded on the disk, files written with any codec can be
+        read with any other. sub caches opened from this one share it.
+
+        :param backend: 'orjson', 'json' or None for the fastest installed, orjson
+            writes NaN as null
+        :param compression: None, 'zlib' or 'lzma'
+        :param level: compression level, 0-9
+        :param enabled: False to go back to save_json and load_json, which can
+            not read compressed files
+        :return:
+        """
+        from comtools.json_caching.codec import JsonCodec
+        self._codec = JsonCodec(backend, compression, level) if enabled else None
+        if self._arrays is not None:
+            self._arrays.codec = self._codec
+        return self
+
+    def set_memory_cache(self, max_entries=1024, max_bytes=None, enabled=True):
+        """
+        keep parsed values in memory, revalidated by the file's mtime and size on
+        every read. sub caches opened from this one share the memory cache.
+
+        values returned are shared, mutate them only by assigning them back.
+
+        :param max_entries: None for no limit
+        :param max_bytes: budget by file size, None for no limit
+        :param enabled: False to drop the memory cache
+        :return:
+        """
+        self._memory = MemoryCache(max_entries, max_bytes) if enabled else None
+        return self
+
+    def set_write_behind(self, interval=1.0, enabled=True):
+        """
+        assignments are kept in memory and written by a background thread every
+        interval seconds, or by flush(). reads see the pending values. files are
+        always replaced atomically. sub caches opened from this one share it.
+
+        :param interval: seconds between flushes
+        :param enabled: False to flush and go back to synchronous writes
+        :return:
+        """
+        if self._write_behind is not None:
+            self._write_behind.close()
+        self._write_behind = WriteBehind(interval) if enabled else None
+        return self
+
+    def set_array_sidecars(self, min_list_length=None, mmap_mode='r', enabled=True):
+        """
+        numpy arrays in assigned values are saved as .npy files beside the json,
+        which keeps a {"__npy__": name} stub in their place. reads return them
+        memory mapped. sub caches opened from this one share the setting.
+
+        :param min_list_length: numeric lists at least this long are stored as
+            arrays too (and read back as arrays), None to leave lists in the json
+        :param mmap_mode: 'r' read only, 'c' copy on write, None to load into memory
+        :param enabled: False to write plain json again, existing stubs are then
+            read back as dicts
+        :return:
+        """
+        from comtools.json_caching.arrays import ArraySidecars
+        self._arrays = ArraySidecars(min_list_length, mmap_mode, self._codec) if enabled else None
+        return self
+
+    def set_process_safe(self, timeout=None, enabled=True):
+        """
+        reads take a shared lock and writes an exclusive lock of their key's file,
+        held between processes, so several processes can use the same cache. use
+        lock() to read, modify and write back a key. sub caches opened from this
+        one share the locks.
+
+        pending write behind values are only seen by this process until flushed.
+
+        :param timeout: seconds to wait for a lock before TimeoutError, None to wait forever
+        :param enabled: False to drop the locks
+        :return:
+        """
+        from comtools.json_caching.locks import FileLocks
+        self._locks = FileLocks(timeout) if enabled else None
+        return self
+
+    @contextmanager
+    def lock(self, key, shared=False):
+        """
+        hold the lock of key, reads and writes of it inside are done under it
+
+            with jc.lock('counter'):
+                jc.counter = (jc.counter or 0) + 1
+
+        :param shared: True to only keep writers out
+        """
+        if self._locks is None:
+            yield self
+            return
+        with self._locks.lock(self._file_path(key), shared):
+            yield self
+
+    def set_sharding(self, levels=1, width=3, enabled=True, migrate=True):
+        """
+        files go to levels nested folders named by the first levels * width hex
+        digits of the crc32 of their key, e.g. 3fa/.key.txt, so no folder gets
+        large. every process using the cache has to set the same layout. sub
+        caches opened from this one share it.
+
+        :param levels: folder levels, 1 of width 3 gives 4096 folders
+        :param width: hex digits per level
+        :param enabled: False to go back to one flat folder
+        :param migrate: move the files of the old layout here and in the sub caches
+        :return:
+        """
+        self.flush()
+        self._shards = (levels, width) if enabled and levels > 0 else None
+        if migrate:
+            moved = self._migrate()
+            if moved:
+                logging.info(f'moved {moved} files of {self.cache_dir()} to the new layout')
+        return self
+
+    def _migrate(self) -> int:
+        moved = 0
+        listings = {}
+        for key, file in self._scan():
+            target = self._file_path(key)
+            if target == file:
+                continue
+            self._ensure_dir(target)
+            folder, name = path.split(file)
+            names = listings.get(folder)
+            if names is None:
+                names = listings[folder] = sorted(os.listdir(folder))
+            # sidecars and lock files of the key sort right after it, among the
+            # files of other keys starting with its name, e.g. key.txt of key
+            i = bisect.bisect_left(names, name)
+            while i < len(names) and names[i].startswith(name):
+                if _COMPANION.fullmatch(names[i], len(name)):
+                    os.replace(path.join(folder, names[i]), path.join(path.dirname(target), names[i]))
+                i += 1
+            moved += 1
+        if moved:
+            self._remove_empty_shards()
+        for entry in os.scandir(self.cache_dir()):
+            if entry.name.startswith('.') and entry.is_dir():
+                moved += self[entry.name[1:]]._migrate()
+        return moved
+
+    def _shard_path(self, key):
+        levels, width = self._shards
+        digest = f'{zlib.crc32(key.encode("utf-8")):08x}'
+        return [digest[i * width:(i + 1) * width] for i in range(levels)]
+
+    def _ensure_dir(self, file):
+        folder = path.dirname(file)
+        if folder not in self._made_dirs:
+            os.makedirs(folder, exist_ok=True)
+            self._made_dirs.add(folder)
+
+    def _remove_empty_shards(self):
+        for folder, dirs, files in os.walk(self.cache_dir(), topdown=False):
+            if folder != self.cache_dir() and not path.basename(folder).startswith('.') and not dirs and not files:
+                try:
+                    os.rmdir(folder)
+                except OSError:
+                    pass
+                self._made_dirs.discard(folder)
+
+    def _scan(self) -> list:
+        """
+        one os.scandir pass over the files of the cache, in whatever layout they are
+
+        :return: [(key, file)]
+        """
+        found = []
+        ext = self._expansion
+
+        def walk(folder):
+            try:
+                entries = list(os.scandir(folder))
+            except FileNotFoundError:
+                return
+            for entry in entries:
+                name = entry.name
+                if not name.startswith('.'):
+                    if '.' not in name and entry.is_dir():
+                        walk(entry.path)
+                elif name.endswith(ext) and entry.is_file():
+                    # else a sub cache, or a .tmp, .lock or .npy file of a key
+                    found.append((name[1:-len(ext)], entry.path))
+        walk(self.cache_dir())
+        if self._write_behind is not None:
+            known = {f for _, f in found}
+            for file in self._write_behind.files(self.cache_dir()):
+                *folders, name = path.relpath(file, self.cache_dir()).split(os.sep)
+                if file not in known and name.endswith(ext) and not any(f.startswith('.') for f in folders):
+                    found.append((name[1:-len(ext)], file))
+        return found
+
+    def keys(self) -> list:
+        """
+        keys stored in this cache, sub caches excluded
+        """
+        return [k for k, _ in self._scan()]
+
+    def items(self, workers=None) -> list:
+        """
+        :param workers: threads reading the files, None to read them in this thread
+        :return: [(key, value)]
+        """
+        found = self._scan()
+        return list(zip((k for k, _ in found), self._read_all([f for _, f in found], workers)))
+
+    def get_many(self, keys=None, workers=None, default=None) -> dict:
+        """
+        :param keys: None for all keys
+        :param workers: threads reading the files, None to read them in this thread
+        :param default: value of missing or broken keys
+        :return: {key: value}
+        """
+        if keys is None:
+            found = self._scan()
+            keys, files = [k for k, _ in found], [f for _, f in found]
+        else:
+            keys = list(keys)
+            files = [self._file_path(k) for k in keys]
+        return dict(zip(keys, self._read_all(files, workers, default)))
+
+    def set_many(self, mapping, workers=None):
+        """
+        :param mapping: {key: value} or [(key, value)] of json values
+        :param workers: threads writing the files, None to write them in this thread
+        """
+        items = list(mapping.items() if isinstance(mapping, dict) else mapping)
+        if workers is None or workers <= 1 or len(items) < 2:
+            for key, value in items:
+                self._set(key, value)
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(workers) as pool:
+                for _ in pool.map(lambda kv: self._set(*kv), items):
+                    pass
+        return self
+
+    def _read_all(self, files, workers, default=None) -> list:
+        if workers is None or workers <= 1 or len(files) < 2:
+            return [self._read(f, default) for f in files]
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(workers) as pool:
+            return list(pool.map(lambda f: self._read(f, default), files, chunksize=64))
+
+    def _read(self, file, default=None):
+        if self._write_behind is not None:
+            found, value = self._write_behind.get(file)
+            if found:
+                if self._arrays is None:
+                    return value
+                # read it back like any other reader would, as memory maps
+                self._write_behind.flush()
+        try:
+            if self._memory is not None:
+                return self._memory.get(file, self._loader())
+            return self._loader()(file)
+        except FileNotFoundError:
+            return default
+        except (ValueError, EOFError, zlib.error, lzma.LZMAError):
+            # not json, or a truncated or corrupt compressed file
+            return default
+
+    def _loader(self):
+        if self._arrays is not None:
+            load = self._arrays.load
+        else:
+            load = self._codec.load if self._codec is not None else load_json
+        if self._locks is None:
+            return load
+
+        def locked(file):
+            with self._locks.lock(file, shared=True):
+                return load(file)
+        return locked
+
+    def _writer(self):
+        if self._arrays is not None:
+            save = self._arrays.save
+        else:
+            save = self._codec.save if self._codec is not None else save_json
+        if self._locks is None:
+            return save
+
+        def locked(obj, file):
+            with self._locks.lock(file):
+                save(obj, file)
+        return locked
+
+    def flush(self):
+        if self._write_behind is not None:
+            self._write_behind.flush()
+        return self
+
+    def cache_stats(self):
+        return self._memory.stats() if self._memory is not None else None
+
+    def lock_stats(self):
+        return self._locks.stats() if self._locks is not None else None
+
     def relocate(self, folder, retain=False):
         """
         move the cache to the destination dir, won't cover the destination caches, just relocating the readable source
@@ -66,11 +753,16 @@ class JsonCache:
             return self
 
         self._folder = os.path.normpath(folder)
+        self._made_dirs.clear()
         if not os.path.exists(self.cache_dir()):
-            shutil.move(last_cd, self.cache_dir())
+            try:
+                shutil.move(last_cd, self.cache_dir())
+            except FileNotFoundError:
+                # another process opening the same cache moved it first
+                self._make_dir()
         else:
             if not retain:
-                shutil.rmtree(last_cd)
+                shutil.rmtree(last_cd, ignore_errors=True)
             if self.WARN:
                 logging.warning('Dir already exists!')
         return self
@@ -79,21 +771,27 @@ class JsonCache:
         return self._tags_to_path(self._tag)
 
     def _make_dir(self):
-        if not path.exists(self.cache_dir()):
-            os.makedirs(self.cache_dir())
+        os.makedirs(self.cache_dir(), exist_ok=True)
 
     def _tags_to_path(self, *tags):
         return path.join(self._folder, *['.' + t for t in tags])
 
+    def _file_path(self, key):
+        if self._shards is not None:
+            return path.join(self.cache_dir(), *self._shard_path(key), '.' + key + self._expansion)
+        return self._tags_to_path(self._tag, key + self._expansion)
+
     def __getitem__(self, item):
         if os.path.isdir(self._tags_to_path(self._tag, item)):
-            return self.__class__(item).relocate(self.cache_dir())
-        try:
-            return load_json(self._tags_to_path(self._tag, item + self._expansion))
-        except FileNotFoundError:
-            return None
-        except json.decoder.JSONDecodeError:
-            return None
+            sub = self.__class__(item).relocate(self.cache_dir())
+            sub._memory = self._memory
+            sub._write_behind = self._write_behind
+            sub._arrays = self._arrays
+            sub._locks = self._locks
+            sub._shards = self._shards
+            sub._codec = self._codec
+            return sub
+        return self._read(self._file_path(item))
 
     def __getattr__(self, item):
         if item.startswith('_'):
@@ -105,14 +803,33 @@ class JsonCache:
         if isinstance(value, JsonCache):
             assert key == value._tag
             value.relocate(self.cache_dir())
-        elif value == JsonCache or is_child_of(value, JsonCache):
+        elif value is JsonCache or (isinstance(value, type) and issubclass(value, JsonCache)):
             value(key).relocate(self.cache_dir())
         else:
-            try:
-                save_json(value, self._tags_to_path(self._tag, key + self._expansion))
-            except TypeError as e:
-                os.remove(self._tags_to_path(self._tag, key + self._expansion))
-                raise e
+            self._set(key, value)
+
+    def _set(self, key, value):
+        file = self._file_path(key)
+        if self._shards is not None:
+            self._ensure_dir(file)
+        if self._write_behind is not None:
+            self._write_behind.put(file, value, self._on_written(), self._writer())
+            return
+        with self.lock(key):
+            # held over the stat of put, another process may write right after
+            self._writer()(value, file)
+            on_written = self._on_written()
+            if on_written is not None:
+                on_written(file, value)
+
+    def _on_written(self):
+        # the value written is what later reads get from memory, except with sidecars:
+        # those are read back as read only memory maps, not the caller's arrays
+        if self._memory is None:
+            return None
+        if self._arrays is not None:
+            return lambda file, value: self._memory.discard(file)
+        return self._memory.put
 
     def __setattr__(self, key, value):
         if key.startswith('_'):
@@ -120,7 +837,12 @@ class JsonCache:
         self.__setitem__(key, value)
 
     def clear(self):
+        if self._write_behind is not None:
+            self._write_behind.discard(self.cache_dir())
         shutil.rmtree(self.cache_dir())
+        self._made_dirs.clear()
+        if self._memory is not None:
+            self._memory.clear(self.cache_dir())
         self._make_dir()
 
 
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File  : arrays.py
+@Desc  : numpy arrays of a json tree kept in .npy files next to it
+
+    the json holds {"__npy__": "<file name>"} where an array was, reading it back
+    memory maps the file, so big arrays cost no parsing and share the page cache
+    between processes.
+"""
+
+from comtools.json_caching import _json_default
+from comtools.json_caching.codec import JsonCodec
+from os import path
+import numpy as np
+import threading
+import weakref
+import json
+import time
+import zlib
+import lzma
+import re
+import os
+
+
+STUB = '__npy__'
+# a stub in the json text, written by the json module or orjson
+_STUB_NAME = re.compile(rb'"' + STUB.encode() + rb'":\s*"([^"\\]+)"')
+
+
+def numeric_dtype(values):
+    """
+    :return: np.int64 for a list of ints that fit in it, np.float64 for a list of
+        floats, None for anything else: mixed ints and floats (written back as
+        floats they would change their json type), bools, other values
+    """
+    kind = None
+    for v in values:
+        t = type(v)
+        if t is float:
+            if kind == 'i':
+                return None
+            kind = 'f'
+        elif t is int:
+            if kind == 'f' or not -_INT64 <= v < _INT64:
+                return None
+            kind = 'i'
+        else:
+            return None
+    if kind is None:
+        return None
+    return np.float64 if kind == 'f' else np.int64
+
+
+_INT64 = 2 ** 63
+
+
+class ArraySidecars:
+    """
+    save and load json trees with their arrays in sidecar files. a save writes the
+    arrays under fresh names, then replaces the json, then removes the sidecars the
+    old json referred to and the new one does not, so memory maps of older saves
+    stay valid and nothing else in the folder is looked at.
+
+    arrays that came from load() in read only mode and are saved back unchanged
+    keep their sidecar instead of being written again.
+    """
+
+    def __init__(self, min_list_length=None, mmap_mode='r', codec=None):
+        """
+        :param min_list_length: numeric lists at least this long go to sidecars
+            too, None to keep lists in the json
+        :param mmap_mode: 'r' read only, 'c' copy on write, None to read into memory
+        :param codec: JsonCodec of the json file, None for the json module
+        """
+        self.min_list_length = min_list_length
+        self.mmap_mode = mmap_mode
+        self.codec = codec
+        self.arrays_written = 0
+        self.arrays_reused = 0
+        self._origins = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def _name(self, file, i):
+        with self._lock:
+            self._generation += 1
+            gen = self._generation
+        return f'{path.basename(file)}.{time.time_ns():x}{gen:x}.{i}.npy'
+
+    def _origin(self, array, file):
+        found = self._origins.get(id(array))
+        if found is None or found[0]() is not array:
+            return None
+        # only a sidecar of the same json file can be kept, others get removed with theirs
+        folder, name = path.split(found[1])
+        if folder != path.dirname(file) or not name.startswith(path.basename(file) + '.'):
+            return None
+        return name
+
+    def _extract(self, obj, file, arrays):
+        """
+        copy of the tree with arrays replaced by stubs, arrays gets (name, array or None)
+        """
+        if isinstance(obj, np.ndarray):
+            origin = self._origin(obj, file)
+            if origin is not None:
+                arrays.append((origin, None))
+                return {STUB: origin}
+            name = self._name(file, len(arrays))
+            arrays.append((name, obj))
+            return {STUB: name}
+        if isinstance(obj, dict):
+            return {k: self._extract(v, file, arrays) for k, v in obj.items()}
+        if isinstance(obj, list):
+            if self.min_list_length is not None and len(obj) >= self.min_list_length:
+                dtype = numeric_dtype(obj)
+                if dtype is not None:
+                    try:
+                        return self._extract(np.array(obj, dtype=dtype), file, arrays)
+                    except OverflowError:
+                        pass
+            return [self._extract(v, file, arrays) for v in obj]
+        return obj
+
+    def save(self, obj, file):
+        folder = path.dirname(file)
+        arrays = []
+        tree = self._extract(obj, file, arrays)
+        old = self.sidecar_names(file)
+        tmp = f'{file}.{os.getpid()}.{threading.get_ident()}.tmp'
+        written = []
+        try:
+            for name, array in arrays:
+                if array is None:
+                    self.arrays_reused += 1
+                    continue
+                # the name is new, nobody reads it before the json points to it
+                np.save(path.join(folder, name), np.ascontiguousarray(array), allow_pickle=False)
+                written.append(name)
+                self.arrays_written += 1
+            if self.codec is None:
+                with open(tmp, 'w') as fp:
+                    json.dump(tree, fp, default=_json_default)
+            else:
+                with open(tmp, 'wb') as fp:
+                    fp.write(self.codec.dumps(tree))
+            os.replace(tmp, file)
+        except BaseException:
+            for name in written + [tmp]:
+                try:
+                    os.remove(path.join(folder, name))
+                except FileNotFoundError:
+                    pass
+            raise
+        self.remove_stale(file, old, {name for name, _ in arrays})
+
+    @staticmethod
+    def sidecar_names(file) -> set:
+        """
+        names of the sidecars the json file refers to, found without parsing it
+        """
+        try:
+            with open(file, 'rb') as fp:
+                text = JsonCodec.decompress(fp.read())
+        except (OSError, EOFError, zlib.error, lzma.LZMAError):
+            # missing or unreadable, nothing known to remove
+            return set()
+        return {m.decode('utf-8') for m in _STUB_NAME.findall(text)}
+
+    @staticmethod
+    def remove_stale(file, names, keep=()):
+        """
+        delete the sidecars of file in names that are not in keep
+        """
+        folder = path.dirname(file)
+        prefix = path.basename(file) + '.'
+        for name in names:
+            # only plain names of this file's sidecars, whatever the json says
+            if name not in keep and name.startswith(prefix) and name.endswith('.npy') and \
+                    path.basename(name) == name:
+                try:
+                    os.remove(path.join(folder, name))
+                except FileNotFoundError:
+                    pass
+
+    def load(self, file, retries=3):
+        """
+        :param retries: a save running at the same time can remove the sidecars
+            of the json just read, then it is read again
+        """
+        for i in range(retries):
+            try:
+                return self._load(file)
+            except FileNotFoundError:
+                if i == retries - 1 or not path.exists(file):
+                    raise
+
+    def _load(self, file):
+        with open(file, 'rb') as fp:
+            text = fp.read()
+        text = JsonCodec.decompress(text)
+        if b'"' + STUB.encode() + b'"' not in text:
+            return json.loads(text) if self.codec is None else self.codec.backend.decode(text)
+        folder = path.dirname(file)
+
+        def hook(d):
+            if len(d) == 1 and STUB in d:
+                name = path.join(folder, d[STUB])
+                array = np.load(name, mmap_mode=self.mmap_mode, allow_pickle=False)
+                if self.mmap_mode == 'r':
+                    self._remember(array, name)
+                return array
+            return d
+
+        return json.loads(text, object_hook=hook)
+
+    def _remember(self, array, name):
+        with self._lock:
+            if len(self._origins) > 4096:
+                self._origins = {k: v for k, v in self._origins.items() if v[0]() is not None}
+            self._origins[id(array)] = weakref.ref(array), name
+
+    def stats(self) -> dict:
+        return {
+            'written': self.arrays_written,
+            'reused': self.arrays_reused,
+        }
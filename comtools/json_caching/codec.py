@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File  : codec.py
+@Desc  : how json trees become bytes on the disk: an encoder (orjson when it is
+    installed, else the json module) and an optional zlib or lzma compression
+
+    codec = JsonCodec(compression='zlib')
+    codec.save(tree, file)
+    tree = codec.load(file)
+
+    compressed files are told apart by their magic bytes, so a file written with
+    any codec can be read by any other one.
+"""
+
+from comtools.json_caching import _json_default
+import threading
+import json
+import zlib
+import lzma
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+_XZ_MAGIC = b'\xfd7zXZ\x00'
+
+
+class StdlibBackend:
+
+    name = 'json'
+
+    @staticmethod
+    def encode(obj) -> bytes:
+        return json.dumps(obj, default=_json_default).encode('utf-8')
+
+    @staticmethod
+    def decode(data: bytes):
+        return json.loads(data)
+
+
+class OrjsonBackend:
+    """
+    orjson writes NaN and infinities as null, use the json backend for trees that
+    keep them. trees with ints beyond 64 bit and files orjson can not parse fall
+    back to the json module.
+    """
+
+    name = 'orjson'
+    options = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY) if orjson is not None else 0
+
+    @classmethod
+    def encode(cls, obj) -> bytes:
+        try:
+            return orjson.dumps(obj, default=_json_default, option=cls.options)
+        except TypeError:
+            return StdlibBackend.encode(obj)
+
+    @staticmethod
+    def decode(data: bytes):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # NaN and Infinity written by the json module
+            return json.loads(data)
+
+
+backends = {StdlibBackend.name: StdlibBackend}
+if orjson is not None:
+    backends[OrjsonBackend.name] = OrjsonBackend
+
+
+def best_backend():
+    return backends.get('orjson', StdlibBackend)
+
+
+class JsonCodec:
+    """
+    files are replaced atomically like save_json does
+    """
+
+    compressions = (None, 'zlib', 'lzma')
+
+    def __init__(self, backend=None, compression=None, level=None):
+        """
+        :param backend: 'orjson', 'json' or None for the fastest installed
+        :param compression: None, 'zlib' or 'lzma'
+        :param level: zlib level 0-9 (default 6) or lzma preset 0-9 (default 6)
+        """
+        if backend is None:
+            self.backend = best_backend()
+        elif backend in backends:
+            self.backend = backends[backend]
+        else:
+            raise ValueError(f'json backend {backend!r} is not installed, have {list(backends)}')
+        if compression not in self.compressions:
+            raise ValueError(f'compression must be one of {self.compressions}, got {compression!r}')
+        self.compression = compression
+        self.level = level
+
+    @property
+    def name(self) -> str:
+        return self.backend.name + (f'+{self.compression}' if self.compression else '')
+
+    def compress(self, data: bytes) -> bytes:
+        if self.compression == 'zlib':
+            return zlib.compress(data, 6 if self.level is None else self.level)
+        if self.compression == 'lzma':
+            return lzma.compress(data, preset=6 if self.level is None else self.level)
+        return data
+
+    @staticmethod
+    def decompress(data: bytes) -> bytes:
+        if data[:6] == _XZ_MAGIC:
+            return lzma.decompress(data)
+        # zlib header, json text never starts with an 'x'
+        if len(data) > 1 and data[0] == 0x78 and (data[0] << 8 | data[1]) % 31 == 0:
+            return zlib.decompress(data)
+        return data
+
+    def dumps(self, obj) -> bytes:
+        return self.compress(self.backend.encode(obj))
+
+    def loads(self, data: bytes):
+        return self.backend.decode(self.decompress(data))
+
+    def save(self, obj, file):
+        self.write(self.dumps(obj), file)
+
+    @staticmethod
+    def write(data: bytes, file):
+        tmp = f'{file}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp, 'wb') as fp:
+                fp.write(data)
+            os.replace(tmp, file)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def load(self, file):
+        with open(file, 'rb') as fp:
+            return self.loads(fp.read())
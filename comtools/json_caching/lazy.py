@@ -0,0 +1,389 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File  : lazy.py
+@Desc  : lazily materialized json files
+
+    the file is memory mapped and scanned once for the byte spans of every object
+    and array. a container is only parsed (one level of it) when it is first
+    accessed, and saving copies the bytes of untouched containers as they are.
+"""
+
+from comtools.json_caching import _json_default
+import numpy as np
+import mmap
+import json
+import os
+import re
+import threading
+
+
+_WS = re.compile(rb'[ \t\r\n]*')
+_KEY = re.compile(rb'[ \t\r\n]*("(?:[^"\\]|\\.)*")[ \t\r\n]*:[ \t\r\n]*', re.S)
+_NEXT = re.compile(rb'[ \t\r\n]*([,\]}])[ \t\r\n]*')
+_SCALAR = re.compile(rb'"(?:[^"\\]|\\.)*"|[^,\]}\s]+', re.S)
+_LITERALS = {b'true': True, b'false': False, b'null': None}
+
+
+def _parse_scalar(token: bytes):
+    # json.loads per token costs several times more than these
+    c = token[0]
+    if c == 0x22:
+        if b'\\' not in token:
+            return token[1:-1].decode('utf-8')
+        return json.loads(token.decode('utf-8'))
+    if token in _LITERALS:
+        return _LITERALS[token]
+    if b'.' in token or b'e' in token or b'E' in token:
+        return float(token)
+    try:
+        return int(token)
+    except ValueError:
+        return json.loads(token.decode('utf-8'))
+
+
+_BRACKETS = np.zeros(256, dtype=bool)
+_BRACKETS[[ord(c) for c in '{}[]']] = True
+
+
+def build_index(buf, chunk=1 << 26):
+    """
+    spans of all objects and arrays in a json text, brackets inside strings skipped
+
+    :param buf: bytes like
+    :param chunk: bytes scanned per numpy pass, bounds the temporary memory
+    :return: (starts, ends) int64 arrays sorted by start, ends[i] is the offset of
+        the bracket closing the one at starts[i]
+    """
+    data = np.frombuffer(buf, dtype=np.uint8)
+    quotes, brackets = [], []
+    for offset in range(0, len(data), chunk):
+        part = data[offset:offset + chunk]
+        quotes.append(np.flatnonzero(part == 0x22) + offset)
+        brackets.append(np.flatnonzero(_BRACKETS[part]) + offset)
+    quotes = np.concatenate(quotes) if quotes else np.zeros(0, np.int64)
+    brackets = np.concatenate(brackets) if brackets else np.zeros(0, np.int64)
+
+    # a quote after an odd run of backslashes is part of the string
+    maybe_escaped = quotes[(quotes > 0) & (data[np.maximum(quotes - 1, 0)] == 0x5c)]
+    if len(maybe_escaped):
+        escaped = []
+        for q in maybe_escaped.tolist():
+            n = 0
+            while q - n - 1 >= 0 and data[q - n - 1] == 0x5c:
+                n += 1
+            if n % 2:
+                escaped.append(q)
+        quotes = np.setdiff1d(quotes, np.array(escaped, np.int64), assume_unique=True)
+
+    # outside strings there is an even number of quotes before a bracket
+    brackets = brackets[np.searchsorted(quotes, brackets) % 2 == 0]
+
+    opening = (data[brackets] == 0x7b) | (data[brackets] == 0x5b)
+    depth = np.cumsum(np.where(opening, 1, -1))
+    level = np.where(opening, depth, depth + 1)
+    if len(depth) and (depth[-1] != 0 or depth.min() < 0):
+        raise ValueError('unbalanced brackets in json text')
+    # within one level openings and closings alternate, a stable sort pairs them up
+    order = np.argsort(level, kind='stable')
+    paired = brackets[order]
+    starts, ends = paired[0::2], paired[1::2]
+    by_start = np.argsort(starts, kind='stable')
+    return starts[by_start], ends[by_start]
+
+
+class LazyDocument:
+    """
+    a memory mapped json file and its bracket index. the file has to be replaced
+    (not rewritten in place) while documents of it are alive, save_lazy_json does so.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self._fp = open(file, 'rb')
+        self.buf = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self.starts, self.ends = build_index(self.buf)
+        self._lock = threading.Lock()
+
+    def end_of(self, start) -> int:
+        return int(self.ends[np.searchsorted(self.starts, start)])
+
+    def value_at(self, pos):
+        """
+        :return: (value, offset after it), containers come back unparsed
+        """
+        c = self.buf[pos]
+        if c == 0x7b:
+            end = self.end_of(pos)
+            return LazyDict(self, pos, end), end + 1
+        if c == 0x5b:
+            end = self.end_of(pos)
+            return LazyList(self, pos, end), end + 1
+        m = _SCALAR.match(self.buf, pos)
+        return _parse_scalar(m.group()), m.end()
+
+    def children(self, start, end, is_object):
+        """
+        parse one level of the container spanning start..end
+
+        :return: list of (key, value) for objects, of values for arrays
+        """
+        buf = self.buf
+        items = []
+        pos = _WS.match(buf, start + 1).end()
+        if pos == end:
+            return items
+        value_at = self.value_at
+        with self._lock:
+            while True:
+                if is_object:
+                    m = _KEY.match(buf, pos)
+                    if m is None:
+                        raise ValueError(f'expected a key at {pos} of {self.file}')
+                    value, pos = value_at(m.end())
+                    items.append((_parse_scalar(m.group(1)), value))
+                else:
+                    value, pos = value_at(pos)
+                    items.append(value)
+                m = _NEXT.match(buf, pos)
+                if m is None:
+                    raise ValueError(f'expected "," at {pos} of {self.file}')
+                if m.group(1) != b',':
+                    break
+                pos = m.end()
+        return items
+
+    def raw(self, start, end) -> bytes:
+        return self.buf[start:end + 1]
+
+
+class RawSpan:
+    """
+    the unparsed text of a container, what lazy_snapshot keeps of untouched parts
+    """
+
+    __slots__ = ('doc', 'start', 'end')
+
+    def __init__(self, doc, start, end):
+        self.doc = doc
+        self.start = start
+        self.end = end
+
+    def raw(self) -> bytes:
+        return self.doc.raw(self.start, self.end)
+
+
+class _Lazy:
+
+    # containers smaller than this are parsed whole with json.loads, their plain
+    # children can change unnoticed, so once loaded they are always written out
+    eager_bytes = 1 << 14
+
+    def _init_lazy(self, doc, start, end):
+        self._doc = doc
+        self._start = start
+        self._end = end
+        self._loaded = False
+        self._modified = False
+
+    def _parse(self, is_object):
+        if self._end - self._start < self.eager_bytes:
+            self._modified = True
+            value = json.loads(self._doc.raw(self._start, self._end))
+            return value.items() if is_object else value
+        return self._doc.children(self._start, self._end, is_object)
+
+    def _clean(self) -> bool:
+        """
+        nothing below this container changed, its original text is still valid
+        """
+        if not self._loaded:
+            return True
+        if self._modified:
+            return False
+        for v in self._values():
+            if isinstance(v, _Lazy) and not v._clean():
+                return False
+        return True
+
+
+def _loading(method):
+    def wrapped(self, *args, **kwargs):
+        if not self._loaded:
+            self._load()
+        return method(self, *args, **kwargs)
+    wrapped.__name__ = method.__name__
+    return wrapped
+
+
+def _modifying(method):
+    def wrapped(self, *args, **kwargs):
+        if not self._loaded:
+            self._load()
+        self._modified = True
+        return method(self, *args, **kwargs)
+    wrapped.__name__ = method.__name__
+    return wrapped
+
+
+class LazyDict(_Lazy, dict):
+    """
+    a dict whose items are parsed on first access, child containers stay lazy
+    """
+
+    def __init__(self, doc, start, end):
+        dict.__init__(self)
+        self._init_lazy(doc, start, end)
+
+    def _load(self):
+        self._loaded = True
+        dict.update(self, self._parse(True))
+
+    def _values(self):
+        return dict.values(self)
+
+    def __setitem__(self, key, value):
+        if not self._loaded:
+            self._load()
+        # handlers write every child back each frame, only real changes count
+        if dict.get(self, key, _missing) is not value:
+            self._modified = True
+            dict.__setitem__(self, key, value)
+
+    __getitem__ = _loading(dict.__getitem__)
+    __contains__ = _loading(dict.__contains__)
+    __iter__ = _loading(dict.__iter__)
+    __len__ = _loading(dict.__len__)
+    __eq__ = _loading(dict.__eq__)
+    __ne__ = _loading(dict.__ne__)
+    __repr__ = _loading(dict.__repr__)
+    __reversed__ = _loading(dict.__reversed__)
+    keys = _loading(dict.keys)
+    values = _loading(dict.values)
+    items = _loading(dict.items)
+    get = _loading(dict.get)
+    copy = _loading(dict.copy)
+    __delitem__ = _modifying(dict.__delitem__)
+    pop = _modifying(dict.pop)
+    popitem = _modifying(dict.popitem)
+    setdefault = _modifying(dict.setdefault)
+    update = _modifying(dict.update)
+    clear = _modifying(dict.clear)
+    __hash__ = None
+
+
+class LazyList(_Lazy, list):
+    """
+    a list whose items are parsed on first access, child containers stay lazy
+    """
+
+    def __init__(self, doc, start, end):
+        list.__init__(self)
+        self._init_lazy(doc, start, end)
+
+    def _load(self):
+        self._loaded = True
+        list.extend(self, self._parse(False))
+
+    def _values(self):
+        return list.__iter__(self)
+
+    def __setitem__(self, index, value):
+        if not self._loaded:
+            self._load()
+        if isinstance(index, slice) or list.__getitem__(self, index) is not value:
+            self._modified = True
+            list.__setitem__(self, index, value)
+
+    __getitem__ = _loading(list.__getitem__)
+    __contains__ = _loading(list.__contains__)
+    __iter__ = _loading(list.__iter__)
+    __len__ = _loading(list.__len__)
+    __eq__ = _loading(list.__eq__)
+    __ne__ = _loading(list.__ne__)
+    __repr__ = _loading(list.__repr__)
+    __reversed__ = _loading(list.__reversed__)
+    index = _loading(list.index)
+    count = _loading(list.count)
+    copy = _loading(list.copy)
+    __delitem__ = _modifying(list.__delitem__)
+    __iadd__ = _modifying(list.__iadd__)
+    append = _modifying(list.append)
+    extend = _modifying(list.extend)
+    insert = _modifying(list.insert)
+    pop = _modifying(list.pop)
+    remove = _modifying(list.remove)
+    reverse = _modifying(list.reverse)
+    sort = _modifying(list.sort)
+    clear = _modifying(list.clear)
+    __hash__ = None
+
+
+_missing = object()
+
+
+def load_lazy_json(file):
+    """
+    :return: a LazyDict or LazyList for the root container, scalars are parsed directly
+    """
+    doc = LazyDocument(file)
+    pos = _WS.match(doc.buf, 0).end()
+    value, _ = doc.value_at(pos)
+    return value
+
+
+def lazy_snapshot(obj):
+    """
+    like json_copy, but untouched lazy containers become RawSpans of their text
+    instead of being parsed and copied
+    """
+    if isinstance(obj, _Lazy) and obj._clean():
+        return RawSpan(obj._doc, obj._start, obj._end)
+    if isinstance(obj, dict):
+        return {k: lazy_snapshot(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [lazy_snapshot(v) for v in obj]
+    return obj
+
+
+def _dump(obj, write):
+    if isinstance(obj, RawSpan):
+        write(obj.raw())
+    elif isinstance(obj, _Lazy) and obj._clean():
+        write(obj._doc.raw(obj._start, obj._end))
+    elif isinstance(obj, dict):
+        write(b'{')
+        for i, (k, v) in enumerate(obj.items()):
+            if i:
+                write(b', ')
+            write(json.dumps(k if isinstance(k, str) else str(k)).encode())
+            write(b': ')
+            _dump(v, write)
+        write(b'}')
+    elif isinstance(obj, list):
+        write(b'[')
+        for i, v in enumerate(obj):
+            if i:
+                write(b', ')
+            _dump(v, write)
+        write(b']')
+    else:
+        write(json.dumps(obj, default=_json_default).encode())
+
+
+def save_lazy_json(obj, file):
+    """
+    save_json for trees from load_lazy_json (or snapshots of them), the text of
+    unmodified containers is copied over instead of serialized again
+    """
+    tmp = f'{file}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp, 'wb') as fp:
+            _dump(obj, fp.write)
+        os.replace(tmp, file)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File  : locks.py
+@Desc  : shared and exclusive locks per json file between processes
+
+    locks = FileLocks()
+    with locks.lock(file):              # exclusive, e.g. read, modify and write back
+        ...
+    with locks.lock(file, shared=True): # other readers may hold it too
+        ...
+"""
+
+from contextlib import contextmanager
+import threading
+import logging
+import time
+import os
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class FileLocks:
+    """
+    flock on a file.lock beside every file, so they work between processes and
+    between threads of one process alike. a thread holding the lock of a file may
+    take it again, inside an exclusive lock shared ones are free, a shared lock can
+    not be upgraded.
+
+    without fcntl (windows) the locks only hold between threads of this process.
+    lock files are left in place, removing them would race with their users.
+    """
+
+    def __init__(self, timeout=None):
+        """
+        :param timeout: seconds to wait for a lock before TimeoutError, None to wait forever
+        """
+        self.timeout = timeout
+        self.acquired = 0
+        self.reentered = 0
+        self.contended = 0
+        self.timeouts = 0
+        self.wait_time = 0.
+        self.max_wait = 0.
+        self._local = threading.local()
+        self._fallback = {}
+        self._fallback_lock = threading.Lock()
+        if fcntl is None:
+            logging.info('fcntl unavailable, json file locks only hold within this process')
+
+    def _held(self) -> dict:
+        held = getattr(self._local, 'held', None)
+        if held is None:
+            held = self._local.held = {}
+        return held
+
+    def _acquire(self, lock_file, shared):
+        """
+        :return: the handle to release
+        """
+        if fcntl is None:
+            with self._fallback_lock:
+                lock = self._fallback.setdefault(lock_file, threading.Lock())
+            if lock.acquire(blocking=False):
+                return lock
+            self.contended += 1
+            t = time.perf_counter()
+            if not lock.acquire(timeout=-1 if self.timeout is None else self.timeout):
+                self.timeouts += 1
+                raise TimeoutError(f'waited {self.timeout}s for {lock_file}')
+            self._waited(time.perf_counter() - t)
+            return lock
+
+        fd = os.open(lock_file, os.O_RDWR | os.O_CREAT, 0o666)
+        op = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        try:
+            try:
+                fcntl.flock(fd, op | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                self.contended += 1
+            t = time.perf_counter()
+            if self.timeout is None:
+                fcntl.flock(fd, op)
+            else:
+                deadline, pause = t + self.timeout, 1e-4
+                while True:
+                    try:
+                        fcntl.flock(fd, op | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if time.perf_counter() >= deadline:
+                            self.timeouts += 1
+                            raise TimeoutError(f'waited {self.timeout}s for {lock_file}')
+                        time.sleep(pause)
+                        pause = min(pause * 2, .01)
+            self._waited(time.perf_counter() - t)
+            return fd
+        except BaseException:
+            os.close(fd)
+            raise
+
+    def _waited(self, elapsed):
+        self.wait_time += elapsed
+        self.max_wait = max(self.max_wait, elapsed)
+
+    @staticmethod
+    def _release(handle):
+        if fcntl is None:
+            handle.release()
+        else:
+            # closing the only descriptor of the open file drops its flock
+            os.close(handle)
+
+    @contextmanager
+    def lock(self, file, shared=False):
+        """
+        :param file: the json file, not the lock file
+        :param shared: True for a reader lock
+        """
+        lock_file = f'{file}.lock'
+        held = self._held()
+        entry = held.get(lock_file)
+        if entry is not None:
+            if entry[1] and not shared:
+                raise RuntimeError(f'can not upgrade the shared lock of {file}')
+            entry[2] += 1
+            self.reentered += 1
+            try:
+                yield
+            finally:
+                entry[2] -= 1
+            return
+
+        # shared locks are not exclusive between threads without flock
+        handle = self._acquire(lock_file, shared and fcntl is not None)
+        held[lock_file] = [handle, shared, 1]
+        self.acquired += 1
+        try:
+            yield
+        finally:
+            del held[lock_file]
+            self._release(handle)
+
+    def stats(self) -> dict:
+        """
+        times in seconds, contended counts the locks that had to be waited for
+        """
+        return {
+            'acquired': self.acquired,
+            'reentered': self.reentered,
+            'contended': self.contended,
+            'timeouts': self.timeouts,
+            'wait_time': self.wait_time,
+            'max_wait': self.max_wait,
+        }
@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File  : watch.py
+@Desc  : notice other processes writing a json file and merge their changes into a live tree
+
+    watcher = StateWatcher(file, state)
+    saver = StateSaver(file, writer=watcher.own_writer(save_json))
+    ...
+    state = watcher.merge(state)    # once per frame, cheap when nothing happened
+"""
+
+from comtools.json_caching import load_json, json_copy, save_json
+import ctypes
+import ctypes.util
+import threading
+import logging
+import select
+import struct
+import time
+import os
+
+
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_Q_OVERFLOW = 0x4000
+_EVENT = struct.Struct('iIII')
+
+
+class _Inotify:
+    """
+    inotify of the folder of a file through libc, atomic replaces change the
+    inode of the file so the folder is watched, not the file
+    """
+
+    def __init__(self, file):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        folder = os.path.dirname(os.path.abspath(file))
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(folder), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f'inotify_add_watch failed for {folder}')
+        self.name = os.fsencode(os.path.basename(file))
+
+    def wait(self, timeout) -> bool:
+        """
+        :return: True when the file may have changed within timeout seconds
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return False
+        pos, hit = 0, False
+        while pos < len(data):
+            _, mask, _, length = _EVENT.unpack_from(data, pos)
+            name = data[pos + _EVENT.size:pos + _EVENT.size + length].rstrip(b'\0')
+            pos += _EVENT.size + length
+            if name == self.name or mask & IN_Q_OVERFLOW:
+                hit = True
+        return hit
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _signature(file):
+    try:
+        st = os.stat(file)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+class FileWatcher:
+    """
+    parses a file again on a background thread whenever another process changed it.
+    uses inotify on linux, else polls os.stat every interval seconds. writes of
+    this process made through own_writer() are not reported.
+
+    poll() hands the latest parsed content to the caller's thread, on_change() is
+    called from the watcher thread when there is some, e.g. to wake an idle window.
+    """
+
+    def __init__(self, file, loader=load_json, interval=0.5, inotify=True, on_change=None):
+        self.file = file
+        self.loader = loader
+        self.interval = interval
+        self.on_change = on_change
+        self.events = 0
+        self.reloads = 0
+        self.ignored = 0
+        self.failures = 0
+        self.last_parse = 0.
+        self.mode = 'poll'
+        self._known = _signature(file)
+        self._lock = threading.Lock()
+        self._latest = None
+        # own_writer() calls in progress, what the file looks like meanwhile is ours
+        self._writing = 0
+        self._stop = threading.Event()
+        self._inotify = None
+        if inotify:
+            try:
+                self._inotify = _Inotify(file)
+                self.mode = 'inotify'
+            except (OSError, AttributeError) as e:
+                logging.info(f'inotify unavailable, polling {file}: {e!r}')
+        self._thread = threading.Thread(target=self._run, name='json-watcher', daemon=True)
+        self._thread.start()
+
+    def acknowledge(self):
+        """
+        the file as it is now was written by us, do not report it
+        """
+        with self._lock:
+            self._known = _signature(self.file)
+
+    def own_writer(self, writer=save_json):
+        """
+        :return: writer(obj, file) that acknowledges what it wrote
+        """
+        def write(obj, file):
+            if file != self.file:
+                return writer(obj, file)
+            # the lock is only held for the bookkeeping, merge() and poll() on the
+            # drawing thread do not wait for the file write
+            with self._lock:
+                self._writing += 1
+            try:
+                writer(obj, file)
+            except BaseException:
+                with self._lock:
+                    self._writing -= 1
+                raise
+            with self._lock:
+                self._writing -= 1
+                self._known = _signature(file)
+                self._written(obj)
+        return write
+
+    def _written(self, obj):
+        pass
+
+    def _check(self):
+        detected = time.perf_counter()
+        with self._lock:
+            signature = _signature(self.file)
+            if self._writing or signature is None or signature == self._known:
+                self.ignored += 1
+                return
+            self._known = signature
+        t = time.perf_counter()
+        try:
+            value = self.loader(self.file)
+        except (ValueError, OSError) as e:
+            # caught in the middle of a non atomic write, the close will be reported again
+            self.failures += 1
+            with self._lock:
+                self._known = None
+            logging.debug(f'reloading {self.file} failed: {e!r}')
+            return
+        self.last_parse = time.perf_counter() - t
+        self.reloads += 1
+        with self._lock:
+            self._latest = value, detected
+        if self.on_change is not None:
+            self.on_change()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self._inotify is not None:
+                if not self._inotify.wait(self.interval):
+                    continue
+                self.events += 1
+            elif self._stop.wait(self.interval):
+                break
+            self._check()
+
+    def poll(self):
+        """
+        :return: (content, perf_counter time the change was seen) of the newest
+            change not handed out yet, or None
+        """
+        if self._latest is None:
+            return None
+        with self._lock:
+            latest, self._latest = self._latest, None
+        return latest
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def stats(self) -> dict:
+        """
+        times in seconds
+        """
+        return {
+            'mode': self.mode,
+            'events': self.events,
+            'reloads': self.reloads,
+            'ignored': self.ignored,
+            'failures': self.failures,
+            'last_parse': self.last_parse,
+        }
+
+
+_missing = object()
+
+
+def _pointer(path, key):
+    return f'{path}/' + str(key).replace('~', '~0').replace('/', '~1')
+
+
+def _same(a, b) -> bool:
+    if a is b:
+        return True
+    try:
+        return bool(a == b)
+    except ValueError:
+        # numpy arrays somewhere below
+        pass
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_same(a[k], b[k]) for k in a)
+    if hasattr(a, 'tolist'):
+        a = a.tolist()
+    if hasattr(b, 'tolist'):
+        b = b.tolist()
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(_same(x, y) for x, y in zip(a, b))
+    return False
+
+
+def merge_json(live, base, incoming, conflicts=None, path=''):
+    """
+    three way merge of json trees, for values changed both here and in the file
+    the live one wins and its path is added to conflicts
+
+    :param live: the tree being edited, its dicts are updated in place
+    :param base: what live and incoming both started from
+    :param incoming: the new content of the file
+    :param conflicts: list getting json pointers of conflicting values
+    :return: the merged value
+    """
+    if _same(incoming, base):
+        return live
+    if _same(live, base):
+        return incoming
+    if not (isinstance(live, dict) and isinstance(base, dict) and isinstance(incoming, dict)):
+        if conflicts is not None:
+            conflicts.append(path)
+        return live
+    for k, v in incoming.items():
+        old = base.get(k, _missing)
+        if k in live:
+            live[k] = merge_json(live[k], old, v, conflicts, _pointer(path, k))
+        elif old is _missing:
+            live[k] = v
+        elif not _same(old, v) and conflicts is not None:
+            # removed here, changed there
+            conflicts.append(_pointer(path, k))
+    for k, old in base.items():
+        if k not in incoming and k in live:
+            if _same(live[k], old):
+                del live[k]
+            elif conflicts is not None:
+                conflicts.append(_pointer(path, k))
+    return live
+
+
+class StateWatcher(FileWatcher):
+    """
+    a FileWatcher that merges the changes of the file into the live tree. it keeps
+    the last content both sides agreed on as the merge base: what was loaded,
+    written by own_writer() or merged in.
+    """
+
+    def __init__(self, file, state, loader=load_json, interval=0.5, inotify=True, on_change=None):
+        super().__init__(file, loader, interval, inotify, on_change)
+        self.base = json_copy(state)
+        self.merges = 0
+        self.checks = 0
+        self.conflicts = []
+        self.last_latency = 0.
+        self.avoided = 0.
+
+    def _written(self, obj):
+        # the snapshot written is not edited anymore, no copy needed
+        self.base = obj
+
+    def merge(self, state):
+        """
+        call once per frame from the thread editing state
+
+        :return: state with the changes of the file merged in
+        """
+        self.checks += 1
+        found = self.poll()
+        if found is None:
+            # re-parsing every frame would have cost this much
+            self.avoided += self.last_parse
+            return state
+        incoming, detected = found
+        with self._lock:
+            base = self.base
+        conflicts = []
+        state = merge_json(state, base, incoming, conflicts, '')
+        with self._lock:
+            self.base = json_copy(incoming)
+        if conflicts:
+            logging.info(f'{self.file}: kept local values at {conflicts}')
+            self.conflicts = (self.conflicts + conflicts)[-100:]
+        self.merges += 1
+        self.last_latency = time.perf_counter() - detected
+        return state
+
+    def stats(self) -> dict:
+        """
+        times in seconds, latency from seeing the change to it being merged,
+        avoided is the parse time frames would have spent polling the file
+        """
+        stats = super().stats()
+        stats.update({
+            'merges': self.merges,
+            'conflicts': len(self.conflicts),
+            'last_latency': self.last_latency,
+            'avoided': self.avoided,
+        })
+        return stats
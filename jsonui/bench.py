@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File  : bench.py
+@Desc  : headless frame benchmark, runs UI.input without glfw or OpenGL
+
+    python -m jsonui.bench --depth 3 --width 20 --frames 120 --handlers lab.test_ui
+    python -m jsonui.bench --max-peak-bytes 4096 --max-blocks 16     # allocation gate for ci
+    python -m jsonui.bench --profile --trace trace.json               # per handler times, chrome trace
+"""
+
+from jsonui.context import UI, imgui
+from jsonui.profiling import Profiler
+from jsonui import utils
+from contextlib import contextmanager, nullcontext
+from collections import Counter
+import importlib
+import argparse
+import random
+import time
+import tracemalloc
+import statistics
+import json
+import sys
+
+
+VALUE_MAKERS = {
+    'int': lambda rnd: rnd.randint(-1000, 1000),
+    'float': lambda rnd: rnd.uniform(-1000., 1000.),
+    'str': lambda rnd: 'v%d' % rnd.randint(0, 1 << 16),
+    'bool': lambda rnd: rnd.random() < 0.5,
+    'vec4': lambda rnd: [rnd.random() for _ in range(4)],
+    'list': lambda rnd: [rnd.randint(0, 100) for _ in range(rnd.randint(0, 16))],
+}
+
+
+def parse_mix(text):
+    """
+    'int:2,float:1,str:1' -> {'int': 2., 'float': 1., 'str': 1.}
+    """
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition(':')
+        if name not in VALUE_MAKERS:
+            raise ValueError(f'unknown value type {name}, use one of {list(VALUE_MAKERS)}')
+        mix[name] = float(weight) if weight else 1.
+    return mix
+
+
+def synthetic_tree(depth=3, width=10, mix=None, seed=0):
+    """
+    a dict tree, every dict has width children, the last level holds values
+
+    :param depth: levels of dicts
+    :param width: children per dict
+    :param mix: value type name -> weight, see VALUE_MAKERS
+    :param seed:
+    :return:
+    """
+    rnd = random.Random(seed)
+    if mix is None:
+        mix = {'int': 1., 'float': 1., 'str': 1.}
+    names = list(mix.keys())
+    weights = [mix[n] for n in names]
+
+    def make(level):
+        if level == depth:
+            return VALUE_MAKERS[rnd.choices(names, weights)[0]](rnd)
+        return {f'{level}_{i}': make(level + 1) for i in range(width)}
+
+    return make(0)
+
+
+def count_nodes(tree):
+    if isinstance(tree, dict):
+        return 1 + sum(count_nodes(v) for v in tree.values())
+    return 1
+
+
+def headless_context(width=1280, height=720):
+    """
+    imgui context with a fixed display size and a built font atlas, no window needed
+    """
+    ctx = imgui.create_context()
+    io = imgui.get_io()
+    io.display_size = width, height
+    io.delta_time = 1. / 60
+    io.fonts.get_tex_data_as_rgba32()
+    return ctx
+
+
+@contextmanager
+def headless_frame():
+    imgui.new_frame()
+    yield None
+    imgui.render()
+
+
+@contextmanager
+def expanded_tree_nodes():
+    """
+    open every tree node for the first time it is shown, so a run covers the whole tree
+    """
+    tree_node = imgui.tree_node
+
+    def open_tree_node(*args, **kwargs):
+        imgui.set_next_item_open(True, imgui.ONCE)
+        return tree_node(*args, **kwargs)
+
+    imgui.tree_node = open_tree_node
+    try:
+        yield None
+    finally:
+        imgui.tree_node = tree_node
+
+
+@contextmanager
+def counting_handler_calls(ui: UI, counter: Counter):
+    for h in ui.handlers:
+        def counted(key, ref, context, _input=h.input, _name=type(h).__name__):
+            counter[_name] += 1
+            return _input(key, ref, context)
+        h.input = counted
+    try:
+        yield counter
+    finally:
+        for h in ui.handlers:
+            del h.input
+
+
+def run_frames(ui: UI, tree, frames=60, warmup=5, alloc_frames=10, expand=True, window_size=(1280, 720)):
+    """
+    draw the tree into one window per frame and measure it
+
+    :return: dict of results, times in milliseconds
+    """
+
+    def frame():
+        with headless_frame(), ui.profiler.frame() if ui.profiler else nullcontext():
+            imgui.set_next_window_position(0, 0)
+            imgui.set_next_window_size(*window_size)
+            imgui.begin('State', False)
+            ui.input('state', tree)
+            imgui.end()
+
+    calls = Counter()
+    with expanded_tree_nodes() if expand else nullcontext():
+        for _ in range(warmup):
+            frame()
+        profiler = ui.profiler
+        if profiler is not None:
+            profiler.reset()
+
+        times = []
+        with counting_handler_calls(ui, calls):
+            for _ in range(frames):
+                t = time.perf_counter()
+                frame()
+                times.append((time.perf_counter() - t) * 1000)
+
+        # tracemalloc slows frames down, keep it out of the profile
+        ui.set_profiler(None)
+        peaks, nets = [], []
+        tracemalloc.start()
+        try:
+            # the first traced frame pays for tracemalloc's own tables
+            frame()
+            for _ in range(alloc_frames):
+                tracemalloc.reset_peak()
+                start = tracemalloc.get_traced_memory()[0]
+                frame()
+                current, peak = tracemalloc.get_traced_memory()
+                peaks.append(peak - start)
+                nets.append(current - start)
+            blocks = _allocated_blocks(frame)
+        finally:
+            tracemalloc.stop()
+            ui.set_profiler(profiler)
+
+    times.sort()
+    return {
+        'frames': frames,
+        'frame_ms': {
+            'mean': statistics.fmean(times),
+            'p50': times[len(times) // 2],
+            'p95': times[min(len(times) - 1, int(len(times) * .95))],
+            'max': times[-1],
+        },
+        'alloc': {
+            'peak_bytes': statistics.median(peaks) if peaks else 0,
+            'net_bytes': statistics.median(nets) if nets else 0,
+            'blocks': blocks,
+        },
+        'handler_calls_per_frame': {k: v / frames for k, v in sorted(calls.items())},
+        'dispatch': ui.dispatch_stats(),
+    }
+
+
+def _allocated_blocks(frame):
+    """
+    memory blocks allocated in one frame and still alive at its end, tracemalloc must be running
+    """
+    before = tracemalloc.take_snapshot()
+    frame()
+    after = tracemalloc.take_snapshot()
+    return sum(max(0, s.count_diff) for s in after.compare_to(before, 'lineno'))
+
+
+def load_handlers(module_name):
+    """
+    import a module that registers handlers with utils.as_default_handler
+    """
+    importlib.import_module(module_name)
+    return list(utils.default_handlers)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='headless jsonui frame benchmark')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--width', type=int, default=10)
+    parser.add_argument('--mix', type=str, default='int,float,str', help='e.g. int:2,float:1,vec4:1')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--frames', type=int, default=60)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--handlers', type=str, default='lab.test_ui',
+                        help='module registering default handlers')
+    parser.add_argument('--collapsed', action='store_true', help='do not expand tree nodes')
+    parser.add_argument('--out', type=str, default=None, help='write the json result here')
+    parser.add_argument('--max-peak-bytes', type=int, default=None,
+                        help='fail when a steady frame allocates more than this at its peak')
+    parser.add_argument('--max-blocks', type=int, default=None,
+                        help='fail when a steady frame leaves more live blocks than this')
+    parser.add_argument('--profile', action='store_true', help='add per handler times to the result')
+    parser.add_argument('--trace', type=str, default=None, help='write a chrome trace of the timed frames here')
+    args = parser.parse_args(argv)
+
+    headless_context()
+    tree = synthetic_tree(args.depth, args.width, parse_mix(args.mix), args.seed)
+    ui = UI(load_handlers(args.handlers))
+    profiler = ui.set_profiler(Profiler()) if args.profile or args.trace else None
+    result = {
+        'config': {
+            'depth': args.depth, 'width': args.width, 'mix': parse_mix(args.mix),
+            'seed': args.seed, 'nodes': count_nodes(tree), 'handlers': args.handlers,
+            'expanded': not args.collapsed, 'python': sys.version.split()[0],
+            'imgui': imgui.__version__,
+        },
+    }
+    result.update(run_frames(ui, tree, args.frames, args.warmup, expand=not args.collapsed))
+    if profiler is not None:
+        result['profile'] = dict(profiler.report())
+        if args.trace:
+            profiler.export_chrome_trace(args.trace)
+
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, 'w') as fp:
+            fp.write(text)
+    print(text)
+
+    alloc = result['alloc']
+    if args.max_peak_bytes is not None and alloc['peak_bytes'] > args.max_peak_bytes:
+        sys.exit(f'peak allocation {alloc["peak_bytes"]} B per frame exceeds {args.max_peak_bytes} B')
+    if args.max_blocks is not None and alloc['blocks'] > args.max_blocks:
+        sys.exit(f'{alloc["blocks"]} blocks left per frame exceed {args.max_blocks}')
+    return result
+
+
+if __name__ == '__main__':
+    main()
@@ -9,9 +9,8 @@
 
 from comtools.imgui_engine import *
 from comtools.json_caching import *
-from enum import Enum
-from itertools import chain
-from functools import lru_cache
+from jsonui.journal import Journal, apply_patch, escape, join_pointer, resolve_pointer, set_pointer
+import time
 
 
 class NoNoneDict(dict):
@@ -31,6 +30,13 @@ class Window:
     def __init__(self, w, h):
         self.size = [w, h]
         self.glfw_window = None
+        self.loop = FrameLoop()
+
+    def request_redraw(self):
+        """
+        thread safe, wakes the window from idle
+        """
+        self.loop.request_redraw()
 
     def current_size(self):
         import glfw
@@ -41,10 +47,12 @@ class Window:
         impl, self.glfw_window = glfw_imgui_init(*self.size)
 
         while not glfw.window_should_close(self.glfw_window):
-            with glfw_frame(impl, self.glfw_window):
+            with glfw_frame(impl, self.glfw_window, loop=self.loop):
                 if self.refresh:
                     self.refresh()
+        self.loop.close()
         glfw_imgui_shutdown(impl)
+        self.glfw_window = None
 
     def refresh(self):
         pass
@@ -66,55 +74,400 @@ class UI:
             return self.type.__hash__()
 
     class Handling:
+        """
+        one level of UI.stack. the objects are reused by later nodes at the same
+        depth, do not keep them after the handler returned.
+        """
+
+        __slots__ = ('key', 'ref', 'handler', 'segment', 'changed', 'plan')
+
+        def __init__(self, key, ref, handler, segment=None, plan=None):
+            self.set(key, ref, handler, segment, plan)
 
-        def __init__(self, key, ref, handler):
+        def set(self, key, ref, handler, segment=None, plan=None):
             self.key = key
             self.ref = ref
             self.handler = handler
+            self.segment = key if segment is None else segment
+            self.changed = False
+            self.plan = plan
+            return self
+
+    class PlanNode:
+        """
+        the handler chosen for a node of the tree and the shape of the value it was
+        chosen for, children by path segment. see UI.set_plan_cache
+        """
+
+        __slots__ = ('shape', 'handler', 'children')
+
+        def __init__(self):
+            self.shape = None
+            self.handler = None
+            self.children = {}
 
     ANY = Match('any')
 
     def __init__(self, handlers):
-        self.handlers = [h() if isinstance(h, type) else h for h in handlers]
+        self.handlers = []
         self._key_map = {}
         self._value_type_map = {}
-        for h in self.handlers:
-            assert isinstance(h, Handler)
-            tmp = h.register_keys(self)
-            if not isinstance(tmp, (tuple, list)):
-                tmp = [tmp]
-            for k in tmp:
-                if k not in self._key_map:
-                    self._key_map[k] = []
-                self._key_map[k].append(h)
-
-            tmp = h.register_value_types(self)
-            if not isinstance(tmp, (tuple, list)):
-                tmp = [tmp]
-            for v in tmp:
-                if v not in self._value_type_map:
-                    self._value_type_map[v] = []
-                self._value_type_map[v].append(h)
+        self._dispatch_cache = {}
+        self.dispatch_hits = 0
+        self.dispatch_misses = 0
+        self.plan = None
+        self._shape_keys = ()
+        for h in handlers:
+            self.register(h)
 
         self.stack = [self.Handling('$', None, Handler())]
+        self._frames = [self.stack[0]]
         self.current_ref_type = ''
         self.dirty_levels = {0:False}
         self.state = {}
+        self.clip_threshold = 64
+        self.row_height = None
+        self.journal = Journal()
+        self.roots = {}
+        self._replaced_roots = {}
+        self.profiler = None
+        self.filter = None
+        self.plan_hits = 0
+        self.plan_misses = 0
+        self.plan_recompiles = 0
+
+    @staticmethod
+    def _as_list(tmp):
+        if not isinstance(tmp, (tuple, list)):
+            tmp = [tmp]
+        return tmp
+
+    def register(self, handler):
+        """
+        add a handler (class or instance), drops the dispatch cache
+
+        :param handler:
+        :return: the registered handler instance
+        """
+        if isinstance(handler, type):
+            handler = handler()
+        assert isinstance(handler, Handler)
+        self.handlers.append(handler)
+        for k in self._as_list(handler.register_keys(self)):
+            if k not in self._key_map:
+                self._key_map[k] = []
+            self._key_map[k].append(handler)
+        for v in self._as_list(handler.register_value_types(self)):
+            if v not in self._value_type_map:
+                self._value_type_map[v] = []
+            self._value_type_map[v].append(handler)
+        self._dispatch_cache.clear()
+        self._handlers_changed()
+        return handler
+
+    def unregister(self, handler):
+        """
+        remove a handler instance, or every instance of a handler class
 
-    def input(self, key, ref):
-        for h in set(chain(
-                self._key_map[key] if key in self._key_map else [],
-                self._value_type_map[type(ref)] if type(ref) in self._value_type_map else [],
-                self._key_map[UI.ANY] if UI.ANY in self._key_map else [],
-                self._value_type_map[UI.ANY] if UI.ANY in self._value_type_map else [])):
-            if h.can_handle(key, ref, self):
-                self.stack.append(self.Handling(key, ref, h))
-                ref = h.input(key, ref, self)
-                self.stack.pop(-1)
+        :param handler:
+        :return: removed handler instances
+        """
+        removed = [h for h in self.handlers if h is handler or type(h) is handler]
+        for h in removed:
+            self.handlers.remove(h)
+        for m in (self._key_map, self._value_type_map):
+            for k in list(m.keys()):
+                m[k] = [h for h in m[k] if h not in removed]
+                if not m[k]:
+                    del m[k]
+        self._dispatch_cache.clear()
+        self._handlers_changed()
+        return removed
+
+    def _handlers_changed(self):
+        keys = []
+        for h in self.handlers:
+            for k in h.shape_keys or ():
+                if k not in keys:
+                    keys.append(k)
+        self._shape_keys = tuple(keys)
+        if self.plan is not None:
+            self.plan = self.PlanNode()
+
+    def _resolve(self, key, value_type):
+        """
+        candidates ordered by handler priority (higher first), then by how specific
+        the registration is (key, value type, any key, any value type), then by
+        registration order. a value type without handlers of its own falls back to
+        the closest registered base class, e.g. dict subclasses to dict handlers
+        """
+        by_type = ()
+        # bool is an int to python but its own type in json
+        mro = (bool,) if value_type is bool else getattr(value_type, '__mro__', (value_type,))
+        for t in mro:
+            if t in self._value_type_map:
+                by_type = self._value_type_map[t]
                 break
-        return ref
+        order = []
+        for bucket in (self._key_map.get(key, ()),
+                       by_type,
+                       self._key_map.get(UI.ANY, ()),
+                       self._value_type_map.get(UI.ANY, ())):
+            for h in bucket:
+                if h not in order:
+                    order.append(h)
+        order.sort(key=lambda h: -h.priority)
+        return tuple(order)
+
+    def candidates(self, key, value_type):
+        by_key = self._dispatch_cache.get(value_type)
+        if by_key is None:
+            by_key = self._dispatch_cache[value_type] = {}
+        try:
+            found = by_key.get(key)
+        except TypeError:
+            self.dispatch_misses += 1
+            return self._resolve(key, value_type)
+        if found is None:
+            self.dispatch_misses += 1
+            found = by_key[key] = self._resolve(key, value_type)
+        else:
+            self.dispatch_hits += 1
+        return found
+
+    def dispatch_stats(self) -> dict:
+        return {
+            'hits': self.dispatch_hits,
+            'misses': self.dispatch_misses,
+            'entries': sum(len(v) for v in self._dispatch_cache.values()),
+        }
+
+    def input(self, key, ref, segment=None):
+        """
+        :param key: label of the node, what handlers are chosen by
+        :param ref: the value
+        :param segment: path segment of the node in its parent when it differs from
+            key, e.g. the index of a list item
+        :return: the new value
+        """
+        depth = len(self.stack)
+        if depth == 1:
+            if self._replaced_roots:
+                ref = self._replaced_roots.pop(key, ref)
+            self.roots[key] = ref
+            if self.filter is not None:
+                self.open_filtered(join_pointer((key,)))
+        profiler = self.profiler
+        if self.plan is None:
+            node = None
+            for h in self.candidates(key, type(ref)):
+                if h.can_handle(key, ref, self) if profiler is None else self._checked(profiler, h, key, ref):
+                    break
+            else:
+                return ref
+        else:
+            parent = self.plan if depth == 1 else self.stack[-1].plan
+            shape = [k in ref for k in self._shape_keys] if type(ref) is dict else type(ref)
+            node = None
+            if parent is not None:
+                # list items are drawn under their label, which may differ between items
+                children = parent.children
+                seg = key if segment is None else (segment, key)
+                node = children.get(seg)
+                if node is None:
+                    node = children[seg] = self.PlanNode()
+            if node is not None and node.shape == shape and node.handler is not None:
+                self.plan_hits += 1
+                h = node.handler
+            else:
+                h = self._replan(key, ref, node, shape, profiler)
+                if h is None:
+                    return ref
+        if depth < len(self._frames):
+            handling = self._frames[depth].set(key, ref, h, segment, node)
+        else:
+            handling = self.Handling(key, ref, h, segment, node)
+            self._frames.append(handling)
+        self.stack.append(handling)
+        try:
+            new = h.input(key, ref, self) if profiler is None else self._profiled(profiler, h, key, ref)
+            if handling.changed:
+                self.journal.record(self.current_path(), ref, new)
+        finally:
+            # a handler raising does not leave its frame on the stack
+            self.stack.pop()
+            handling.ref = None
+        return new
+
+    def _checked(self, profiler, h, key, ref):
+        t = time.perf_counter_ns()
+        accepted = h.can_handle(key, ref, self)
+        profiler.checked(h, accepted, time.perf_counter_ns() - t)
+        return accepted
+
+    def _profiled(self, profiler, h, key, ref):
+        path = self.current_path()
+        start = profiler.enter()
+        try:
+            return h.input(key, ref, self)
+        finally:
+            profiler.leave(h, path, start)
+
+    def set_profiler(self, profiler=None):
+        """
+        time every handler call with profiler (a jsonui.profiling.Profiler), None to
+        stop. works with the plan cache too, can_handle is only timed where it runs.
+
+        :return: profiler
+        """
+        self.profiler = profiler
+        return profiler
+
+    def set_plan_cache(self, enabled=True):
+        """
+        remember the handler chosen for every node of the tree by its path, and
+        reuse it while the value keeps its shape: its type and, for dicts, which of
+        the shape_keys of the handlers it has. candidates and can_handle are only
+        run again for the nodes whose shape changed, their plans below are dropped.
+
+        only decisions made by handlers declaring shape_keys are kept, see
+        Handler.shape_keys.
+
+        what it gains depends on how much of the tree changes shape per frame rather
+        than on its size: lab/bench_plan.py (the state_ui handlers) runs about 1.4x
+        faster with it from 2k to 100k nodes when 10 values change shape per frame,
+        but 0.9x at 5k nodes when 1000 do. with can_handle checks cheaper than those,
+        the lookup costs about as much as the dispatch it replaces.
+        """
+        self.plan = self.PlanNode() if enabled else None
+
+    def plan_stats(self) -> dict:
+        def count(node):
+            return 1 + sum(count(c) for c in node.children.values())
+        return {
+            'hits': self.plan_hits,
+            'misses': self.plan_misses,
+            'recompiles': self.plan_recompiles,
+            'nodes': count(self.plan) - 1 if self.plan is not None else 0,
+        }
+
+    def _replan(self, key, ref, node, shape, profiler):
+        # a node seen for the first time or with a new shape, resolved like without the plan
+        self.plan_misses += 1
+        h = None
+        cacheable = True
+        for c in self.candidates(key, type(ref)):
+            cacheable = cacheable and c.shape_keys is not None
+            if c.can_handle(key, ref, self) if profiler is None else self._checked(profiler, c, key, ref):
+                h = c
+                break
+        if node is not None:
+            if node.shape is not None and node.shape != shape:
+                self.plan_recompiles += 1
+                node.children.clear()
+            node.shape = shape
+            node.handler = h if cacheable else None
+        return h
+
+    def set_filter(self, f=None):
+        """
+        draw only the nodes of a jsonui.search.Filter, None to draw everything again.
+        handlers going through input_children follow it.
+        """
+        self.filter = f
+
+    def filtered_keys(self):
+        """
+        :return: keys of the children of the current node to draw, None for all
+        """
+        if self.filter is None:
+            return None
+        return self.filter.keys(self.current_path())
+
+    def open_filtered(self, path):
+        """
+        open the tree node of path once when it leads to matches of the filter
+        """
+        f = self.filter
+        if path in f.children and path not in f.opened:
+            f.opened.add(path)
+            imgui.set_next_item_open(True)
+
+    def current_path(self) -> str:
+        """
+        json pointer of the node being handled, starting with the key given to the
+        outermost input, e.g. /state/students/0
+        """
+        return join_pointer(h.segment for h in self.stack[1:])
+
+    def changes(self, since=0) -> list:
+        return self.journal.changes(since)
+
+    def checkpoint(self) -> int:
+        return self.journal.checkpoint()
+
+    def _apply(self, path, value):
+        root, _, rest = path[1:].partition('/')
+        old = resolve_pointer(self.roots, path)
+        if not rest:
+            self._replaced_roots[root] = value
+            self.roots[root] = value
+        else:
+            set_pointer(self.roots, path, value)
+        self.journal.record(path, old, value, undoable=False)
+        self.mark_dirty()
+
+    def apply_patch(self, patch, undoable=False):
+        """
+        apply json patch operations (add, remove, replace) made elsewhere, e.g. by
+        another process. paths start with the key of a root given to input, every
+        operation is recorded in the journal.
+        """
+        for op in patch:
+            path = op['path']
+            root, _, rest = path[1:].partition('/')
+            try:
+                old = resolve_pointer(self.roots, path)
+            except (KeyError, IndexError, ValueError, TypeError):
+                old = None
+            if not rest:
+                if op['op'] == 'remove':
+                    raise ValueError(f'can not remove the root {root}')
+                self._replaced_roots[root] = op['value']
+                self.roots[root] = op['value']
+            else:
+                apply_patch(self.roots, [op])
+            self.journal.record(path, old, op.get('value'), undoable=undoable)
+        if patch:
+            self.mark_dirty()
+
+    def drop_root(self, key):
+        """
+        forget the tree last drawn under key and its plan, so nothing keeps it alive
+        until it is drawn again. the journal is left as it is
+        """
+        self.roots.pop(key, None)
+        self._replaced_roots.pop(key, None)
+        if self.plan is not None:
+            self.plan.children.pop(key, None)
+
+    def undo(self) -> bool:
+        change = self.journal.pop_undo()
+        if change is None:
+            return False
+        self._apply(change.path, change.old)
+        return True
+
+    def redo(self) -> bool:
+        change = self.journal.pop_redo()
+        if change is None:
+            return False
+        self._apply(change.path, change.new)
+        return True
 
     def mark_dirty(self, dirty=True, level=0):
+        if dirty:
+            self.stack[-1].changed = True
         if level not in self.dirty_levels:
             self.dirty_levels[level] = False
         self.dirty_levels[level] = self.dirty_levels[level] or dirty
@@ -125,6 +478,12 @@ class UI:
 
 class Handler:
 
+    priority = 0
+    # None when can_handle looks at more than the key, the path and the type of
+    # the value, else the keys of a dict value whose presence it depends on.
+    # decisions of handlers with shape_keys are kept by UI.set_plan_cache
+    shape_keys = None
+
     def register_keys(self, context: UI) -> list:
         """
         :param: context:
@@ -147,3 +506,41 @@ class Handler:
 
     def input(self, key, ref, context: UI):
         return ref
+
+    def input_children(self, ref, context: UI):
+        """
+        input every child of a dict or list, once there are more than
+        context.clip_threshold of them only the visible rows are handled
+
+        :param ref: dict or list
+        :param context:
+        :return: ref, children written back in place
+        """
+        is_dict = isinstance(ref, dict)
+        if context.filter is not None:
+            keys = context.filtered_keys()
+            if keys is not None:
+                return self._input_filtered(ref, keys, is_dict, context)
+        if len(ref) <= context.clip_threshold:
+            if is_dict:
+                for k, v in ref.items():
+                    ref[k] = context.input(k, v)
+            else:
+                for i, v in enumerate(ref):
+                    ref[i] = context.input(index_id(i), v)
+            return ref
+        for k, v in clipped_items(ref, context.row_height, context.clip_threshold):
+            ref[k] = context.input(k if is_dict else index_id(k), v)
+        return ref
+
+    def _input_filtered(self, ref, keys, is_dict, context: UI):
+        path = context.current_path()
+        rows = ListClipper(len(keys), context.row_height, id(keys)) \
+            if len(keys) > context.clip_threshold else range(len(keys))
+        for i in rows:
+            k = keys[i]
+            if is_dict and k not in ref or not is_dict and not 0 <= k < len(ref):
+                continue
+            context.open_filtered(f'{path}/{escape(k)}')
+            ref[k] = context.input(k if is_dict else index_id(k), ref[k])
+        return ref
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File  : handlers.py
+@Desc  : built in handlers
+"""
+
+from jsonui.context import *
+from comtools.json_caching.arrays import numeric_dtype
+import numpy as np
+import weakref
+import time
+
+
+class _ArrayState:
+
+    def __init__(self):
+        self.page = 0
+        self.histogram = False
+        self.slice = ':'
+        self.value = 0.
+        self.summary = None
+        # the array summary was made from
+        self.source = None
+        self.seen = 0.
+
+
+class ArrayHandler(Handler):
+    """
+    long numeric lists are replaced in the tree by a 1d ndarray, which save_json
+    writes back as a list. only lists of ints or of floats, mixed ones are left to
+    the list handlers. shown as a line plot or histogram, a paged table of the
+    values, and bulk edits (scale, offset, fill, assign) on a slice of it.
+
+    edits never touch an array in place, a changed copy is returned, so snapshots
+    and the undo journal can keep the old one.
+    """
+
+    priority = 1
+    min_length = 8
+    page_size = 1024
+    plot_points = 512
+    table_height = 200
+    # view states of paths not drawn for this long are dropped
+    keep_seconds = 30.
+
+    def __init__(self):
+        self._states = {}
+        self._swept = time.monotonic()
+
+    def register_keys(self, context: UI) -> list:
+        return []
+
+    def register_value_types(self, context: UI) -> list:
+        return [list, np.ndarray]
+
+    def can_handle(self, key, ref, context: UI) -> bool:
+        if isinstance(ref, np.ndarray):
+            return ref.ndim == 1 and ref.dtype.kind in 'iuf'
+        return len(ref) >= self.min_length and numeric_dtype(ref) is not None
+
+    def _state(self, ref, context: UI) -> _ArrayState:
+        """
+        by path, edits return a new array and the page, slice and value stay
+        """
+        now = time.monotonic()
+        if now - self._swept > 1.:
+            self._states = {p: s for p, s in self._states.items() if now - s.seen < self.keep_seconds}
+            self._swept = now
+        path = context.current_path()
+        st = self._states.get(path)
+        if st is None:
+            st = self._states[path] = _ArrayState()
+        st.seen = now
+        if st.source is None or st.source() is not ref:
+            st.summary = None
+            st.source = weakref.ref(ref)
+        return st
+
+    def input(self, key, ref, context: UI):
+        if not isinstance(ref, np.ndarray):
+            # all ints or all floats, the json written back is the same
+            ref = np.array(ref, dtype=numeric_dtype(ref))
+        st = self._state(ref, context)
+        opened = imgui.tree_node(key)
+        imgui.same_line()
+        imgui.text_disabled(f'{ref.dtype} [{len(ref)}]')
+        if opened:
+            self._summary(ref, st)
+            new = self._bulk_edit(ref, st)
+            new = self._table(new if new is not None else ref, st, new is not None)
+            imgui.tree_pop()
+            if new is not None:
+                context.mark_dirty(True)
+                return new
+        return ref
+
+    def _summary(self, ref, st: _ArrayState):
+        if st.summary is None or st.summary[0] != st.histogram:
+            if not len(ref):
+                st.summary = st.histogram, np.zeros(1, np.float32), ''
+            elif st.histogram:
+                counts, _ = np.histogram(ref, bins=min(64, max(1, len(ref))))
+                st.summary = st.histogram, counts.astype(np.float32), ''
+            else:
+                step = -(-len(ref) // self.plot_points)
+                text = f'min {ref.min():.4g}  max {ref.max():.4g}  mean {ref.mean():.4g}'
+                st.summary = st.histogram, np.ascontiguousarray(ref[::step], dtype=np.float32), text
+        _, values, text = st.summary
+        width = imgui.get_content_region_available()[0]
+        if st.histogram:
+            imgui.plot_histogram('##summary', values, graph_size=(width, 80))
+        else:
+            imgui.plot_lines('##summary', values, overlay_text=text, graph_size=(width, 80))
+        _, st.histogram = imgui.checkbox('histogram', st.histogram)
+
+    def _bulk_edit(self, ref, st: _ArrayState):
+        """
+        :return: the edited copy, or None
+        """
+        imgui.push_item_width(120)
+        _, st.slice = imgui.input_text('slice', st.slice, 64)
+        imgui.same_line()
+        _, st.value = imgui.input_float('value', st.value, 0, 0, '%.6g')
+        imgui.pop_item_width()
+        op = None
+        for name in ('scale', 'offset', 'fill'):
+            imgui.same_line()
+            if imgui.small_button(name):
+                op = name
+        if op is None:
+            return None
+        try:
+            sl = parse_slice(st.slice)
+        except ValueError:
+            return None
+        new = ref.copy()
+        view = new[sl]
+        if op == 'scale':
+            view[...] = view * st.value
+        elif op == 'offset':
+            view[...] = view + st.value
+        else:
+            view[...] = st.value
+        st.summary = None
+        return new
+
+    def _table(self, ref, st: _ArrayState, copied):
+        pages = max(1, -(-len(ref) // self.page_size))
+        if pages > 1:
+            _, st.page = imgui.slider_int('page', st.page, 0, pages - 1)
+        st.page = min(max(0, st.page), pages - 1)
+        start = st.page * self.page_size
+        stop = min(len(ref), start + self.page_size)
+
+        new = ref if copied else None
+        imgui.begin_child('values', 0, self.table_height, border=True)
+        is_int = ref.dtype.kind in 'iu'
+        for i in ListClipper(stop - start, imgui.get_frame_height_with_spacing()):
+            i += start
+            with id_scope(i):
+                imgui.text(index_id(i))
+                imgui.same_line(80)
+                if is_int:
+                    c, v = self._input_int(int(ref[i]), ref.dtype)
+                else:
+                    c, v = imgui.input_float('##v', float(ref[i]), 0, 0, '%.6g')
+            if c:
+                if new is None:
+                    new = ref.copy()
+                new[i] = v
+                st.summary = None
+        imgui.end_child()
+        return new
+
+    @staticmethod
+    def _input_int(value, dtype):
+        # input_int is 32 bit, timestamps in ms and the like are edited as text
+        c, text = imgui.input_text('##v', str(value), 32, imgui.INPUT_TEXT_CHARS_DECIMAL)
+        if not c:
+            return False, value
+        try:
+            v = int(text)
+        except ValueError:
+            return False, value
+        info = np.iinfo(dtype)
+        if not info.min <= v <= info.max:
+            return False, value
+        return True, v
+
+
+def parse_slice(text: str):
+    """
+    '10:20', ':', '::2', '5' -> a slice, raises ValueError
+    """
+    parts = [p.strip() for p in text.split(':')]
+    if len(parts) == 1:
+        i = int(parts[0])
+        return slice(i, i + 1 if i != -1 else None)
+    if len(parts) > 3:
+        raise ValueError(text)
+    return slice(*[int(p) if p else None for p in parts])
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File  : journal.py
+@Desc  : edits recorded as json pointer paths with old and new values, undo and redo on top of them
+"""
+
+from collections import deque
+import time
+
+
+def escape(segment) -> str:
+    return str(segment).replace('~', '~0').replace('/', '~1')
+
+
+def unescape(segment: str) -> str:
+    return segment.replace('~1', '/').replace('~0', '~')
+
+
+def join_pointer(segments) -> str:
+    return ''.join('/' + escape(s) for s in segments)
+
+
+def split_pointer(pointer: str) -> list:
+    if not pointer:
+        return []
+    if not pointer.startswith('/'):
+        raise ValueError(f'not a json pointer: {pointer}')
+    return [unescape(s) for s in pointer[1:].split('/')]
+
+
+def _step(container, segment):
+    if isinstance(container, list):
+        return int(segment)
+    if segment not in container:
+        for k in container:
+            if str(k) == segment:
+                return k
+    return segment
+
+
+def resolve_pointer(doc, pointer: str):
+    for s in split_pointer(pointer):
+        doc = doc[_step(doc, s)]
+    return doc
+
+
+def set_pointer(doc, pointer: str, value):
+    """
+    set the value at pointer inside doc, the parent has to exist
+    """
+    segments = split_pointer(pointer)
+    if not segments:
+        raise ValueError('can not replace the document itself')
+    parent = resolve_pointer(doc, join_pointer(segments[:-1]))
+    parent[_step(parent, segments[-1])] = value
+
+
+def overlaps(a: str, b: str) -> bool:
+    """
+    one pointer is the other or one of its ancestors
+    """
+    return a == b or b.startswith(a + '/') or a.startswith(b + '/')
+
+
+def _apply_op(doc, op):
+    """
+    :return: (doc, the operation undoing op)
+    """
+    kind, path = op['op'], op['path']
+    if kind not in ('add', 'remove', 'replace'):
+        raise ValueError(f'unsupported patch operation {kind}')
+    if not path:
+        if kind == 'remove':
+            raise ValueError('can not remove the document itself')
+        return op['value'], {'op': 'replace', 'path': '', 'value': doc}
+    segments = split_pointer(path)
+    parent = resolve_pointer(doc, join_pointer(segments[:-1]))
+    if isinstance(parent, list):
+        last = segments[-1]
+        i = len(parent) if kind == 'add' and last == '-' else int(last)
+        if i < 0 or i > len(parent) or (kind != 'add' and i == len(parent)):
+            raise IndexError(f'{path} out of range')
+        index_path = join_pointer(segments[:-1] + [i])
+        if kind == 'add':
+            parent.insert(i, op['value'])
+            return doc, {'op': 'remove', 'path': index_path}
+        if kind == 'remove':
+            return doc, {'op': 'add', 'path': index_path, 'value': parent.pop(i)}
+        old, parent[i] = parent[i], op['value']
+        return doc, {'op': 'replace', 'path': index_path, 'value': old}
+    key = _step(parent, segments[-1])
+    if kind == 'add':
+        undo = {'op': 'replace', 'path': path, 'value': parent[key]} if key in parent else {'op': 'remove', 'path': path}
+        parent[key] = op['value']
+        return doc, undo
+    if kind == 'remove':
+        return doc, {'op': 'add', 'path': path, 'value': parent.pop(key)}
+    if key not in parent:
+        raise KeyError(path)
+    old, parent[key] = parent[key], op['value']
+    return doc, {'op': 'replace', 'path': path, 'value': old}
+
+
+def apply_patch(doc, patch):
+    """
+    apply json patch operations (add, remove, replace) in place, all of them or,
+    when one fails, none
+
+    :return: doc, or the new document when an operation replaced the root
+    """
+    undo = []
+    try:
+        for op in patch:
+            doc, inverse = _apply_op(doc, op)
+            undo.append(inverse)
+    except (KeyError, IndexError, ValueError, TypeError):
+        for inverse in reversed(undo):
+            doc, _ = _apply_op(doc, inverse)
+        raise
+    return doc
+
+
+class Change:
+
+    __slots__ = ('seq', 'path', 'old', 'new', 'time')
+
+    def __init__(self, seq, path, old, new, t):
+        self.seq = seq
+        self.path = path
+        self.old = old
+        self.new = new
+        self.time = t
+
+    def __repr__(self):
+        return f'Change({self.seq}, {self.path!r}, {self.old!r} -> {self.new!r})'
+
+
+class Journal:
+    """
+    every edit is appended to a bounded log, read with changes(since). edits also go
+    to a bounded undo history, where repeated edits of one path within coalesce
+    seconds (a drag) merge into a single step, until checkpoint() is called.
+    """
+
+    def __init__(self, max_history=256, max_changes=4096, coalesce=0.5):
+        self.coalesce = coalesce
+        self.seq = 0
+        self._log = deque(maxlen=max_changes)
+        self._undo = deque(maxlen=max_history)
+        self._redo = []
+        self._sealed = True
+
+    def record(self, path, old, new, undoable=True):
+        now = time.perf_counter()
+        self.seq += 1
+        self._log.append(Change(self.seq, path, old, new, now))
+        if not undoable:
+            return
+        top = self._undo[-1] if self._undo else None
+        if not self._sealed and top is not None and top.path == path and now - top.time <= self.coalesce:
+            top.new = new
+            top.time = now
+            top.seq = self.seq
+        else:
+            self._undo.append(Change(self.seq, path, old, new, now))
+        self._redo.clear()
+        self._sealed = False
+
+    def checkpoint(self) -> int:
+        """
+        :return: sequence number to pass to changes()
+        """
+        self._sealed = True
+        return self.seq
+
+    def changes(self, since=0) -> list:
+        """
+        edits after the checkpoint since, the oldest ones may have been dropped
+        """
+        if not self._log or since >= self.seq:
+            return []
+        first = self._log[0].seq
+        return list(self._log)[max(0, since + 1 - first):]
+
+    def can_undo(self) -> bool:
+        return bool(self._undo)
+
+    def can_redo(self) -> bool:
+        return bool(self._redo)
+
+    def pop_undo(self):
+        if not self._undo:
+            return None
+        change = self._undo.pop()
+        self._redo.append(change)
+        self._sealed = True
+        return change
+
+    def pop_redo(self):
+        if not self._redo:
+            return None
+        change = self._redo.pop()
+        self._undo.append(change)
+        self._sealed = True
+        return change
+
+    def clear(self):
+        self._log.clear()
+        self._undo.clear()
+        self._redo.clear()
+        self._sealed = True
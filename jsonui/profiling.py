@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File  : profiling.py
+@Desc  : where the time of a frame goes, per handler class and per json pointer path
+
+    profiler = ui.set_profiler(Profiler())
+    ...
+    with profiler.frame():          # optional, frames show up in the trace and the averages
+        ui.input('state', state)
+    profiler.draw()                 # overlay window
+    profiler.export_chrome_trace('trace.json')   # open in chrome://tracing or perfetto
+"""
+
+from comtools.imgui_engine.gui_tools import ListClipper
+from contextlib import contextmanager
+from collections import deque
+import imgui
+import json
+import time
+
+
+class Stat:
+
+    __slots__ = ('count', 'inclusive', 'exclusive', 'rejections', 'check_time', 'handler')
+
+    def __init__(self, handler=''):
+        self.count = 0
+        self.inclusive = 0
+        self.exclusive = 0
+        self.rejections = 0
+        self.check_time = 0
+        self.handler = handler
+
+    def as_dict(self) -> dict:
+        """
+        times in milliseconds
+        """
+        return {
+            'handler': self.handler,
+            'count': self.count,
+            'inclusive_ms': self.inclusive / 1e6,
+            'exclusive_ms': self.exclusive / 1e6,
+            'rejections': self.rejections,
+            'can_handle_ms': self.check_time / 1e6,
+        }
+
+
+class Profiler:
+    """
+    filled by UI.input while set with UI.set_profiler, times are perf_counter_ns.
+    exclusive time is inclusive time minus the inclusive time of the child nodes.
+    per handler class, inclusive time counts nested calls of the same class again.
+    the trace keeps the last max_events handler calls.
+    """
+
+    columns = ('count', 'inclusive_ms', 'exclusive_ms', 'rejections', 'can_handle_ms')
+
+    def __init__(self, max_events=200000, trace=True):
+        self.trace = trace
+        self.handlers = {}
+        self.paths = {}
+        self.events = deque(maxlen=max_events)
+        self.frames = 0
+        self.frame_time = 0
+        self._children = [0]
+        self._origin = time.perf_counter_ns()
+        self._view = {'by_path': False, 'sort': 'exclusive_ms', 'file': 'jsonui_trace.json',
+                      'rows': None, 'sorted': 0.}
+
+    def _stat(self, table, name, handler=''):
+        s = table.get(name)
+        if s is None:
+            s = table[name] = Stat(handler)
+        return s
+
+    def checked(self, handler, accepted, elapsed):
+        s = self._stat(self.handlers, type(handler).__name__)
+        s.check_time += elapsed
+        if not accepted:
+            s.rejections += 1
+
+    def enter(self) -> int:
+        self._children.append(0)
+        return time.perf_counter_ns()
+
+    def leave(self, handler, path, start):
+        elapsed = time.perf_counter_ns() - start
+        children = self._children.pop()
+        self._children[-1] += elapsed
+        name = type(handler).__name__
+        for s in (self._stat(self.handlers, name), self._stat(self.paths, path, name)):
+            s.count += 1
+            s.inclusive += elapsed
+            s.exclusive += elapsed - children
+        if self.trace:
+            self.events.append((name, path, start, elapsed))
+
+    @contextmanager
+    def frame(self):
+        start = time.perf_counter_ns()
+        try:
+            yield self
+        finally:
+            elapsed = time.perf_counter_ns() - start
+            self.frames += 1
+            self.frame_time += elapsed
+            if self.trace:
+                self.events.append(('frame', None, start, elapsed))
+
+    def reset(self):
+        self.handlers.clear()
+        self.paths.clear()
+        self.events.clear()
+        self.frames = 0
+        self.frame_time = 0
+        self._view['rows'] = None
+
+    def report(self, by_path=False, sort='exclusive_ms', limit=None) -> list:
+        """
+        :return: [(name, stat dict)], largest first
+        """
+        table = self.paths if by_path else self.handlers
+        rows = [(k, v.as_dict()) for k, v in table.items()]
+        rows.sort(key=lambda r: -r[1][sort])
+        return rows[:limit] if limit else rows
+
+    def chrome_trace(self) -> dict:
+        """
+        trace event format, complete events with microsecond timestamps
+        """
+        events = []
+        for name, path, start, elapsed in self.events:
+            e = {
+                'name': name, 'cat': 'frame' if path is None else 'handler', 'ph': 'X',
+                'ts': (start - self._origin) / 1e3, 'dur': elapsed / 1e3,
+                'pid': 1, 'tid': 1,
+            }
+            if path is not None:
+                e['args'] = {'path': path}
+            events.append(e)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export_chrome_trace(self, file):
+        with open(file, 'w') as fp:
+            json.dump(self.chrome_trace(), fp)
+
+    def draw(self, title='Profiler'):
+        """
+        overlay window with the report, call it outside of the profiled inputs
+        """
+        view = self._view
+        imgui.begin(title, False)
+        if self.frames:
+            imgui.text(f'{self.frames} frames, {self.frame_time / self.frames / 1e6:.2f} ms per frame')
+        else:
+            imgui.text(f'{sum(s.count for s in self.handlers.values())} handler calls')
+        c, view['by_path'] = imgui.checkbox('by path', view['by_path'])
+        imgui.same_line()
+        _, self.trace = imgui.checkbox('trace', self.trace)
+        imgui.same_line()
+        if imgui.button('reset'):
+            self.reset()
+        imgui.same_line()
+        if imgui.button('export'):
+            self.export_chrome_trace(view['file'])
+        imgui.same_line()
+        imgui.push_item_width(200)
+        _, view['file'] = imgui.input_text('##file', view['file'], 256)
+        imgui.pop_item_width()
+
+        name_width = 320 if view['by_path'] else 160
+        imgui.text('path' if view['by_path'] else 'handler')
+        for i, col in enumerate(self.columns):
+            imgui.same_line(name_width + i * 110)
+            if imgui.selectable(col, view['sort'] == col, width=100)[0]:
+                view['sort'] = col
+                c = True
+        imgui.separator()
+        # sorting every frame would cost more than what is shown
+        now = time.perf_counter()
+        if c or view['rows'] is None or now - view['sorted'] > .5:
+            view['rows'] = self.report(view['by_path'], view['sort'])
+            view['sorted'] = now
+        rows = view['rows']
+        imgui.begin_child('rows', 0, 0)
+        for i in ListClipper(len(rows), imgui.get_text_line_height_with_spacing()):
+            name, stat = rows[i]
+            imgui.text(name)
+            if view['by_path'] and imgui.is_item_hovered():
+                imgui.set_tooltip(stat['handler'])
+            for j, col in enumerate(self.columns):
+                imgui.same_line(name_width + j * 110)
+                v = stat[col]
+                imgui.text(f'{v:.3f}' if isinstance(v, float) else str(v))
+        imgui.end_child()
+        imgui.end()
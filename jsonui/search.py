@@ -0,0 +1,527 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File  : search.py
+@Desc  : substring search over the keys, values and paths of a state tree, and the
+    filter that makes UI.input draw only the matches and their ancestors
+
+    the distinct key names and scalar values are kept with a trigram index, so a
+    query intersects a few sorted arrays instead of walking the tree, and numpy
+    arrays map the matching strings back to the nodes. queries
+    starting with '/' are json pointers. edits recorded by the journal re-index only
+    the subtrees they touched.
+"""
+
+from jsonui.journal import escape, split_pointer, resolve_pointer
+import numpy as np
+import threading
+import logging
+import imgui
+import time
+
+
+def _value_text(v) -> str:
+    if isinstance(v, str):
+        return v.replace('\n', ' ') if '\n' in v else v
+    if v is True:
+        return 'true'
+    if v is False:
+        return 'false'
+    if v is None:
+        return 'null'
+    if isinstance(v, (int, float)):
+        return repr(v)
+    return ''
+
+
+def _grams(data: np.ndarray) -> np.ndarray:
+    """
+    every 3 byte window of data as an int, -1 for the ones across a line break
+    """
+    if len(data) < 3:
+        return np.zeros(0, np.int64)
+    codes = (data[:-2].astype(np.int64) << 16) | (data[1:-1].astype(np.int64) << 8) | data[2:]
+    breaks = data == 0x0a
+    codes[breaks[:-2] | breaks[1:-1] | breaks[2:]] = -1
+    return codes
+
+
+def _unique(a: np.ndarray) -> np.ndarray:
+    """
+    sorted distinct values, np.unique hashes which is slower on large int arrays
+    """
+    a = np.sort(a)
+    if len(a) < 2:
+        return a
+    keep = np.empty(len(a), bool)
+    keep[0] = True
+    np.not_equal(a[1:], a[:-1], out=keep[1:])
+    return a[keep]
+
+
+class _Strings:
+    """
+    distinct strings with ids. seal() puts them as lines of one lowercase utf-8
+    bytes object with a trigram index: the sorted (trigram, line) pairs found in it.
+    strings added after seal() are searched one by one until the next seal.
+    """
+
+    def __init__(self):
+        self.strings = []
+        self.ids = {}
+        self.sealed = 0
+        self._text = b''
+        self._offsets = np.zeros(1, np.int64)
+        self._gram_codes = np.zeros(0, np.int64)
+        self._gram_lines = np.zeros(0, np.int64)
+
+    def id(self, s) -> int:
+        i = self.ids.get(s)
+        if i is None:
+            i = self.ids[s] = len(self.strings)
+            self.strings.append(s)
+        return i
+
+    def seal(self):
+        self.sealed = len(self.strings)
+        self._text = ('\n'.join(self.strings) + '\n').lower().encode('utf-8')
+        data = np.frombuffer(self._text, np.uint8)
+        self._offsets = np.concatenate(([0], np.flatnonzero(data == 0x0a) + 1))
+        codes = _grams(data)
+        lines = np.searchsorted(self._offsets, np.arange(len(codes)), 'right') - 1
+        keep = codes >= 0
+        pairs = _unique((codes[keep] << 32) | lines[keep])
+        self._gram_codes = pairs >> 32
+        self._gram_lines = pairs & 0xffffffff
+
+    def _lines(self, code) -> np.ndarray:
+        lo, hi = np.searchsorted(self._gram_codes, [code, code + 1])
+        return self._gram_lines[lo:hi]
+
+    def find(self, needle: bytes, limit) -> np.ndarray:
+        """
+        :return: ids of the strings containing needle (lowercase), stops after
+            limit of them
+        """
+        text, offsets = self._text, self._offsets
+        found = []
+        if len(needle) >= 3:
+            postings = sorted((self._lines(c) for c in _unique(_grams(np.frombuffer(needle, np.uint8)))), key=len)
+            candidates = postings[0]
+            for p in postings[1:]:
+                if not len(candidates):
+                    break
+                candidates = np.intersect1d(candidates, p, assume_unique=True)
+            if len(needle) == 3:
+                found = candidates[:limit].tolist()
+            else:
+                for i in candidates.tolist():
+                    if text.find(needle, offsets[i], offsets[i + 1]) >= 0:
+                        found.append(i)
+                        if len(found) >= limit:
+                            break
+        else:
+            pos = text.find(needle)
+            while pos >= 0 and len(found) < limit:
+                found.append(pos)
+                pos = text.find(needle, text.find(b'\n', pos) + 1)
+            found = (np.searchsorted(offsets, np.array(found, np.int64), 'right') - 1).tolist()
+        query = needle.decode('utf-8')
+        for i in range(self.sealed, len(self.strings)):
+            if len(found) >= limit:
+                break
+            if query in self.strings[i].lower():
+                found.append(i)
+        return np.array(found, np.int64)
+
+
+class _Postings:
+    """
+    string id -> the entries having it, for the entries there were at build time
+    """
+
+    def __init__(self, ids: np.ndarray, count: int):
+        self.order = np.argsort(ids, kind='stable')
+        self.bounds = np.searchsorted(ids[self.order], np.arange(count + 1))
+        self.size = len(ids)
+
+    def entries(self, ids, limit):
+        out, total = [], 0
+        ids = ids[ids < len(self.bounds) - 1]
+        for i in ids.tolist():
+            part = self.order[self.bounds[i]:self.bounds[i + 1]]
+            if len(part):
+                out.append(part)
+                total += len(part)
+                if total >= limit:
+                    break
+        return out
+
+
+class Filter:
+    """
+    what UI.input shows while filtering. children maps the json pointer of every
+    ancestor of a match to the keys of its children leading to matches, matched
+    nodes and everything below them are shown whole.
+    """
+
+    def __init__(self, query, matched, children, truncated=False):
+        self.query = query
+        self.matched = matched
+        self.children = children
+        self.truncated = truncated
+        self.opened = set()
+
+    def keys(self, path):
+        """
+        :return: keys to show below path, None for all of them
+        """
+        return self.children.get(path)
+
+
+class SearchIndex:
+    """
+    index of the tree under the root key given to UI.input, paths in it start
+    with '/' + root key like the journal's.
+
+    build() walks the tree once (build_async() on a thread), update() re-indexes
+    the paths of journal changes. once the entries added by updates outgrow
+    compact_ratio of the index it is rebuilt.
+    """
+
+    def __init__(self, key='state', compact_ratio=.25):
+        self.key = key
+        self.prefix = '/' + escape(key)
+        self.compact_ratio = compact_ratio
+        self.building = False
+        self.build_time = 0.
+        self.seq = 0
+        self.root = None
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._paths = []
+        self._keys = []
+        self._parents = []
+        self._ends = []
+        self._key_ids = []
+        self._value_ids = []
+        self._key_strings = _Strings()
+        self._value_strings = _Strings()
+        self._postings = None
+        self._alive = np.zeros(0, bool)
+        self._by_path = {}
+        self._added_roots = []
+        self._added = 0
+
+    def __len__(self):
+        return len(self._paths)
+
+    def _walk(self, key, value, path, parent, out, base):
+        """
+        appends the entries of value in depth first order
+
+        :return: index of the entry of value
+        """
+        paths, keys, parents, ends, key_ids, value_ids = out
+        n = len(paths)
+        paths.append(path)
+        keys.append(key)
+        parents.append(parent)
+        ends.append(0)
+        key_ids.append(self._key_strings.id(str(key)))
+        value_ids.append(self._value_strings.id(_value_text(value)))
+        if isinstance(value, dict):
+            for k, v in value.items():
+                self._walk(k, v, f'{path}/{escape(k)}', base + n, out, base)
+        elif isinstance(value, list):
+            for i, v in enumerate(value):
+                self._walk(i, v, f'{path}/{i}', base + n, out, base)
+        ends[n] = base + len(paths)
+        return base + n
+
+    def _add(self, key, value, path, parent):
+        """
+        index the subtree of value as new entries, the old ones are left to the caller
+        """
+        out = [], [], [], [], [], []
+        start = self._walk(key, value, path, parent, out, len(self._paths))
+        paths, keys, parents, ends, key_ids, value_ids = out
+        self._paths.extend(paths)
+        self._keys.extend(keys)
+        self._parents.extend(parents)
+        self._ends.extend(ends)
+        self._key_ids.extend(key_ids)
+        self._value_ids.extend(value_ids)
+        alive = np.ones(len(self._paths), bool)
+        alive[:len(self._alive)] = self._alive
+        self._alive = alive
+        for n, p in enumerate(paths):
+            self._by_path[p] = start + n
+        self._added_roots.append(path)
+        return start
+
+    def build(self, root, seq=0):
+        """
+        :param root: the tree given to UI.input under key
+        :param seq: journal sequence number the tree is at, see update()
+        """
+        t = time.perf_counter()
+        with self._lock:
+            self._reset()
+            self._add(self.key, root, self.prefix, -1)
+            self._key_strings.seal()
+            self._value_strings.seal()
+            self._postings = (_Postings(np.array(self._key_ids, np.int64), len(self._key_strings.strings)),
+                              _Postings(np.array(self._value_ids, np.int64), len(self._value_strings.strings)))
+            self._added_roots = []
+            self._added = 0
+            self.root = root
+            self.seq = seq
+        self.build_time = time.perf_counter() - t
+        return self
+
+    def build_async(self, root, journal, on_done=None):
+        """
+        build on a background thread, edits made meanwhile are applied by the next
+        update(). retried when the tree changed size under it.
+        """
+        def run():
+            for _ in range(3):
+                seq = journal.seq
+                try:
+                    self.build(root, seq)
+                    break
+                except RuntimeError as e:
+                    logging.info(f'tree changed while indexing, again: {e!r}')
+            self.building = False
+            if on_done is not None:
+                on_done()
+
+        self.building = True
+        thread = threading.Thread(target=run, name='jsonui-search-index', daemon=True)
+        thread.start()
+        return thread
+
+    def _kill(self, path):
+        """
+        drop the entries of path and below it
+        """
+        i = self._by_path.pop(path, None)
+        if i is not None:
+            self._alive[i:self._ends[i]] = False
+        # subtrees indexed again after the build are not inside its range
+        inside = path + '/'
+        roots = []
+        for p in self._added_roots:
+            if p.startswith(inside):
+                j = self._by_path.pop(p, None)
+                if j is not None:
+                    self._alive[j:self._ends[j]] = False
+            elif p != path:
+                roots.append(p)
+        self._added_roots = roots
+
+    def update(self, journal, root) -> bool:
+        """
+        re-index the nodes changed in journal since the last build or update
+
+        :param root: the tree under key as it is now
+        :return: True when something changed
+        """
+        if self.building:
+            return False
+        self.root = root
+        changes = journal.changes(self.seq)
+        if not changes:
+            return False
+        if changes[0].seq > self.seq + 1:
+            # the journal dropped changes, they can not be applied one by one
+            self.build_async(root, journal)
+            return True
+        self.seq = changes[-1].seq
+        paths = sorted({c.path for c in changes if c.path == self.prefix or c.path.startswith(self.prefix + '/')},
+                       key=len)
+        done = []
+        for path in paths:
+            if any(path == d or path.startswith(d + '/') for d in done):
+                continue
+            path = self._reindex(path, root)
+            done.append(path)
+        if self._added > self.compact_ratio * max(1, len(self._paths)):
+            self.build_async(root, journal)
+        return bool(done)
+
+    def _reindex(self, path, root):
+        """
+        :return: the path that was indexed again, the parent list of path when it is in one
+        """
+        segments = split_pointer(path)[1:]
+        if not segments:
+            self.build(root, self.seq)
+            return path
+        try:
+            parent_value = resolve_pointer(root, ''.join('/' + escape(s) for s in segments[:-1]))
+        except (KeyError, IndexError, ValueError, TypeError):
+            parent_value = None
+        if isinstance(parent_value, list):
+            # items of a list may have moved, index the whole list again
+            return self._reindex(path[:path.rindex('/')], root)
+        with self._lock:
+            self._kill(path)
+            try:
+                value = resolve_pointer(root, path[len(self.prefix):])
+            except (KeyError, IndexError, ValueError, TypeError):
+                return path
+            parent = self._by_path.get(path[:path.rindex('/')], -1)
+            key = segments[-1]
+            if isinstance(parent_value, dict) and key not in parent_value:
+                key = next((k for k in parent_value if str(k) == key), key)
+            before = len(self._paths)
+            self._add(key, value, path, parent)
+            self._added += len(self._paths) - before
+        return path
+
+    def search(self, query, limit=10000):
+        """
+        case insensitive substring search in key names and scalar values. a query
+        starting with '/' is a json pointer (with or without the root key), whose
+        last segment may be the start of a key
+
+        :return: (entry indices in tree order, True when cut at limit)
+        """
+        if not query:
+            return [], False
+        if query.startswith('/'):
+            return self._search_path(query, limit)
+        needle = query.lower().encode('utf-8')
+        with self._lock:
+            if self._postings is None:
+                return [], False
+            alive = self._alive
+            found, count = [], 0
+            for strings, postings, ids in ((self._key_strings, self._postings[0], self._key_ids),
+                                           (self._value_strings, self._postings[1], self._value_ids)):
+                matched = strings.find(needle, limit + 1)
+                if not len(matched):
+                    continue
+                for part in postings.entries(matched, limit):
+                    found.append(part)
+                    count += len(part)
+                # entries added by updates are not in the postings yet
+                if len(ids) > postings.size:
+                    late = np.flatnonzero(np.isin(np.array(ids[postings.size:], np.int64), matched))
+                    found.append(late + postings.size)
+                    count += len(late)
+                if count >= limit:
+                    break
+        if not found:
+            return [], False
+        hits = _unique(np.concatenate(found))
+        hits = hits[alive[hits]]
+        truncated = len(hits) > limit or count >= limit
+        return hits[:limit].tolist(), truncated
+
+    def _search_path(self, query, limit):
+        path = query.rstrip('/') if query.startswith(self.prefix) else self.prefix + query.rstrip('/')
+        with self._lock:
+            i = self._by_path.get(path)
+            if i is not None:
+                return [i], False
+            parent, _, start = path.rpartition('/')
+            start = start.lower()
+            try:
+                node = resolve_pointer(self.root, parent[len(self.prefix):])
+            except (KeyError, IndexError, ValueError, TypeError):
+                return [], False
+            if not parent.startswith(self.prefix) or not isinstance(node, (dict, list)):
+                return [], False
+            hits = []
+            for k in (node if isinstance(node, dict) else range(len(node))):
+                if str(k).lower().startswith(start):
+                    j = self._by_path.get(f'{parent}/{escape(k)}')
+                    if j is not None:
+                        hits.append(j)
+                        if len(hits) > limit:
+                            return hits[:limit], True
+        return hits, False
+
+    def filter(self, query, limit=10000) -> Filter:
+        """
+        :return: Filter of the matches and their ancestors, for UI.set_filter
+        """
+        hits, truncated = self.search(query, limit)
+        paths, keys, parents = self._paths, self._keys, self._parents
+        matched = set()
+        children = {self.prefix: []}
+        seen = set()
+        for i in hits:
+            matched.add(paths[i])
+            child = i
+            parent = parents[i]
+            while parent >= 0 and child not in seen:
+                seen.add(child)
+                below = children.get(paths[parent])
+                if below is None:
+                    below = children[paths[parent]] = []
+                below.append(keys[child])
+                child = parent
+                parent = parents[parent]
+        # a matched ancestor of another match is shown whole
+        for p in matched:
+            children.pop(p, None)
+        return Filter(query, matched, children, truncated)
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._paths),
+            'alive': int(self._alive.sum()),
+            'keys': len(self._key_strings.strings),
+            'values': len(self._value_strings.strings),
+            'added': self._added,
+            'build_time': self.build_time,
+        }
+
+
+class SearchBox:
+    """
+    filter box over a UI, keeps the index up to date from the journal
+
+        box = SearchBox(ui, 'state')
+        ... each frame, before ui.input('state', state):
+        box.draw(state)
+    """
+
+    def __init__(self, ui, key='state', limit=2000):
+        self.ui = ui
+        self.index = SearchIndex(key)
+        self.limit = limit
+        self.text = ''
+        self.last_query_time = 0.
+        self._started = False
+
+    def draw(self, root):
+        if not self._started:
+            self._started = True
+            self.index.build_async(root, self.ui.journal)
+        changed, self.text = imgui.input_text('filter', self.text, 256)
+        if self.index.update(self.ui.journal, root) and self.text:
+            changed = True
+        if changed:
+            self.apply()
+        imgui.same_line()
+        f = self.ui.filter
+        if self.index.building:
+            imgui.text_disabled('indexing...')
+        elif f is not None:
+            imgui.text_disabled(f'{len(f.matched)}{"+" if f.truncated else ""} matches  '
+                                f'{self.last_query_time * 1000:.1f} ms')
+
+    def apply(self):
+        if not self.text or self.index.building:
+            self.ui.set_filter(None)
+            return
+        t = time.perf_counter()
+        self.ui.set_filter(self.index.filter(self.text, self.limit))
+        self.last_query_time = time.perf_counter() - t
@@ -0,0 +1,480 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File  : sync.py
+@Desc  : one json state shared by several windows and scripts through a local server
+
+    the server holds the document, clients subscribe to json pointer paths and send
+    json patch operations. every accepted patch makes a new version, a patch based
+    on an older version is refused when other clients changed one of its paths since.
+
+    messages are json lines:
+        {"op": "subscribe", "id": 1, "path": "/students"}   -> {"id": 1, "ok": true, "version": 3, "value": ...}
+        {"op": "get", "id": 2, "path": "/students/0"}       -> {"id": 2, "ok": true, "version": 3, "value": ...}
+        {"op": "patch", "id": 3, "base": 3, "patch": [...]} -> {"id": 3, "ok": true, "version": 4}
+                                                            or {"id": 3, "ok": false, "conflicts": [...], "version": 5}
+        pushed to subscribers: {"op": "patch", "version": 4, "patch": [...]}
+
+    python -m jsonui.sync --unix /tmp/state.sock --state state.json
+"""
+
+from comtools.json_caching import _json_default
+from jsonui.journal import apply_patch, join_pointer, overlaps, resolve_pointer, split_pointer
+from collections import deque
+import concurrent.futures
+import threading
+import asyncio
+import logging
+import argparse
+import queue
+import json
+
+
+_LINE_LIMIT = 1 << 30
+
+
+def _encode(msg) -> bytes:
+    # numpy arrays of ArrayHandler go as lists
+    return json.dumps(msg, default=_json_default).encode() + b'\n'
+
+
+class _Peer:
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.paths = []
+
+
+class SyncServer:
+    """
+    serves doc over a unix socket or localhost tcp, see the module doc for the protocol.
+    the last history versions are kept for conflict checks, patches based on older
+    versions are refused as stale.
+    """
+
+    def __init__(self, doc=None, history=4096):
+        self.doc = {} if doc is None else doc
+        self.version = 0
+        self.patches = 0
+        self.conflicts = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._log = deque(maxlen=history)
+        self._peers = set()
+        self._server = None
+
+    async def start_unix(self, path):
+        self._server = await asyncio.start_unix_server(self._serve, path, limit=_LINE_LIMIT)
+        return self._server
+
+    async def start_tcp(self, host='127.0.0.1', port=0):
+        self._server = await asyncio.start_server(self._serve, host, port, limit=_LINE_LIMIT)
+        return self._server
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for peer in list(self._peers):
+            peer.writer.close()
+
+    async def _send(self, peer, msg):
+        data = _encode(msg)
+        self.bytes_out += len(data)
+        peer.writer.write(data)
+        await peer.writer.drain()
+
+    async def _serve(self, reader, writer):
+        peer = _Peer(writer)
+        self._peers.add(peer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.bytes_in += len(line)
+                msg = None
+                try:
+                    msg = json.loads(line)
+                    await self._handle(peer, msg)
+                except (ValueError, KeyError, IndexError, TypeError) as e:
+                    await self._send(peer, {'id': msg.get('id') if isinstance(msg, dict) else None,
+                                            'ok': False, 'error': repr(e), 'version': self.version})
+        except ConnectionError:
+            pass
+        finally:
+            self._peers.discard(peer)
+            writer.close()
+
+    async def _handle(self, peer, msg):
+        op = msg['op']
+        if op == 'subscribe':
+            split_pointer(msg['path'])
+            peer.paths.append(msg['path'])
+            await self._send(peer, self._value_reply(msg))
+        elif op == 'unsubscribe':
+            peer.paths = [p for p in peer.paths if p != msg['path']]
+            await self._send(peer, {'id': msg['id'], 'ok': True, 'version': self.version})
+        elif op == 'get':
+            await self._send(peer, self._value_reply(msg))
+        elif op == 'patch':
+            await self._patch(peer, msg)
+        else:
+            raise ValueError(f'unknown message {op}')
+
+    def _value_reply(self, msg):
+        try:
+            value, found = resolve_pointer(self.doc, msg['path']), True
+        except (KeyError, IndexError, ValueError, TypeError):
+            value, found = None, False
+        return {'id': msg['id'], 'ok': True, 'version': self.version, 'found': found, 'value': value}
+
+    def conflicting(self, peer, base, paths) -> list:
+        """
+        paths changed by other clients after version base, all of them when base is too old
+        """
+        if base >= self.version:
+            return []
+        if not self._log or self._log[0][0] > base + 1:
+            return list(paths)
+        found = []
+        for version, who, changed in reversed(self._log):
+            if version <= base:
+                break
+            if who is peer:
+                continue
+            for p in paths:
+                if p not in found and any(overlaps(p, c) for c in changed):
+                    found.append(p)
+        return found
+
+    async def _patch(self, peer, msg):
+        patch = msg['patch']
+        paths = [op['path'] for op in patch]
+        conflicts = self.conflicting(peer, msg.get('base', self.version), paths)
+        if conflicts:
+            self.conflicts += 1
+            await self._send(peer, {'id': msg['id'], 'ok': False, 'conflicts': conflicts, 'version': self.version})
+            return
+        self.doc = apply_patch(self.doc, patch)
+        self.version += 1
+        self.patches += 1
+        self._log.append((self.version, peer, paths))
+        await self._send(peer, {'id': msg['id'], 'ok': True, 'version': self.version})
+        for other in list(self._peers):
+            if other is peer or not other.paths:
+                continue
+            ops = self._visible(other.paths, patch)
+            if ops:
+                try:
+                    await self._send(other, {'op': 'patch', 'version': self.version, 'patch': ops})
+                except ConnectionError:
+                    self._peers.discard(other)
+
+    def _visible(self, subscribed, patch) -> list:
+        """
+        the operations a subscriber of subscribed paths gets, an operation on an
+        ancestor of a subscribed path becomes a replace (or remove) of that path
+        """
+        ops, refreshed = [], []
+        for op in patch:
+            path = op['path']
+            for s in subscribed:
+                if path == s or path.startswith(s + '/'):
+                    ops.append(op)
+                    break
+                if overlaps(path, s) and s not in refreshed:
+                    refreshed.append(s)
+        for s in refreshed:
+            try:
+                ops.append({'op': 'replace', 'path': s, 'value': resolve_pointer(self.doc, s)})
+            except (KeyError, IndexError, ValueError, TypeError):
+                ops.append({'op': 'remove', 'path': s})
+        return ops
+
+    def stats(self) -> dict:
+        return {
+            'version': self.version,
+            'clients': len(self._peers),
+            'patches': self.patches,
+            'conflicts': self.conflicts,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+        }
+
+
+class SyncClient:
+    """
+    asyncio client of a SyncServer. on_patch(version, patch) is called for every
+    patch pushed to the subscriptions, from the event loop.
+    """
+
+    def __init__(self, on_patch=None):
+        self.on_patch = on_patch
+        self.version = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._reader = None
+        self._writer = None
+        self._task = None
+        self._next_id = 0
+        self._waiting = {}
+
+    async def connect_unix(self, path):
+        self._reader, self._writer = await asyncio.open_unix_connection(path, limit=_LINE_LIMIT)
+        self._task = asyncio.ensure_future(self._read())
+        return self
+
+    async def connect_tcp(self, host='127.0.0.1', port=0):
+        self._reader, self._writer = await asyncio.open_connection(host, port, limit=_LINE_LIMIT)
+        self._task = asyncio.ensure_future(self._read())
+        return self
+
+    async def _read(self):
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    break
+                self.bytes_in += len(line)
+                msg = json.loads(line)
+                self.version = max(self.version, msg.get('version', 0))
+                future = self._waiting.pop(msg.get('id'), None)
+                if future is not None:
+                    future.set_result(msg)
+                elif msg.get('op') == 'patch' and self.on_patch is not None:
+                    self.on_patch(msg['version'], msg['patch'])
+        finally:
+            for future in self._waiting.values():
+                if not future.done():
+                    future.set_exception(ConnectionError('sync server went away'))
+            self._waiting.clear()
+
+    async def request(self, msg) -> dict:
+        self._next_id += 1
+        msg['id'] = self._next_id
+        # raises before anything waits for a reply that never comes
+        data = _encode(msg)
+        future = self._waiting[self._next_id] = asyncio.get_running_loop().create_future()
+        self.bytes_out += len(data)
+        self._writer.write(data)
+        await self._writer.drain()
+        return await future
+
+    async def subscribe(self, path=''):
+        """
+        :return: the reply, its value is the current value at path
+        """
+        return await self.request({'op': 'subscribe', 'path': path})
+
+    async def unsubscribe(self, path=''):
+        return await self.request({'op': 'unsubscribe', 'path': path})
+
+    async def get(self, path=''):
+        return await self.request({'op': 'get', 'path': path})
+
+    async def patch(self, patch, base=None):
+        """
+        :param base: version the patch was made on, default the newest seen
+        :return: the reply, ok False with the conflicting paths when refused
+        """
+        return await self.request({'op': 'patch', 'patch': patch,
+                                   'base': self.version if base is None else base})
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+def _strip(path, prefix):
+    return path[len(prefix):]
+
+
+class UISync:
+    """
+    keeps the root key of a jsonui UI in sync with a SyncServer. the client runs
+    on its own thread, update() is called once per frame on the render thread: it
+    sends the edits the journal recorded since the last call and applies what
+    other clients changed. a refused edit is replaced by the server's value.
+
+        sync = UISync(ui, 'state', unix='/tmp/state.sock')
+        state = sync.start()
+        ... each frame:
+        sync.update()
+        state = ui.input('state', state)
+    """
+
+    def __init__(self, ui, key='state', unix=None, host='127.0.0.1', port=None, paths=('',)):
+        self.ui = ui
+        self.key = key
+        self.unix = unix
+        self.host = host
+        self.port = port
+        self.paths = list(paths)
+        self.applied_version = 0
+        self.sent = 0
+        self.received = 0
+        self.conflicts = 0
+        self.client = SyncClient(self._on_patch)
+        self._prefix = '/' + key
+        self._incoming = queue.Queue()
+        self._seen = ui.journal.seq
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='jsonui-sync', daemon=True)
+
+    def _call(self, coroutine, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result(timeout)
+
+    def start(self, timeout=5.):
+        """
+        connect and subscribe
+
+        :return: the state to give to UI.input, dicts created up to the subscribed paths
+        """
+        self._thread.start()
+        if self.unix is not None:
+            self._call(self.client.connect_unix(self.unix), timeout)
+        else:
+            self._call(self.client.connect_tcp(self.host, self.port), timeout)
+        state = {}
+        for path in self.paths:
+            reply = self._call(self.client.subscribe(path), timeout)
+            self.applied_version = max(self.applied_version, reply['version'])
+            if not path:
+                state = reply['value']
+                continue
+            segments = split_pointer(path)
+            parent = state
+            for s in segments[:-1]:
+                parent = parent.setdefault(s, {})
+            parent[segments[-1]] = reply['value']
+        self._seen = self.ui.journal.seq
+        return state
+
+    def _on_patch(self, version, patch):
+        self._incoming.put((version, patch))
+
+    def _op(self, path) -> str:
+        # add sets a member whether the server has it or not, in lists it would insert
+        segments = split_pointer(path)
+        if not segments:
+            return 'replace'
+        try:
+            parent = resolve_pointer(self.ui.roots, join_pointer(segments[:-1]))
+        except (KeyError, IndexError, ValueError, TypeError):
+            return 'replace'
+        return 'add' if isinstance(parent, dict) else 'replace'
+
+    def _pending_edits(self) -> list:
+        latest = {}
+        for change in self.ui.journal.changes(self._seen):
+            path = change.path
+            if path == self._prefix or path.startswith(self._prefix + '/'):
+                latest[path] = change.new
+        return [{'op': self._op(p), 'path': _strip(p, self._prefix), 'value': v} for p, v in latest.items()]
+
+    def _sent(self, future, paths):
+        try:
+            reply = future.result()
+        except Exception as e:
+            # the edit did not get through, the server values replace it
+            logging.warning(f'sync failed, taking the server values: {e!r}')
+            reply = {'ok': False, 'conflicts': paths}
+        if reply.get('ok'):
+            return
+        self.conflicts += 1
+        if 'error' in reply:
+            # e.g. an index past the end or a missing parent, the parents are fetched again
+            logging.warning(f'sync refused: {reply["error"]}, taking the server values')
+            paths = list(dict.fromkeys(join_pointer(split_pointer(p)[:-1]) for p in paths))
+        else:
+            logging.warning(f'sync conflicts at {reply.get("conflicts")}, taking the server values')
+            paths = reply.get('conflicts') or paths
+        asyncio.run_coroutine_threadsafe(self._refetch(paths), self._loop)
+
+    async def _refetch(self, paths):
+        ops, version = [], 0
+        try:
+            for path in paths:
+                reply = await self.client.get(path)
+                version = reply['version']
+                if reply['found']:
+                    ops.append({'op': 'replace', 'path': path, 'value': reply['value']})
+                elif path:
+                    ops.append({'op': 'remove', 'path': path})
+        except (ConnectionError, concurrent.futures.CancelledError) as e:
+            logging.warning(f'sync refetch failed: {e!r}')
+            return
+        if ops:
+            self._incoming.put((version, ops))
+
+    def update(self):
+        """
+        call once per frame on the render thread, before UI.input of the synced key
+        """
+        edits = self._pending_edits()
+        if edits:
+            self.sent += 1
+            future = asyncio.run_coroutine_threadsafe(self.client.patch(edits, self.applied_version), self._loop)
+            paths = [op['path'] for op in edits]
+            future.add_done_callback(lambda f: self._sent(f, paths))
+        if self.key in self.ui.roots:
+            while True:
+                try:
+                    version, patch = self._incoming.get_nowait()
+                except queue.Empty:
+                    break
+                self.received += 1
+                try:
+                    self.ui.apply_patch([dict(op, path=self._prefix + op['path']) for op in patch])
+                except (KeyError, IndexError, ValueError, TypeError) as e:
+                    logging.warning(f'could not apply a synced patch: {e!r}')
+                self.applied_version = max(self.applied_version, version)
+        self._seen = self.ui.journal.seq
+
+    def close(self):
+        if self._thread.is_alive():
+            self._call(self.client.close(), 5.)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+
+    def stats(self) -> dict:
+        return {
+            'version': self.applied_version,
+            'sent': self.sent,
+            'received': self.received,
+            'conflicts': self.conflicts,
+            'bytes_in': self.client.bytes_in,
+            'bytes_out': self.client.bytes_out,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='serve a json state to jsonui sync clients')
+    parser.add_argument('--unix', type=str, default=None, help='unix socket path')
+    parser.add_argument('--port', type=int, default=8765, help='localhost tcp port, when no --unix')
+    parser.add_argument('--state', type=str, default=None, help='json file to start from')
+    args = parser.parse_args(argv)
+
+    doc = {}
+    if args.state:
+        with open(args.state) as fp:
+            doc = json.load(fp)
+    server = SyncServer(doc)
+
+    async def serve():
+        if args.unix:
+            s = await server.start_unix(args.unix)
+        else:
+            s = await server.start_tcp('127.0.0.1', args.port)
+        logging.warning(f'serving on {args.unix or args.port}')
+        async with s:
+            await s.serve_forever()
+
+    asyncio.run(serve())
+
+
+if __name__ == '__main__':
+    main()
@@ -8,27 +8,14 @@
 """
 
 from jsonui.context import *
+from comtools.imgui_engine.gui_tools import label_wrap
 
 
 default_handlers = []
 
 
-@contextmanager
-def label_wrap(label, label_width_percent=0.4):
-    imgui.push_id(label)
-    imgui.columns(2, None, False)
-    w = imgui.get_window_content_region_width() * label_width_percent - imgui.get_cursor_pos()[0]
-    imgui.set_column_width(0, w)
-    imgui.text(label)
-    imgui.same_line()
-    imgui.next_column()
-    yield None
-    imgui.pop_id()
-    imgui.columns(1, None, False)
-
-
-@contextmanager
 def as_default_handler(handler_class):
     default_handlers.append(handler_class)
+    return handler_class
 
 
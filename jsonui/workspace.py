@@ -0,0 +1,351 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File  : workspace.py
+@Desc  : many json files open at once as tabs, each with its own UI. files are
+    parsed on a worker pool while the window is already drawing, documents that
+    were not shown for the longest time are unloaded when the loaded ones go over
+    max_loaded_bytes, and parsed again when their tab is selected.
+
+    ws = Workspace(handlers, workers=4, max_loaded_bytes=512 << 20)
+    for file in files:
+        ws.open(file)
+    WorkspaceWindow(ws, 1280, 800).show()
+"""
+
+from comtools.imgui_engine.gui_tools import imgui, id_scope
+from comtools.json_caching import save_json
+from comtools.json_caching.codec import JsonCodec
+from jsonui.context import Window, UI
+import logging
+import time
+import os
+
+
+def load_document(file):
+    """
+    the default loader, orjson when installed and compressed files are read too
+    """
+    return JsonCodec().load(file)
+
+
+class Document:
+    """
+    a file opened in a Workspace. state is 'unloaded', 'loading', 'loaded' or
+    'failed', data is the tree while it is loaded.
+    """
+
+    def __init__(self, file, ui: UI):
+        self.file = file
+        self.key = os.path.basename(file)
+        self.ui = ui
+        self.data = None
+        self.state = 'unloaded'
+        self.error = None
+        # size of the file when it was queued, what max_loaded_bytes counts
+        self.size = 0
+        self.loads = 0
+        self.load_time = 0.
+        self.last_used = 0.
+        self._future = None
+        self._started = 0.
+        self._saved_seq = 0
+
+    @property
+    def dirty(self) -> bool:
+        """
+        edited since it was loaded or saved, never unloaded then
+        """
+        return self.ui.journal.seq != self._saved_seq
+
+
+class Workspace:
+    """
+    the documents and the pool parsing them. poll() installs finished loads and
+    applies the memory limit, call it once per frame from the drawing thread, the
+    trees are only touched there.
+    """
+
+    def __init__(self, handlers, workers=None, processes=False, max_loaded_bytes=None,
+                 loader=load_document, saver=save_json, setup=None, on_loaded=None):
+        """
+        :param handlers: for the UI of every document, pass classes so each UI gets
+            its own instances
+        :param workers: size of the pool, None for the executor default
+        :param processes: parse in worker processes instead of threads. parsing holds
+            the GIL, so threads keep the window responsive but parse one file at a
+            time, processes parse in parallel but pickle the trees back. loader
+            must be picklable then, lazy trees (load_lazy_json) can not be sent
+        :param max_loaded_bytes: limit on the summed file sizes of the loaded
+            documents, None for no limit. the trees take several times that in memory
+        :param loader: file -> tree
+        :param saver: (tree, file), save_lazy_json goes with load_lazy_json
+        :param setup: called with the UI of every new document, e.g. to set a plan cache
+        :param on_loaded: called from a worker when a load finished, e.g.
+            Window.request_redraw
+        """
+        self.handlers = list(handlers)
+        self.workers = workers
+        self.processes = processes
+        self.max_loaded_bytes = max_loaded_bytes
+        self.loader = loader
+        self.saver = saver
+        self.setup = setup
+        self.on_loaded = on_loaded
+        self.documents = {}
+        self.active = None
+        self.unloads = 0
+        self._pool = None
+
+    def _executor(self):
+        if self._pool is None:
+            if self.processes:
+                from concurrent.futures import ProcessPoolExecutor
+                self._pool = ProcessPoolExecutor(self.workers)
+            else:
+                from concurrent.futures import ThreadPoolExecutor
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='jsonui-workspace')
+        return self._pool
+
+    def open(self, file, load=True) -> Document:
+        """
+        add a tab for file, the opened document when it is open already
+
+        :param load: start parsing it now if it fits in max_loaded_bytes, else
+            when its tab is first selected
+        """
+        file = os.path.abspath(file)
+        doc = self.documents.get(file)
+        if doc is None:
+            ui = UI(self.handlers)
+            if self.setup is not None:
+                self.setup(ui)
+            doc = self.documents[file] = Document(file, ui)
+            if self.active is None:
+                self.active = file
+        if load and doc.state == 'unloaded' and self._fits(file):
+            self.load(doc)
+        return doc
+
+    def _fits(self, file) -> bool:
+        if self.max_loaded_bytes is None:
+            return True
+        try:
+            size = os.path.getsize(file)
+        except OSError:
+            return True
+        return self.loaded_bytes() + size <= self.max_loaded_bytes
+
+    def close(self, file):
+        """
+        drop the document, unsaved edits are lost
+        """
+        doc = self.documents.pop(os.path.abspath(file), None)
+        if doc is None:
+            return
+        if doc._future is not None:
+            doc._future.cancel()
+            doc._future = None
+        self._drop(doc)
+        if self.active == doc.file:
+            self.active = next(iter(self.documents), None)
+
+    def load(self, doc: Document):
+        """
+        queue the parsing of doc unless it is loaded or loading
+        """
+        if doc.state in ('loaded', 'loading'):
+            return
+        doc.state = 'loading'
+        doc.error = None
+        try:
+            doc.size = os.path.getsize(doc.file)
+        except OSError:
+            doc.size = 0
+        doc._started = time.perf_counter()
+        doc._future = self._executor().submit(self.loader, doc.file)
+        if self.on_loaded is not None:
+            doc._future.add_done_callback(lambda _: self.on_loaded())
+
+    def poll(self) -> bool:
+        """
+        install the finished loads and unload documents over the limit
+
+        :return: True when a document was loaded or failed to
+        """
+        changed = False
+        for doc in self.documents.values():
+            if doc.state == 'loading' and doc._future.done():
+                self._install(doc)
+                changed = True
+        if self.max_loaded_bytes is not None:
+            self._apply_limit()
+        return changed
+
+    def _install(self, doc: Document):
+        future, doc._future = doc._future, None
+        try:
+            data = future.result()
+        except Exception as e:
+            doc.state = 'failed'
+            doc.error = repr(e)
+            logging.warning(f'can not load {doc.file}: {e!r}')
+            return
+        doc.data = data
+        doc.state = 'loaded'
+        doc.loads += 1
+        doc.load_time = time.perf_counter() - doc._started
+        doc.last_used = time.perf_counter()
+        # edits of the tree read before are not undoable on this one
+        doc.ui.journal.clear()
+        doc._saved_seq = doc.ui.journal.checkpoint()
+
+    def _drop(self, doc: Document):
+        doc.data = None
+        doc.state = 'unloaded'
+        doc.ui.drop_root(doc.key)
+        doc.ui.journal.clear()
+        doc._saved_seq = doc.ui.journal.checkpoint()
+
+    def unload(self, doc: Document) -> bool:
+        """
+        free the tree of doc, it is parsed again from the file when it is next shown
+
+        :return: False when it is not loaded or has unsaved edits
+        """
+        if doc.state != 'loaded' or doc.dirty:
+            return False
+        self._drop(doc)
+        self.unloads += 1
+        return True
+
+    def loaded_bytes(self) -> int:
+        """
+        file sizes of the loaded documents and of the ones being loaded
+        """
+        return sum(d.size for d in self.documents.values() if d.state in ('loaded', 'loading'))
+
+    def _apply_limit(self):
+        total = self.loaded_bytes()
+        if total <= self.max_loaded_bytes:
+            return
+        # least recently shown first, the active one and edited ones are kept
+        for doc in sorted(self.documents.values(), key=lambda d: d.last_used):
+            if total <= self.max_loaded_bytes:
+                break
+            if doc.file != self.active:
+                size = doc.size
+                if self.unload(doc):
+                    total -= size
+
+    def save(self, doc: Document):
+        if doc.state != 'loaded':
+            return
+        self.saver(doc.data, doc.file)
+        doc.size = os.path.getsize(doc.file)
+        doc._saved_seq = doc.ui.journal.checkpoint()
+
+    def input(self, doc: Document):
+        """
+        draw doc with its UI, a document that is not loaded is queued instead
+        """
+        doc.last_used = time.perf_counter()
+        if doc.state == 'loaded':
+            doc.data = doc.ui.input(doc.key, doc.data)
+        elif doc.state == 'unloaded':
+            self.load(doc)
+
+    def stats(self) -> dict:
+        states = {}
+        for doc in self.documents.values():
+            states[doc.state] = states.get(doc.state, 0) + 1
+        return {
+            'documents': len(self.documents),
+            'loaded_bytes': self.loaded_bytes(),
+            'max_loaded_bytes': self.max_loaded_bytes,
+            'loads': sum(d.loads for d in self.documents.values()),
+            'unloads': self.unloads,
+            **states,
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+class WorkspaceWindow(Window):
+    """
+    a tab per document of a Workspace, with a path box to open more
+    """
+
+    def __init__(self, workspace: Workspace, w, h):
+        super().__init__(w, h)
+        self.workspace = workspace
+        self.path = ''
+        self._selected = None
+        workspace.on_loaded = self._loaded
+
+    def _loaded(self):
+        # finished loads wake the window from idle, once it is shown
+        if self.glfw_window is not None:
+            self.request_redraw()
+
+    def refresh(self):
+        ws = self.workspace
+        ws.poll()
+        imgui.set_next_window_position(0, 0)
+        imgui.set_next_window_size(*imgui.get_io().display_size)
+        imgui.begin('Workspace', False, imgui.WINDOW_NO_TITLE_BAR | imgui.WINDOW_NO_MOVE |
+                    imgui.WINDOW_NO_RESIZE | imgui.WINDOW_NO_COLLAPSE)
+        self.draw_toolbar()
+        if imgui.begin_tab_bar('documents'):
+            # ws.active set by code since the last frame selects its tab
+            select = ws.active if ws.active != self._selected else None
+            for doc in list(ws.documents.values()):
+                label = f'{doc.key}{" *" if doc.dirty else ""}##{doc.file}'
+                flags = imgui.TAB_ITEM_SET_SELECTED if doc.file == select else 0
+                selected, opened = imgui.begin_tab_item(label, True, flags)
+                if selected:
+                    ws.active = self._selected = doc.file
+                    with id_scope(doc.file):
+                        self.draw_document(doc)
+                    imgui.end_tab_item()
+                if not opened:
+                    ws.close(doc.file)
+            imgui.end_tab_bar()
+        imgui.end()
+
+    def draw_toolbar(self):
+        ws = self.workspace
+        _, self.path = imgui.input_text('##path', self.path, 4096)
+        imgui.same_line()
+        if imgui.button('open') and self.path:
+            ws.active = ws.open(self.path).file
+            self.path = ''
+        imgui.same_line()
+        stats = ws.stats()
+        limit = ws.max_loaded_bytes
+        imgui.text(f'{stats.get("loaded", 0)}/{stats["documents"]} loaded, '
+                   f'{stats["loaded_bytes"] / 2 ** 20:.1f}'
+                   f'{f" / {limit / 2 ** 20:.0f}" if limit is not None else ""} MB, '
+                   f'{stats.get("loading", 0)} loading, {stats["unloads"]} unloads')
+
+    def draw_document(self, doc: Document):
+        ws = self.workspace
+        if doc.state == 'failed':
+            imgui.text_colored(doc.error, 1, .3, .3)
+            if imgui.button('retry'):
+                ws.load(doc)
+            return
+        if doc.state != 'loaded':
+            imgui.text(f'loading {doc.file} ...')
+            ws.input(doc)
+            return
+        imgui.text(f'{doc.file}  {doc.size / 2 ** 20:.1f} MB, parsed in {doc.load_time * 1000:.0f} ms')
+        imgui.same_line()
+        if imgui.button('save'):
+            ws.save(doc)
+        imgui.begin_child('tree')
+        ws.input(doc)
+        imgui.end_child()
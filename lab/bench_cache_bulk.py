@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File  : bench_cache_bulk.py
+@Desc  : JsonCache with many keys, flat against sharded folders: bulk writes,
+    listing keys, reading everything key by key and through get_many
+
+    python -m lab.bench_cache_bulk --sizes 10000 100000 1000000
+"""
+
+from comtools.json_caching import JsonCache
+import argparse
+import tempfile
+import random
+import time
+
+
+def timed(fn):
+    t = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - t, result
+
+
+def bench(folder, n, sharded, workers, lookups):
+    jc = JsonCache('bulk').relocate(folder)
+    if sharded:
+        jc.set_sharding()
+    values = {f'result_{i}': {'id': i, 'loss': i / n, 'tags': ['a', 'b']} for i in range(n)}
+    write, _ = timed(lambda: jc.set_many(values))
+    scan, keys = timed(jc.keys)
+    assert len(keys) == n, len(keys)
+    one_by_one, _ = timed(lambda: [jc[k] for k in keys])
+    bulk, got = timed(lambda: jc.get_many(keys))
+    threaded, _ = timed(lambda: jc.get_many(workers=workers))
+    assert got['result_1']['id'] == 1
+    sample = random.Random(0).sample(keys, min(lookups, n))
+    lookup, _ = timed(lambda: [jc[k] for k in sample])
+    print(f'{n:>8} {"sharded" if sharded else "flat":>8} {write:>9.2f} {scan:>9.3f} {one_by_one:>9.2f} '
+          f'{bulk:>9.2f} {threaded:>9.2f} {lookup / len(sample) * 1e6:>11.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='*', default=[10000, 100000, 1000000])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--lookups', type=int, default=2000)
+    parser.add_argument('--folder', default=None, help='where to create the caches, default a temporary folder')
+    args = parser.parse_args()
+
+    print(f'{"keys":>8} {"layout":>8} {"set_many":>9} {"keys()":>9} {"getitem":>9} '
+          f'{"get_many":>9} {f"x{args.workers}":>9} {"lookup us":>11}')
+    for n in args.sizes:
+        for sharded in (False, True):
+            with tempfile.TemporaryDirectory(dir=args.folder) as folder:
+                bench(folder, n, sharded, args.workers, args.lookups)
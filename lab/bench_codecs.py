@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File  : bench_codecs.py
+@Desc  : encode and decode throughput and size on the disk of every json backend
+    and compression a JsonCache can use, on a cached result like tree
+
+    python -m lab.bench_codecs --mb 20 --level 1
+"""
+
+from comtools.json_caching.codec import JsonCodec, backends
+from comtools.json_caching import save_json, load_json
+import argparse
+import tempfile
+import random
+import time
+import os
+
+
+def make_results(mb, seed=0):
+    rnd = random.Random(seed)
+    results, size, i = {}, 0, 0
+    while size < mb << 20:
+        results[f'run_{i}'] = {
+            'config': {'lr': 10 ** -rnd.randint(2, 5), 'batch': 32, 'optimizer': 'adam', 'tags': ['baseline', 'v2']},
+            'loss': [round(rnd.uniform(0, 2), 4) for _ in range(200)],
+            'epochs': [{'epoch': e, 'status': 'done', 'accuracy': round(rnd.random(), 3)} for e in range(20)],
+        }
+        size += 3000
+        i += 1
+    return results
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t)
+    return best, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mb', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--level', type=int, default=None, help='compression level, default 6')
+    args = parser.parse_args()
+
+    tree = make_results(args.mb)
+    with tempfile.TemporaryDirectory() as folder:
+        file = os.path.join(folder, 'results.txt')
+        save_json(tree, file)
+        raw = os.path.getsize(file)
+        print(f'{raw / 2 ** 20:.1f} MB of json text')
+        print(f'{"codec":>14} {"save MB/s":>10} {"load MB/s":>10} {"size MB":>9} {"ratio":>7}')
+        rows = [('save_json', lambda: save_json(tree, file), lambda: load_json(file))]
+        for backend in backends:
+            for compression in JsonCodec.compressions:
+                codec = JsonCodec(backend, compression, args.level)
+                rows.append((codec.name, lambda c=codec: c.save(tree, file), lambda c=codec: c.load(file)))
+        for name, save, load in rows:
+            save_time, _ = best_of(save, args.repeat)
+            size = os.path.getsize(file)
+            load_time, loaded = best_of(load, args.repeat)
+            assert loaded == tree, name
+            print(f'{name:>14} {raw / 2 ** 20 / save_time:>10.1f} {raw / 2 ** 20 / load_time:>10.1f} '
+                  f'{size / 2 ** 20:>9.2f} {raw / size:>7.1f}')
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File  : bench_dispatch.py
+@Desc  : compare the old set(chain(...)) dispatch of UI.input with the cached one
+"""
+
+from jsonui import UI, Handler
+from itertools import chain
+import argparse
+import time
+
+
+class LegacyUI(UI):
+
+    def input(self, key, ref):
+        for h in set(chain(
+                self._key_map[key] if key in self._key_map else [],
+                self._value_type_map[type(ref)] if type(ref) in self._value_type_map else [],
+                self._key_map[UI.ANY] if UI.ANY in self._key_map else [],
+                self._value_type_map[UI.ANY] if UI.ANY in self._value_type_map else [])):
+            if h.can_handle(key, ref, self):
+                self.stack.append(self.Handling(key, ref, h))
+                ref = h.input(key, ref, self)
+                self.stack.pop(-1)
+                break
+        return ref
+
+
+class WalkDict(Handler):
+
+    def register_keys(self, context: UI) -> list:
+        return []
+
+    def register_value_types(self, context: UI) -> list:
+        return dict
+
+    def can_handle(self, key, ref, context: UI) -> bool:
+        return True
+
+    def input(self, key, ref, context: UI):
+        for k, v in ref.items():
+            ref[k] = context.input(k, v)
+        return ref
+
+
+class Scalar(Handler):
+
+    def register_keys(self, context: UI) -> list:
+        return []
+
+    def register_value_types(self, context: UI) -> list:
+        return [int, float]
+
+    def can_handle(self, key, ref, context: UI) -> bool:
+        return True
+
+
+class Hidden(Handler):
+
+    def register_keys(self, context: UI) -> list:
+        return ['type', 'count']
+
+    def register_value_types(self, context: UI) -> list:
+        return []
+
+    def can_handle(self, key, ref, context: UI) -> bool:
+        return True
+
+
+class Text(Handler):
+
+    def can_handle(self, key, ref, context: UI) -> bool:
+        return isinstance(ref, str)
+
+
+def make_tree(nodes, width=50):
+    tree = {}
+    leaves = 0
+    while leaves < nodes:
+        group = {}
+        for i in range(width):
+            group[f'v{i}'] = [i, float(i), str(i)][i % 3]
+        group['type'] = 'group'
+        tree[f'g{len(tree)}'] = group
+        leaves += width + 1
+    return tree
+
+
+def bench(ui, tree, frames):
+    best = float('inf')
+    for _ in range(frames):
+        t = time.perf_counter()
+        ui.input('state', tree)
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=50000)
+    parser.add_argument('--frames', type=int, default=20)
+    args = parser.parse_args()
+
+    handlers = [Hidden, WalkDict, Scalar, Text]
+    tree = make_tree(args.nodes)
+    legacy = bench(LegacyUI(handlers), tree, args.frames)
+    ui = UI(handlers)
+    cached = bench(ui, tree, args.frames)
+    print(f'nodes: {args.nodes}')
+    print(f'legacy dispatch: {legacy * 1000:.2f} ms/frame')
+    print(f'cached dispatch: {cached * 1000:.2f} ms/frame ({legacy / cached:.2f}x)')
+    print(f'cache: {ui.dispatch_stats()}')
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File  : bench_lazy.py
+@Desc  : time and memory until the first level of a big state file can be shown,
+    json.load against load_lazy_json, and the cost of saving after one edit
+
+    python -m lab.bench_lazy --mb 50
+"""
+
+from comtools.json_caching import save_json
+from comtools.json_caching.lazy import load_lazy_json, save_lazy_json
+import argparse
+import tempfile
+import random
+import time
+import json
+import gc
+import os
+
+
+def make_state(mb, seed=0):
+    rnd = random.Random(seed)
+    state, size, i = {}, 0, 0
+    while size < mb << 20:
+        node = {
+            'name': f'node {i}',
+            'pos': [rnd.random() for _ in range(3)],
+            'samples': [rnd.uniform(-1, 1) for _ in range(200)],
+            'props': {f'p{j}': rnd.randint(0, 1000) for j in range(20)},
+        }
+        state.setdefault(f'group_{i % 8}', {})[f'node_{i}'] = node
+        size += 5000
+        i += 1
+    return state
+
+
+def rss_mb():
+    # current resident size, linux only. mapped file pages count too
+    with open('/proc/self/statm') as fp:
+        return int(fp.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+def first_view(root):
+    # what the top level of the ui touches, the keys of each group
+    return sum(len(root[k]) for k in root)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mb', type=int, default=20)
+    parser.add_argument('--eager', action='store_true', help='measure json.load instead')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        file = os.path.join(folder, 'state.json')
+        save_json(make_state(args.mb), file)
+        gc.collect()
+        base = rss_mb()
+        print(f'file {os.path.getsize(file) / 2 ** 20:.1f} MB')
+
+        t = time.perf_counter()
+        if args.eager:
+            with open(file) as fp:
+                root = json.load(fp)
+        else:
+            root = load_lazy_json(file)
+        shown = first_view(root)
+        ready = time.perf_counter() - t
+        print(f'{"json.load" if args.eager else "lazy"}: first view of {shown} nodes in {ready * 1000:.0f} ms, '
+              f'rss +{rss_mb() - base:.0f} MB')
+
+        group = next(iter(root))
+        node = next(iter(root[group]))
+        root[group][node]['name'] = 'edited'
+        t = time.perf_counter()
+        if args.eager:
+            save_json(root, file)
+        else:
+            save_lazy_json(root, file)
+        print(f'save after one edit {(time.perf_counter() - t) * 1000:.0f} ms')
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File  : bench_plan.py
+@Desc  : frame time of UI.input with the plan cache against the recursive dispatch,
+    on a tree of typed values like the state files, with a few shapes changing per frame
+
+    python -m lab.bench_plan
+    python -m lab.bench_plan --nodes 20000 50000 --changes 1000
+"""
+
+from jsonui import UI, Handler
+import argparse
+import random
+import time
+
+
+# headless copies of the handlers of lab/state_ui.py, tried in the same order. all
+# but Vec are candidates for every node like there, Vec looks at the items, so it
+# is only registered for lists to keep the decisions for the others cacheable
+
+
+class Hidden(Handler):
+
+    priority = 3
+    shape_keys = ()
+
+    def can_handle(self, key, ref, context: UI) -> bool:
+        return key in ['type', 'count', 'descType'] or key.startswith('_')
+
+
+class Vec(Handler):
+
+    priority = 2
+
+    def register_keys(self, context: UI) -> list:
+        return []
+
+    def register_value_types(self, context: UI) -> list:
+        return [list]
+
+    def can_handle(self, key, value, context: UI) -> bool:
+        if isinstance(value, list) and len(value) == 4:
+            c = True
+            for k in value:
+                c = c and isinstance(k, float)
+            return c
+
+
+class Scalar(Handler):
+
+    priority = 2
+    shape_keys = ()
+
+    def can_handle(self, key, value, context: UI) -> bool:
+        return isinstance(value, (int, float))
+
+
+class Nodes(Handler):
+
+    priority = 1
+    shape_keys = ()
+
+    def can_handle(self, key, ref, context: UI) -> bool:
+        return isinstance(ref, dict) and key in ['nodes']
+
+    def input(self, key, ref, context: UI):
+        for k, v in ref.items():
+            ref[k] = context.input(k, v)
+        return ref
+
+
+class UnnamedDict(Nodes):
+
+    def can_handle(self, key, ref, context: UI) -> bool:
+        return isinstance(ref, dict) and \
+               (key in ['entries', 'state', 'data'] or context.stack[-2].key == 'nodes')
+
+
+class SingleValue(Handler):
+
+    priority = 1
+    shape_keys = ('type', 'value', 'count')
+
+    def can_handle(self, key, ref, context: UI) -> bool:
+        return isinstance(ref, dict) and 'type' in ref and 'value' in ref and 'count' not in ref
+
+    def input(self, key, ref, context: UI):
+        ref['value'] = context.input(key, ref['value'])
+        return ref
+
+
+class MultiValue(Handler):
+
+    priority = 1
+    shape_keys = ('type', 'value', 'count')
+
+    def can_handle(self, key, ref, context: UI) -> bool:
+        return isinstance(ref, dict) and 'type' in ref and 'value' in ref and 'count' in ref
+
+    def input(self, key, ref, context: UI):
+        values = ref['value']
+        for i, v in enumerate(values):
+            values[i] = context.input(key, v, i)
+        return ref
+
+
+class Dict(Nodes):
+
+    priority = 0
+
+    def can_handle(self, key, ref, context: UI) -> bool:
+        return isinstance(ref, dict)
+
+
+def make_tree(nodes, width=20, seed=0):
+    rnd = random.Random(seed)
+    tree, count = {}, 0
+    while count < nodes:
+        group = {'descType': 'group'}
+        tree[f'node_{len(tree)}'] = {'type': 'node', 'state': group}
+        for i in range(width):
+            if i % 4 == 0:
+                group[f'p{i}'] = {'type': 'vec', 'count': 3, 'value': [rnd.random() for _ in range(3)]}
+                count += 5
+            else:
+                group[f'p{i}'] = {'type': 'float', 'value': rnd.random()}
+                count += 3
+        count += 4
+    return {'nodes': tree}
+
+
+def reshape(tree, changes, rnd):
+    """
+    swap changes typed values between their single and multi value shapes
+    """
+    groups = [n['state'] for n in tree['nodes'].values()]
+    for _ in range(changes):
+        group = rnd.choice(groups)
+        k = rnd.choice(list(group.keys())[1:])
+        v = group[k]
+        group[k] = {'type': 'float', 'value': 0.} if 'count' in v else {'type': 'vec', 'count': 1, 'value': [0.]}
+
+
+def bench(uis, nodes, frames, changes, seed=0):
+    """
+    frames of the uis in turns, each on its own copy of the tree, so load on the
+    machine hits them alike
+
+    :return: median seconds per frame of each ui
+    """
+    runs = [(ui, make_tree(nodes), random.Random(seed), []) for ui in uis]
+    for _ in range(frames):
+        for ui, tree, rnd, times in runs:
+            reshape(tree, changes, rnd)
+            t = time.perf_counter()
+            ui.input('state', tree)
+            times.append(time.perf_counter() - t)
+    return [sorted(times)[len(times) // 2] for *_, times in runs]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, nargs='+', default=[5000, 100000])
+    parser.add_argument('--frames', type=int, default=40)
+    parser.add_argument('--changes', type=int, default=10, help='values changing shape per frame')
+    args = parser.parse_args()
+
+    handlers = [Hidden, Vec, Scalar, Nodes, UnnamedDict, SingleValue, MultiValue, Dict]
+    for nodes in args.nodes:
+        ui = UI(handlers)
+        ui.set_plan_cache()
+        recursive, planned = bench([UI(handlers), ui], nodes, args.frames, args.changes)
+        print(f'nodes: {nodes}, shape changes per frame: {args.changes}')
+        print(f'recursive dispatch: {recursive * 1000:.2f} ms/frame')
+        print(f'plan cache:         {planned * 1000:.2f} ms/frame ({recursive / planned:.2f}x)')
+        print(f'plan: {ui.plan_stats()}')
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File  : bench_search.py
+@Desc  : build time, query latency and incremental update time of the SearchIndex,
+    against walking the tree for every query
+
+    python -m lab.bench_search --depth 4 --width 32
+"""
+
+from jsonui.search import SearchIndex, _value_text
+from jsonui.journal import Journal, escape
+from jsonui.bench import synthetic_tree, count_nodes
+import statistics
+import argparse
+import time
+
+
+def walk_search(key, value, query, path, out):
+    if query in str(key).lower() or query in _value_text(value).lower():
+        out.append(path)
+    if isinstance(value, dict):
+        for k, v in value.items():
+            walk_search(k, v, query, f'{path}/{escape(k)}', out)
+    elif isinstance(value, list):
+        for i, v in enumerate(value):
+            walk_search(i, v, query, f'{path}/{i}', out)
+    return out
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - t) * 1000)
+    return statistics.median(times), result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--width', type=int, default=32)
+    parser.add_argument('--limit', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--queries', nargs='*', default=['v123', '999.', '3_17', 'v1', 'zzz', '/0_1/1_2', '/0_1/1_2/2_'])
+    args = parser.parse_args()
+
+    tree = synthetic_tree(args.depth, args.width)
+    index = SearchIndex('state').build(tree)
+    print(f'{count_nodes(tree)} nodes, build {index.build_time:.2f} s, {index.stats()}')
+    print(f'{"query":>14} {"hits":>6} {"search ms":>10} {"filter ms":>10} {"walk ms":>10}')
+    for q in args.queries:
+        search_ms, (hits, truncated) = timed(lambda: index.search(q, args.limit), args.repeat)
+        filter_ms, _ = timed(lambda: index.filter(q, args.limit), args.repeat)
+        walk = '' if q.startswith('/') else f'{timed(lambda: walk_search("state", tree, q, "/state", []), 1)[0]:.1f}'
+        print(f'{q:>14} {len(hits):>5}{"+" if truncated else " "} {search_ms:>10.2f} {filter_ms:>10.2f} {walk:>10}')
+
+    journal = Journal()
+    index.seq = journal.seq
+    keys = list(tree)
+    times = []
+    for i in range(100):
+        node = tree[keys[i % len(keys)]]
+        k = next(iter(node))
+        node[k] = {'edited': i}
+        journal.record(f'/state/{escape(keys[i % len(keys)])}/{escape(k)}', None, node[k])
+        t = time.perf_counter()
+        index.update(journal, tree)
+        times.append((time.perf_counter() - t) * 1000)
+    print(f'update p50 {statistics.median(times):.3f} ms, max {max(times):.3f} ms, {index.stats()}')
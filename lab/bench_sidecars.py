@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File  : bench_sidecars.py
+@Desc  : JsonCache read and write of a big float array, as json text and as a .npy sidecar
+
+    python -m lab.bench_sidecars --length 10000000
+"""
+
+from comtools.json_caching import JsonCache
+import numpy as np
+import argparse
+import tempfile
+import time
+
+
+def timed(func):
+    t = time.perf_counter()
+    func()
+    return (time.perf_counter() - t) * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--length', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    array = np.random.default_rng(0).random(args.length)
+    with tempfile.TemporaryDirectory() as folder:
+        print(f'{"storage":>8} {"write ms":>10} {"read ms":>10} {"sum ms":>10}')
+        for sidecars in (False, True):
+            jc = JsonCache('bench').relocate(folder).set_array_sidecars(enabled=sidecars)
+            write = timed(lambda: jc.__setitem__('value', {'samples': array}))
+            found = {}
+            read = timed(lambda: found.update(jc['value']))
+            # a memory map pays for its pages when they are touched
+            total = timed(lambda: np.sum(found['samples']))
+            print(f'{"npy" if sidecars else "json":>8} {write:>10.1f} {read:>10.1f} {total:>10.1f}')
+
+        # the array itself as the value, read back as a read only memory map
+        jc = JsonCache('bench').relocate(folder).set_memory_cache().set_array_sidecars()
+        write = timed(lambda: setattr(jc, 'samples', array))
+        found = {}
+        read = timed(lambda: found.update(samples=jc.samples))
+        total = timed(lambda: np.sum(found['samples']))
+        print(f'{"npy top":>8} {write:>10.1f} {read:>10.1f} {total:>10.1f}')
+        samples = found['samples']
+        assert isinstance(samples, np.memmap) and not samples.flags.writeable
+        assert np.array_equal(samples, array)
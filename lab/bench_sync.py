@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File  : bench_sync.py
+@Desc  : latency and bytes of one small edit reaching another viewer, through a
+    SyncServer against writing and re-reading the whole state file
+
+    python -m lab.bench_sync --depth 3 --width 20 --updates 200
+"""
+
+from jsonui.sync import SyncServer, SyncClient
+from jsonui.bench import synthetic_tree
+from comtools.json_caching import save_json, load_json
+import statistics
+import argparse
+import tempfile
+import asyncio
+import time
+import os
+
+
+def leaf_paths(tree, prefix=''):
+    for k, v in tree.items():
+        if isinstance(v, dict):
+            yield from leaf_paths(v, f'{prefix}/{k}')
+        else:
+            yield f'{prefix}/{k}'
+
+
+async def delta_sync(tree, updates, viewers, folder):
+    server = SyncServer(tree)
+    sock = os.path.join(folder, 'sync.sock')
+    await server.start_unix(sock)
+    received = asyncio.Event()
+    counts = [0]
+
+    def on_patch(version, patch):
+        counts[0] += 1
+        if counts[0] == viewers:
+            received.set()
+
+    writer = await SyncClient().connect_unix(sock)
+    readers = [await SyncClient(on_patch).connect_unix(sock) for _ in range(viewers)]
+    for r in readers:
+        await r.subscribe('')
+    paths = list(leaf_paths(tree))
+    base_in, base_out = server.bytes_in, server.bytes_out
+
+    latencies = []
+    for i in range(updates):
+        received.clear()
+        counts[0] = 0
+        t = time.perf_counter()
+        reply = await writer.patch([{'op': 'replace', 'path': paths[i % len(paths)], 'value': i}])
+        assert reply['ok'], reply
+        await received.wait()
+        latencies.append((time.perf_counter() - t) * 1000)
+    moved = server.bytes_in - base_in + server.bytes_out - base_out
+
+    for c in [writer] + readers:
+        await c.close()
+    await server.close()
+    return latencies, moved / updates
+
+
+def file_sync(tree, updates, viewers, folder):
+    file = os.path.join(folder, 'state.json')
+    paths = list(leaf_paths(tree))
+    latencies, moved = [], 0
+    for i in range(updates):
+        node = tree
+        *parents, last = paths[i % len(paths)][1:].split('/')
+        for p in parents:
+            node = node[p]
+        node[last] = i
+        t = time.perf_counter()
+        save_json(tree, file)
+        for _ in range(viewers):
+            load_json(file)
+        latencies.append((time.perf_counter() - t) * 1000)
+        moved += os.path.getsize(file) * (1 + viewers)
+    return latencies, moved / updates
+
+
+def describe(name, latencies, moved):
+    latencies.sort()
+    print(f'{name:>6} {statistics.median(latencies):>10.3f} {latencies[int(len(latencies) * .95)]:>10.3f} '
+          f'{moved:>14.0f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--width', type=int, default=20)
+    parser.add_argument('--updates', type=int, default=200)
+    parser.add_argument('--viewers', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        print(f'{"sync":>6} {"p50 ms":>10} {"p95 ms":>10} {"bytes/update":>14}')
+        tree = synthetic_tree(args.depth, args.width)
+        describe('delta', *asyncio.run(delta_sync(tree, args.updates, args.viewers, folder)))
+        tree = synthetic_tree(args.depth, args.width)
+        describe('file', *file_sync(tree, args.updates, args.viewers, folder))
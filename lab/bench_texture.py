@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File  : bench_texture.py
+@Desc  : decode cost of Texture images, per pixel getdata() against decode_image
+"""
+
+from comtools.imgui_engine.gui_tools import decode_image
+from PIL import Image
+import numpy as np
+import argparse
+import tempfile
+import time
+import os
+
+
+def legacy_decode(filename, size):
+    img = Image.open(filename).resize(size)
+    return np.array(list(img.getdata()), dtype=np.uint8)
+
+
+def timed(func, *args):
+    t = time.perf_counter()
+    func(*args)
+    return (time.perf_counter() - t) * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[256, 1024, 2048, 4096])
+    parser.add_argument('--modes', type=str, nargs='+', default=['RGB', 'RGBA', 'L', 'P'])
+    parser.add_argument('--legacy-max', type=int, default=2048, help='skip the slow path above this size')
+    args = parser.parse_args()
+
+    rnd = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as folder:
+        print(f'{"size":>6} {"mode":>5} {"legacy ms":>10} {"decode ms":>10} {"resize ms":>10}')
+        for size in args.sizes:
+            for mode in args.modes:
+                pixels = rnd.integers(0, 256, (size, size, 3), dtype=np.uint8)
+                img = Image.fromarray(pixels, 'RGB')
+                img = img.quantize() if mode == 'P' else img.convert(mode)
+                filename = os.path.join(folder, f'{size}_{mode}.png')
+                img.save(filename)
+
+                legacy = timed(legacy_decode, filename, (size, size)) if size <= args.legacy_max else float('nan')
+                fast = timed(decode_image, filename, (size, size))
+                resized = timed(decode_image, filename, (size // 2, size // 2))
+                print(f'{size:>6} {mode:>5} {legacy:>10.1f} {fast:>10.1f} {resized:>10.1f}')
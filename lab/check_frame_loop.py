@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File  : check_frame_loop.py
+@Desc  : FrameLoop against a fake glfw that records the calls, no window or display
+    needed. checks that the loop idles once nothing changes, that request_redraw and
+    finished background work wake it, that running jobs shorten the idle waits and
+    that nothing is posted to glfw before the first frame or after close().
+    exits with an error when a check fails.
+
+    python -m lab.check_frame_loop
+"""
+
+from comtools.imgui_engine import glfw_init
+from comtools.imgui_engine.glfw_init import FrameLoop, keep_awake, wake_loops
+from comtools.imgui_engine.decorates import WorkerPool
+from comtools.imgui_engine.gui_tools import TextureLoader
+from jsonui.bench import headless_context, headless_frame
+from concurrent.futures import Future
+import sys
+
+
+class FakeGlfw:
+
+    def __init__(self):
+        self.calls = []
+
+    def poll_events(self):
+        self.calls.append(('poll_events',))
+
+    def wait_events_timeout(self, timeout):
+        self.calls.append(('wait_events_timeout', timeout))
+
+    def post_empty_event(self):
+        self.calls.append(('post_empty_event',))
+
+    def get_cursor_pos(self, window):
+        return 0., 0.
+
+    def get_window_size(self, window):
+        return 1280, 720
+
+    def take(self):
+        calls, self.calls = self.calls, []
+        return calls
+
+
+class Busy:
+
+    def __init__(self):
+        self.on = False
+
+    def busy(self):
+        return self.on
+
+
+failures = []
+
+
+def check(name, ok):
+    print(f'{"ok  " if ok else "FAIL"} {name}')
+    if not ok:
+        failures.append(name)
+
+
+def frame(loop):
+    loop.wait()
+    with headless_frame():
+        loop.observe(None)
+
+
+def settle(loop, fake):
+    for _ in range(loop.settle_frames + 1):
+        frame(loop)
+    fake.take()
+
+
+def main():
+    fake = glfw_init.glfw = FakeGlfw()
+    headless_context()
+    loop = FrameLoop(max_fps=0, idle_timeout=1.0, busy_timeout=0.1)
+
+    loop.request_redraw()
+    check('no empty event before the first frame', fake.take() == [])
+
+    settle(loop, fake)
+    frame(loop)
+    check('idles after settle_frames quiet frames', fake.take() == [('wait_events_timeout', 1.0)])
+
+    loop.request_redraw()
+    calls = fake.take()
+    frame(loop)
+    check('request_redraw posts an empty event', calls == [('post_empty_event',)])
+    check('the frame after request_redraw polls', fake.take() == [('poll_events',)])
+
+    settle(loop, fake)
+    busy = Busy()
+    keep_awake(busy.busy)
+    busy.on = True
+    frame(loop)
+    check('keep_awake work shortens idle waits', fake.take() == [('wait_events_timeout', 0.1)])
+    busy.on = False
+    frame(loop)
+    check('idle_timeout again once the work is done', fake.take() == [('wait_events_timeout', 1.0)])
+    del busy
+    frame(loop)
+    check('dropped keep_awake owners are forgotten', not glfw_init._busy)
+
+    pool = WorkerPool(workers=1, processes=False)
+    job = pool.submit(sum, ([1, 2],))
+    job.future.result()
+    pool.shutdown(wait=True)
+    check('a finished job wakes the loop', ('post_empty_event',) in fake.take() and loop._redraw)
+    frame(loop)
+    fake.take()
+
+    settle(loop, fake)
+    loader = TextureLoader(workers=1)
+    future = Future()
+    future.set_result(None)
+    loader._decoding += 1
+    loader._decoded(None, 'image.png', future)
+    loader.shutdown()
+    check('a decoded texture wakes the loop', fake.take() == [('post_empty_event',)] and loop._redraw)
+
+    loop.close()
+    loop.request_redraw()
+    wake_loops()
+    check('nothing is posted after close', fake.take() == [])
+
+    if failures:
+        print(f'{len(failures)} checks failed')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File  : import_time.py
+@Desc  : cold start budget of the headless entry points, measured with -X importtime
+    in fresh interpreters. exits with an error when a module is over its budget or
+    pulls in one of the heavy modules that should only load on first use.
+
+    python -m lab.import_time
+    python -m lab.import_time --budget jsonui=80 --runs 9
+"""
+
+import subprocess
+import argparse
+import sys
+import os
+
+BUDGETS_MS = {
+    'comtools.json_caching': 60,
+    'jsonui': 120,
+}
+
+HEAVY = ('OpenGL', 'glfw', 'PIL', 'numpy')
+
+
+def import_time(module):
+    """
+    :return: (cumulative import time of module in ms, top level packages imported)
+    """
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                         capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stderr
+    total, imported = None, set()
+    for line in out.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        name = name.strip()
+        imported.add(name.split('.')[0])
+        if name == module:
+            total = int(cumulative) / 1000
+    return total, imported
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5, help='the fastest run counts')
+    parser.add_argument('--budget', nargs='*', default=[], help='module=ms, overrides the default budgets')
+    args = parser.parse_args()
+
+    budgets = dict(BUDGETS_MS)
+    for item in args.budget:
+        module, ms = item.split('=')
+        budgets[module] = float(ms)
+
+    failures = []
+    print(f'{"module":>24} {"best ms":>9} {"budget":>8}  heavy modules')
+    for module, budget in budgets.items():
+        best, heavy = float('inf'), set()
+        for _ in range(args.runs):
+            ms, imported = import_time(module)
+            best = min(best, ms)
+            heavy |= imported.intersection(HEAVY)
+        print(f'{module:>24} {best:>9.1f} {budget:>8.0f}  {", ".join(sorted(heavy)) or "-"}')
+        if best > budget:
+            failures.append(f'{module} takes {best:.1f} ms to import, budget {budget:.0f} ms')
+        if heavy:
+            failures.append(f'{module} imports {", ".join(sorted(heavy))}')
+    if failures:
+        raise SystemExit('\n'.join(failures))
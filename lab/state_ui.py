@@ -13,6 +13,8 @@ import argparse
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--state', type=str, help='Target state file path')
+parser.add_argument('--lazy', action='store_true', help='parse parts of the state only when they are shown')
+parser.add_argument('--no-watch', action='store_true', help='do not merge changes other processes make to the file')
 args = parser.parse_args()
 
 
@@ -22,6 +24,13 @@ class Window:
         self.size = [w, h]
         self.refresh = None
         self.glfw_window = None
+        self.loop = FrameLoop()
+
+    def request_redraw(self):
+        """
+        thread safe, wakes the window from idle
+        """
+        self.loop.request_redraw()
 
     def current_size(self):
         import glfw
@@ -32,10 +41,12 @@ class Window:
         impl, self.glfw_window = glfw_imgui_init(*self.size)
 
         while not glfw.window_should_close(self.glfw_window):
-            with glfw_frame(impl, self.glfw_window):
+            with glfw_frame(impl, self.glfw_window, loop=self.loop):
                 if self.refresh:
                     self.refresh()
+        self.loop.close()
         glfw_imgui_shutdown(impl)
+        self.glfw_window = None
 
 
 class Node:
@@ -80,18 +91,8 @@ class Handler:
     def input(self, key, ref, context: UI):
         pass
 
-    @contextmanager
     def label_wrap(self, label, label_width_percent=0.4):
-        imgui.push_id(label)
-        imgui.columns(2, None, False)
-        w = imgui.get_window_content_region_width() * label_width_percent - imgui.get_cursor_pos()[0]
-        imgui.set_column_width(0, w)
-        imgui.text(label)
-        imgui.same_line()
-        imgui.next_column()
-        yield None
-        imgui.pop_id()
-        imgui.columns(1, None, False)
+        return label_wrap(label, label_width_percent)
 
 
 class VecHandler(Handler):
@@ -110,7 +111,7 @@ class VecHandler(Handler):
             else:
                 c, v = imgui.input_float4('vec4', *ref, '%.3f')
             context.mark_dirty(c)
-            return list(v)
+            return list(v) if c else ref
 
 
 class ScalarHandler(Handler):
@@ -126,7 +127,7 @@ class ScalarHandler(Handler):
             with self.label_wrap(key):
                 c, v = imgui.input_float('float', ref, 0, 0, '%.6f')
         context.mark_dirty(c)
-        return v
+        return v if c else ref
 
 
 class HiddenHandler(Handler):
@@ -145,7 +146,7 @@ class DictHandler(Handler):
 
     def input(self, key, ref: dict, context: UI):
         if imgui.tree_node(key):
-            for k, v in ref.items():
+            for k, v in clipped_items(ref):
                 ref[k] = context.input(k, v)
             imgui.tree_pop()
         return ref
@@ -159,18 +160,23 @@ class NodesHandler(Handler):
     def input(self, key, ref: dict, context: UI):
         with id_scope(key):
             imgui.text(key)
-            for k, v in ref.items():
+            closed = set()
+            for k, v in clipped_items(ref):
                 with self.label_wrap('', 0.08):
                     if k in context.state and context.state[k][1]:
                         if imgui.button('close [' + k + ']'):
                             context.state[k][1] = False
-                        else:
-                            context.state[k] = list(imgui.begin(k, True))
-                            ref[k] = context.input(k, v)
-                            imgui.end()
+                            closed.add(k)
                     else:
                         if imgui.button(f'[{k}]'):
                             context.state[k] = [True, True]
+                            closed.add(k)
+            # opened node windows are drawn even when their row is clipped
+            for k, opened in list(context.state.items()):
+                if opened[1] and k in ref and k not in closed:
+                    context.state[k] = list(imgui.begin(k, True))
+                    ref[k] = context.input(k, ref[k])
+                    imgui.end()
         return ref
 
 
@@ -182,7 +188,7 @@ class UnnamedDictHandler(Handler):
 
     def input(self, key, ref: dict, context: UI):
         with id_scope(key):
-            for k, v in ref.items():
+            for k, v in clipped_items(ref):
                 ref[k] = context.input(k, v)
         return ref
 
@@ -203,25 +209,38 @@ class MultiValueHandler(Handler):
         return isinstance(ref, dict) and 'type' in ref and 'value' in ref and 'count' in ref
 
     def input(self, key, ref, context: UI):
-        tmp_item = None
-        import copy
-        if 'template' in ref:
-            tmp_item = copy.deepcopy(ref['template'])
         with self.label_wrap(key):
-            ref['count'] = imgui.input_int('len', ref['count'])[1]
-            origin_value = ref['value']
-            if not isinstance(origin_value, list):
-                origin_value = [origin_value]
-            ref['value'] = [tmp_item] * ref['count']
-        for i in range(ref['count']):
-            with id_scope(f'{i}'):
-                if i < len(origin_value):
-                    ref['value'][i] = context.input(key, origin_value[i])
+            c, count = imgui.input_int('len', ref['count'])
+            count = ref['count'] = max(0, count)
+        context.mark_dirty(c)
+        values = ref['value']
+        if not isinstance(values, list):
+            values = ref['value'] = [values]
+        # resized in place, the template is only copied for new items
+        if len(values) > count:
+            del values[count:]
+        elif len(values) < count:
+            import copy
+            template = ref.get('template')
+            values.extend(copy.deepcopy(template) for _ in range(count - len(values)))
+        for i in ListClipper(count, key=id(ref)):
+            with id_scope(i):
+                values[i] = context.input(key, values[i])
         return ref
 
 
 if __name__ == '__main__':
-    state = load_json(args.state)
+    if args.lazy:
+        from comtools.json_caching.lazy import load_lazy_json, lazy_snapshot, save_lazy_json
+        state = load_lazy_json(args.state)
+        saver = StateSaver(args.state, snapshot=lazy_snapshot, writer=save_lazy_json)
+        watcher = None
+    else:
+        from comtools.json_caching.watch import StateWatcher
+        state = load_json(args.state)
+        # other processes writing the file get merged in, edits made here win conflicts
+        watcher = StateWatcher(args.state, state) if not args.no_watch else None
+        saver = StateSaver(args.state, writer=watcher.own_writer(save_json) if watcher else save_json)
     ui = UI([
         # HiddenHandler,
         NodesHandler,
@@ -239,10 +258,27 @@ if __name__ == '__main__':
         # imgui.set_next_window_position(0, 0)
         # imgui.set_next_window_size(*window.current_size())
         imgui.begin('State', False)
+        if watcher is not None:
+            state = watcher.merge(state)
         state = ui.input('state', state)
-        if imgui.button('apply') or ui.dirty:
-            save_json(state, args.state)
-            ui.dirty = False
+        if imgui.button('apply'):
+            saver.save_now(state)
+        elif ui.dirty:
+            saver.changed(state)
+        ui.dirty = False
+        saver.poll()
+        if saver.waiting:
+            # keep frames coming until the debounced save is queued
+            window.request_redraw()
+        imgui.same_line()
+        stats = saver.stats()
+        imgui.text(f'saves {stats["saves"]}  queued {stats["queue_depth"]}  '
+                   f'latency {stats["last_latency"] * 1000:.0f} ms')
+        if watcher is not None:
+            stats = watcher.stats()
+            imgui.text(f'reloads {stats["reloads"]} ({stats["mode"]})  conflicts {stats["conflicts"]}  '
+                       f'parse {stats["last_parse"] * 1000:.1f} ms  merge latency {stats["last_latency"] * 1000:.1f} ms  '
+                       f'avoided {stats["avoided"]:.1f} s')
 
         # imgui.button('a')
         # io = imgui.get_io()
@@ -254,5 +290,18 @@ if __name__ == '__main__':
     window = Window(800, 600)
     window.refresh = refresh
 
-    window.show()
+    def changed():
+        # the watcher thread runs before show() opens the window and after it closed
+        if window.glfw_window is not None:
+            window.request_redraw()
+
+    if watcher is not None:
+        watcher.on_change = changed
+
+    try:
+        window.show()
+    finally:
+        saver.close()
+        if watcher is not None:
+            watcher.close()
 
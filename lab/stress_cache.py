@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File  : stress_cache.py
+@Desc  : worker processes hammering the same JsonCache keys, counting lost
+    increments and torn reads, with and without set_process_safe
+
+    python -m lab.stress_cache --workers 8 --rounds 300
+    python -m lab.stress_cache --unsafe
+"""
+
+from comtools.json_caching import JsonCache
+from multiprocessing import Pool
+import argparse
+import tempfile
+import time
+
+
+def open_cache(folder, safe, sidecars):
+    jc = JsonCache('stress').relocate(folder)
+    if sidecars:
+        jc.set_array_sidecars(min_list_length=256)
+    if safe:
+        jc.set_process_safe(timeout=30)
+    return jc
+
+
+def work(folder, safe, sidecars, rounds, size, seed):
+    jc = open_cache(folder, safe, sidecars)
+    missing = torn = 0
+    for i in range(rounds):
+        with jc.lock('counter'):
+            jc.counter = (jc.counter or 0) + 1
+        if i % 4 == seed % 4:
+            gen = seed * rounds + i
+            jc.blob = {'gen': gen, 'data': [float(gen)] * size}
+        else:
+            blob = jc.blob
+            if blob is None:
+                missing += 1
+            elif any(v != blob['gen'] for v in blob['data']):
+                torn += 1
+    return missing, torn, jc.lock_stats()
+
+
+def run(folder, workers, rounds, size, safe, sidecars):
+    jc = open_cache(folder, safe, sidecars)
+    jc.counter = 0
+    jc.blob = {'gen': 0, 'data': [0.] * size}
+    t = time.perf_counter()
+    with Pool(workers) as pool:
+        results = pool.starmap(work, [(folder, safe, sidecars, rounds, size, w) for w in range(workers)])
+    elapsed = time.perf_counter() - t
+    lost = workers * rounds - (jc.counter or 0)
+    missing = sum(r[0] for r in results)
+    torn = sum(r[1] for r in results)
+    print(f'{"safe" if safe else "unsafe"}{" sidecars" if sidecars else ""}: {elapsed:.2f} s, '
+          f'{lost} lost increments, {missing} missing reads, {torn} torn reads')
+    if safe:
+        stats = [r[2] for r in results]
+        acquired = sum(s['acquired'] for s in stats)
+        contended = sum(s['contended'] for s in stats)
+        print(f'    {acquired} locks, {contended} contended ({contended / max(1, acquired):.1%}), '
+              f'{sum(s["reentered"] for s in stats)} reentered, {sum(s["timeouts"] for s in stats)} timeouts, '
+              f'wait {sum(s["wait_time"] for s in stats):.2f} s total, max {max(s["max_wait"] for s in stats) * 1000:.1f} ms')
+    return lost + missing + torn
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=300)
+    parser.add_argument('--size', type=int, default=2000)
+    parser.add_argument('--unsafe', action='store_true', help='also run without locks')
+    args = parser.parse_args()
+
+    failures = 0
+    for sidecars in (False, True):
+        for safe in ((True, False) if args.unsafe else (True,)):
+            with tempfile.TemporaryDirectory() as folder:
+                failed = run(folder, args.workers, args.rounds, args.size, safe, sidecars)
+            if safe:
+                failures += failed
+    if failures:
+        raise SystemExit(f'{failures} failures with process safe caches')
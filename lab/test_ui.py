@@ -8,6 +8,11 @@
 """
 
 from jsonui import *
+from jsonui.handlers import ArrayHandler
+from jsonui.profiling import Profiler
+from jsonui.search import SearchBox
+from contextlib import nullcontext
+import sys
 
 """" test prefab """
 
@@ -22,6 +27,7 @@ state = {
             'Name': 'CYZ',
             'Age': 21,
             'Birth': [19., 98., 7., 7.],
+            'Samples': [float(i % 17) for i in range(5000)],
             'Hobby': {
                 'Entertain': ['Game', 'Paint']
             }
@@ -34,6 +40,8 @@ state = {
 @utils.as_default_handler
 class DictHandler(Handler):
 
+    shape_keys = ()
+
     def register_keys(self, context: UI) -> list:
         return []
 
@@ -45,8 +53,7 @@ class DictHandler(Handler):
 
     def input(self, key, ref, context: UI):
         if imgui.tree_node(key):
-            for k, v in ref.items():
-                ref[k] = context.input(k, v)
+            self.input_children(ref, context)
             imgui.tree_pop()
         return ref
 
@@ -54,6 +61,8 @@ class DictHandler(Handler):
 @utils.as_default_handler
 class Value(Handler):
 
+    shape_keys = ()
+
     def register_value_types(self, context: UI) -> list:
         return [int, float]
 
@@ -68,10 +77,13 @@ class Value(Handler):
             with utils.label_wrap(key):
                 c, v = imgui.input_float('float', ref, 0, 0, '%.6f')
         context.mark_dirty(c)
-        return v
+        return v if c else ref
 
 
+utils.as_default_handler(ArrayHandler)
 ui_context = UI(utils.default_handlers)
+profiler = None
+search = SearchBox(ui_context, 'state')
 
 
 class MyWindow(Window):
@@ -79,11 +91,19 @@ class MyWindow(Window):
     def refresh(self):
         global state
         imgui.begin('State', False)
-        state = ui_context.input('state', state)
+        search.draw(state)
+        with profiler.frame() if profiler else nullcontext():
+            state = ui_context.input('state', state)
         imgui.end()
+        if profiler:
+            profiler.draw()
 
 
 window = MyWindow(800, 600)
 
 if __name__ == '__main__':
+    if '--profile' in sys.argv:
+        profiler = ui_context.set_profiler(Profiler())
+    if '--plan' in sys.argv:
+        ui_context.set_plan_cache()
     window.show()
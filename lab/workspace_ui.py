@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File  : workspace_ui.py
+@Desc  : state files side by side in a jsonui.workspace window. --generate writes
+    synthetic ones to a temporary folder. --headless draws frames without a window
+    and reports the gaps between frames while the files are parsed in the background, then
+    cycles through the tabs to show unloading and re-parsing under --max-mb.
+
+    python -m lab.workspace_ui a.json b.json c.json --max-mb 200
+    python -m lab.workspace_ui --generate 12 --mb 20 --headless --max-mb 100
+    python -m lab.workspace_ui --generate 12 --mb 20 --headless --lazy
+"""
+
+from jsonui.workspace import Workspace, WorkspaceWindow
+from jsonui.bench import headless_context, headless_frame
+from jsonui.handlers import ArrayHandler
+from comtools.json_caching import save_json
+from lab.test_ui import DictHandler, Value
+import argparse
+import tempfile
+import random
+import time
+import os
+
+
+def generate(folder, count, mb, seed=0):
+    rnd = random.Random(seed)
+    files = []
+    for i in range(count):
+        nodes, size = {}, 0
+        while size < mb * 2 ** 20:
+            values = {f'p{j}': {'type': 'float', 'value': rnd.random()} for j in range(20)}
+            values['samples'] = [rnd.random() for _ in range(64)]
+            nodes[f'node_{len(nodes)}'] = values
+            # about the length of the json text of one node
+            size += 2300
+        file = os.path.join(folder, f'state_{i:02d}.json')
+        save_json({'nodes': nodes}, file)
+        files.append(file)
+    return files
+
+
+def run_headless(ws, frames_per_tab):
+    headless_context()
+    # from the start of one frame to the next at 60 fps, parsing threads holding
+    # the GIL show up here rather than in the time a frame takes
+    times = []
+    last = [time.perf_counter()]
+
+    def frame():
+        with headless_frame():
+            window.refresh()
+        time.sleep(1 / 60)
+        t = time.perf_counter()
+        times.append(t - last[0])
+        last[0] = t
+
+    t = time.perf_counter()
+    while not ws.stats().get('loaded') or ws.stats().get('loading'):
+        frame()
+    print(f'initial loads: {time.perf_counter() - t:.2f} s over {len(times)} frames, '
+          f'frame gap max {max(times) * 1000:.1f} ms, median {sorted(times)[len(times) // 2] * 1000:.1f} ms')
+
+    times.clear()
+    last[0] = time.perf_counter()
+    t = time.perf_counter()
+    for doc in list(ws.documents.values()):
+        ws.active = doc.file
+        while doc.state != 'loaded':
+            # drawing the selected tab queues its load
+            frame()
+        for _ in range(frames_per_tab):
+            frame()
+    print(f'visiting every tab: {time.perf_counter() - t:.2f} s, '
+          f'frame gap max {max(times) * 1000:.1f} ms, median {sorted(times)[len(times) // 2] * 1000:.1f} ms')
+    print(ws.stats())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('--generate', type=int, default=0, help='write this many synthetic state files')
+    parser.add_argument('--mb', type=float, default=10, help='size of a generated file')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--processes', action='store_true', help='parse in processes instead of threads')
+    parser.add_argument('--max-mb', type=float, default=None, help='unload documents above this many MB of files')
+    parser.add_argument('--lazy', action='store_true', help='parse parts of the files only when they are shown')
+    parser.add_argument('--plan', action='store_true', help='plan cache for every document')
+    parser.add_argument('--headless', action='store_true')
+    args = parser.parse_args()
+
+    folder = tempfile.TemporaryDirectory() if args.generate else None
+    files = list(args.files)
+    if folder is not None:
+        t = time.perf_counter()
+        files += generate(folder.name, args.generate, args.mb)
+        print(f'generated {args.generate} files in {time.perf_counter() - t:.1f} s')
+
+    io = {}
+    if args.lazy:
+        from comtools.json_caching.lazy import load_lazy_json, save_lazy_json
+        io = {'loader': load_lazy_json, 'saver': save_lazy_json}
+    ws = Workspace([DictHandler, Value, ArrayHandler], workers=args.workers, processes=args.processes,
+                   max_loaded_bytes=args.max_mb * 2 ** 20 if args.max_mb else None,
+                   setup=(lambda ui: ui.set_plan_cache()) if args.plan else None, **io)
+    window = WorkspaceWindow(ws, 1280, 800)
+    for file in files:
+        ws.open(file)
+    try:
+        if args.headless:
+            run_headless(ws, 10)
+        else:
+            window.show()
+    finally:
+        ws.shutdown()
+        if folder is not None:
+            folder.cleanup()